@@ -0,0 +1,257 @@
+"""Speed and accuracy benchmark of the registration functions on synthetic phantoms warped by known transforms.
+
+A phantom is a labeled head (skull, brain, ventricles and random lesions) rendered with T1-, T2- and FLAIR-like
+contrasts, built with SimpleITK and numpy only. Moving images are the phantom warped by a random rigid or affine
+transform, so the true transform is known, and for each size, transform type and parameter preset this reports:
+
+- ``register``: wall time, peak memory, target registration error (TRE, mm) at points inside the brain,
+  and Dice of the head mask of the registered image;
+- ``register_D``: same registration with a label image, Dice of the registered brain labels;
+- ``register_each``: T2 and FLAIR, each warped by its own transform, registered to T1, mean Dice of head masks.
+
+Each case runs in a fresh process so that peak memory is measured per case.
+Presets ``sitk`` and ``sitk-*`` use the SimpleITK backend, the rest require SimpleITK-SimpleElastix.
+``fast``, ``balanced`` and ``accurate`` are the named presets of the backends, ``--masks`` passes head masks.
+
+Run with ``python benchmarks/registration.py --sizes 128 256 --presets default moments``.
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from functools import partial
+from typing import Any, Literal
+
+import numpy as np
+import SimpleITK as sitk
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+
+def _default():
+    return dict(pmap=None)
+
+def _moments():
+    return dict(pmap=None, initializer="moments")
+
+def _rigid():
+    return dict(pmap=sitk.GetDefaultParameterMap("rigid"))
+
+def _affine_fast():
+    pmap = sitk.GetDefaultParameterMap("affine")
+    pmap["NumberOfResolutions"] = ["3"]
+    pmap["MaximumNumberOfIterations"] = ["64"]
+    return dict(pmap=pmap)
+
+def _sitk():
+    return dict(backend="sitk")
+
+PRESETS = {
+    "default": _default,
+    "moments": _moments,
+    "rigid": _rigid,
+    "affine-fast": _affine_fast,
+    "sitk": _sitk,
+    # named presets of both backends
+    **{name: partial(dict, preset=name) for name in ("fast", "balanced", "accurate")},
+    **{f"sitk-{name}": partial(dict, backend="sitk", preset=name) for name in ("fast", "balanced", "accurate")},
+}
+"""functions that return keyword arguments for registration functions, parameter maps can't be pickled
+so they are created in the worker process. ``backend`` selects ``mrid.preprocessing.sitk_registration``
+instead of SimpleElastix."""
+
+# intensity of each label in each contrast: background, skull, brain, ventricles, lesions
+_CONTRASTS = {
+    "t1": (0.0, 0.9, 0.6, 0.2, 0.4),
+    "t2": (0.0, 0.3, 0.5, 1.0, 0.8),
+    "flair": (0.0, 0.4, 0.6, 0.2, 1.0),
+}
+
+
+def make_phantom(size: int, seed: int = 0) -> tuple[dict[str, sitk.Image], sitk.Image]:
+    """Returns images of a synthetic head phantom of shape ``(size, size, size)`` with 1 mm spacing
+    in each contrast, and its label image."""
+    rng = np.random.default_rng(seed)
+    c = (size - 1) / 2
+    z, y, x = np.ogrid[:size, :size, :size]
+    z, y, x = (z - c) / size, (y - c) / size, (x - c) / size
+
+    head = (x / 0.36) ** 2 + (y / 0.42) ** 2 + (z / 0.34) ** 2
+    labels = np.zeros((size, size, size), dtype=np.uint8)
+    labels[head < 1] = 1
+    labels[head < 0.8] = 2
+    labels[((x - 0.05) / 0.06) ** 2 + ((y + 0.03) / 0.16) ** 2 + (z / 0.08) ** 2 < 1] = 3
+    labels[((x + 0.05) / 0.06) ** 2 + ((y + 0.03) / 0.16) ** 2 + (z / 0.08) ** 2 < 1] = 3
+    for _ in range(6):
+        center = rng.uniform(-0.2, 0.2, 3)
+        radius = rng.uniform(0.02, 0.06)
+        lesion = (x - center[0]) ** 2 + (y - center[1]) ** 2 + (z - center[2]) ** 2 < radius ** 2
+        labels[lesion & (labels == 2)] = 4
+
+    labels_image = sitk.GetImageFromArray(labels)
+    images = {}
+    for name, intensities in _CONTRASTS.items():
+        array = np.asarray(intensities, dtype=np.float32)[labels]
+        # smooth tissue boundaries and add texture so that the metric has gradients inside of tissues
+        array += rng.normal(0, 0.02, array.shape).astype(np.float32) * (labels > 0)
+        image = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(array), 1.0)
+        image.CopyInformation(labels_image)
+        images[name] = image
+
+    return images, labels_image
+
+
+def random_transform(image: sitk.Image, kind: Literal["rigid", "affine"], rng: np.random.Generator) -> sitk.AffineTransform:
+    """Returns a random rigid or affine transform around the center of ``image``,
+    with rotations up to 10 degrees and translations up to 8% of the image size."""
+    center = image.TransformContinuousIndexToPhysicalPoint([(s - 1) / 2 for s in image.GetSize()])
+    angles = np.deg2rad(rng.uniform(-10, 10, 3))
+    translation = rng.uniform(-0.08, 0.08, 3) * np.array(image.GetSize()) * np.array(image.GetSpacing())
+
+    euler = sitk.Euler3DTransform(center, *angles.tolist(), translation.tolist())
+    transform = sitk.AffineTransform(3)
+    transform.SetCenter(center)
+    transform.SetTranslation(euler.GetTranslation())
+    matrix = np.array(euler.GetMatrix()).reshape(3, 3)
+    if kind == "affine":
+        scale = np.diag(rng.uniform(0.92, 1.08, 3))
+        shear = np.eye(3) + np.triu(rng.uniform(-0.05, 0.05, (3, 3)), 1)
+        matrix = matrix @ scale @ shear
+    transform.SetMatrix(matrix.ravel().tolist())
+    return transform
+
+
+def warp(image: sitk.Image, transform: sitk.Transform, interpolator = sitk.sitkLinear) -> sitk.Image:
+    """Returns ``image`` warped by ``transform``, which maps points of the result to points of ``image``."""
+    return sitk.Resample(image, image, transform, interpolator, 0.0)
+
+
+def target_registration_error(estimated: sitk.Transform, true: sitk.Transform, points: np.ndarray) -> np.ndarray:
+    """Distances between ``points`` mapped by ``estimated`` and by ``true`` transforms, in mm."""
+    return np.array([np.linalg.norm(np.subtract(estimated.TransformPoint(p), true.TransformPoint(p))) for p in points])
+
+
+def dice(a: sitk.Image, b: sitk.Image) -> float:
+    a_array = sitk.GetArrayViewFromImage(a) > 0
+    b_array = sitk.GetArrayViewFromImage(b) > 0
+    return float(2 * (a_array & b_array).sum() / max(1, a_array.sum() + b_array.sum()))
+
+
+def _head_mask(image: sitk.Image) -> sitk.Image:
+    return image > 0.1
+
+def _peak_rss() -> int:
+    if resource is None: return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def run_case(
+    function: str, size: int, kind: Literal["rigid", "affine"], preset: str, seed: int, masks: bool = False
+) -> dict[str, Any]:
+    """Runs one benchmark case and returns a row of results, meant to run in a fresh process.
+    If ``masks`` is True, head masks of fixed and moving images are passed to ``register`` and ``register_D``."""
+    from mrid.preprocessing.sitk_registration import SitkRegistration, get_backend
+
+    rng = np.random.default_rng(seed)
+    images, labels = make_phantom(size, seed)
+    kwargs = PRESETS[preset]()
+    backend = get_backend(kwargs.pop("backend", "elastix"))
+
+    fixed = images["t1"]
+    fixed_head = _head_mask(fixed)
+    transform = random_transform(fixed, kind, rng)
+    moving = warp(fixed, transform)
+    mask_kwargs = dict(fixed_mask=fixed_head, moving_mask=_head_mask(moving)) if masks else {}
+
+    row: dict[str, Any] = dict(function=function, size=size, transform=kind, preset=preset, masks=masks)
+    start_rss = _peak_rss()
+    start = time.perf_counter()
+
+    if function == "register":
+        # ``register`` is ``find_transform`` of the registration class, the class is used to get the estimated transform
+        reg = backend.SimpleElastix(**kwargs) if hasattr(backend, "SimpleElastix") else SitkRegistration(**kwargs)
+        registered = reg.find_transform(moving, fixed, **mask_kwargs)
+        row["time"] = time.perf_counter() - start
+
+        estimated = reg.get_sitk_transform()
+        brain = np.argwhere(sitk.GetArrayViewFromImage(labels) >= 2)
+        indexes = brain[rng.choice(len(brain), min(1000, len(brain)), replace=False)][:, ::-1]
+        points = np.array([fixed.TransformIndexToPhysicalPoint([int(i) for i in idx]) for idx in indexes])
+        # moving image was made by warping fixed image with ``transform``, so registration should find its inverse
+        if estimated is not None:
+            tre = target_registration_error(estimated, transform.GetInverse(), points)
+            row["tre_mean"] = float(tre.mean())
+            row["tre_max"] = float(tre.max())
+        row["dice"] = dice(_head_mask(registered), fixed_head)
+
+    elif function == "register_D":
+        moving_labels = warp(labels, transform, sitk.sitkNearestNeighbor)
+        registered = backend.register_D({"t1": moving, "seg": moving_labels}, "t1", fixed, **mask_kwargs, **kwargs)
+        row["time"] = time.perf_counter() - start
+        row["dice"] = dice(registered["seg"] >= 2, labels >= 2)
+
+    elif function == "register_each":
+        others = {k: warp(images[k], random_transform(fixed, kind, rng)) for k in ("t2", "flair")}
+        start = time.perf_counter()
+        registered = backend.register_each({"t1": fixed, **others}, "t1", **kwargs)
+        row["time"] = time.perf_counter() - start
+        row["dice"] = float(np.mean([dice(_head_mask(registered[k]), fixed_head) for k in others]))
+
+    else:
+        raise RuntimeError(f"Unknown function {function}")
+
+    row["peak_rss_delta_mb"] = (_peak_rss() - start_rss) / 2**20
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128], help="phantom sizes, e.g. 128 256 512")
+    parser.add_argument("--transforms", nargs="+", default=["rigid", "affine"], choices=["rigid", "affine"])
+    parser.add_argument("--presets", nargs="+", default=list(PRESETS), choices=list(PRESETS))
+    parser.add_argument(
+        "--functions", nargs="+", default=["register", "register_D", "register_each"],
+        choices=["register", "register_D", "register_each"],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--masks", action="store_true", help="pass head masks to register and register_D")
+    parser.add_argument("--csv", type=str, default=None, help="path to save results to")
+    args = parser.parse_args()
+
+    cases = [
+        (function, size, kind, preset, args.seed, args.masks)
+        for size in args.sizes for kind in args.transforms for preset in args.presets for function in args.functions
+    ]
+
+    header = f"{'function':<14}{'size':>5} {'transform':<10}{'preset':<15}{'masks':<6}{'time, s':>9}{'peak MB':>9}{'TRE mean':>10}{'TRE max':>9}{'dice':>7}"
+    print(header)
+    rows = []
+    # each case in a fresh process so that peak memory of one case doesn't hide the next one
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for row in pool.imap(_run_case_star, cases):
+            rows.append(row)
+            tre_mean = f"{row['tre_mean']:.3f}" if "tre_mean" in row else "-"
+            tre_max = f"{row['tre_max']:.3f}" if "tre_max" in row else "-"
+            print(f"{row['function']:<14}{row['size']:>5} {row['transform']:<10}{row['preset']:<15}{'yes' if row['masks'] else 'no':<6}"
+                  f"{row['time']:>9.2f}{row['peak_rss_delta_mb']:>9.0f}{tre_mean:>10}{tre_max:>9}{row['dice']:>7.3f}")
+
+    if args.csv is not None:
+        import csv
+        keys = ["function", "size", "transform", "preset", "masks", "time", "peak_rss_delta_mb", "tre_mean", "tre_max", "dice"]
+        with open(args.csv, "w", newline="", encoding="utf8") as f:
+            writer = csv.DictWriter(f, keys)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def _run_case_star(case):
+    return run_case(*case)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark of moment-based initialization of SimpleElastix registration.
+
+Compares the default registration chain (translation, Euler, rigid, affine from identity transform)
+with ``initializer="moments"`` (rigid and affine starting from translation between centers of mass)
+on the atlases bundled with mrid, which are downloaded on first use.
+Reports registration time and Mattes mutual information between the fixed image and the registered image
+(lower is better).
+
+Requires SimpleITK-SimpleElastix. Run with ``python benchmarks/registration_initializer.py``.
+"""
+import time
+
+import SimpleITK as sitk
+
+import mrid
+from mrid.preprocessing.simple_elastix import register
+
+
+def mattes_mutual_information(image: sitk.Image, fixed: sitk.Image) -> float:
+    """Mattes mutual information between ``image`` and ``fixed``, which must be on the same grid."""
+    method = sitk.ImageRegistrationMethod()
+    method.SetMetricAsMattesMutualInformation(numberOfHistogramBins=32)
+    method.SetMetricSamplingStrategy(method.NONE)
+    method.SetInterpolator(sitk.sitkLinear)
+    method.SetInitialTransform(sitk.TranslationTransform(fixed.GetDimension()))
+    return method.MetricEvaluate(sitk.Cast(fixed, sitk.sitkFloat32), sitk.Cast(image, sitk.sitkFloat32))
+
+
+def shifted(image: sitk.Image, offset: tuple[float, float, float]) -> sitk.Image:
+    """Returns ``image`` with its contents moved by ``offset`` millimeters."""
+    return sitk.Resample(image, sitk.TranslationTransform(3, [-o for o in offset]))
+
+
+def compare(name: str, moving: sitk.Image, fixed: sitk.Image):
+    results = {}
+    for initializer in (None, "moments"):
+        start = time.perf_counter()
+        registered = register(moving, fixed, initializer=initializer)
+        results[initializer] = (time.perf_counter() - start, mattes_mutual_information(registered, fixed))
+
+    (default_time, default_metric), (moments_time, moments_metric) = results[None], results["moments"]
+    print(f"{name}")
+    print(f"    default: {default_time:.2f} s, metric {default_metric:.4f}")
+    print(f"    moments: {moments_time:.2f} s, metric {moments_metric:.4f} "
+          f"({default_time / moments_time:.2f}x faster, metric difference {moments_metric - default_metric:+.4f})")
+
+
+def main():
+    sri24_t1 = sitk.ReadImage(mrid.get_sri24("T1"), sitk.sitkFloat32)
+    sri24_t2 = sitk.ReadImage(mrid.get_sri24("T2"), sitk.sitkFloat32)
+    mni152 = sitk.ReadImage(mrid.get_mni152("2009a T1w symmetric"), sitk.sitkFloat32)
+
+    compare("SRI24 T1 shifted by (20, -15, 10) mm -> SRI24 T1", shifted(sri24_t1, (20, -15, 10)), sri24_t1)
+    compare("SRI24 T2 shifted by (20, -15, 10) mm -> SRI24 T1", shifted(sri24_t2, (20, -15, 10)), sri24_t1)
+    compare("MNI152 2009a T1w symmetric -> SRI24 T1", mni152, sri24_t1)
+
+
+if __name__ == "__main__":
+    main()
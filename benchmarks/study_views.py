@@ -0,0 +1,60 @@
+"""Micro-benchmark of ``Study`` filtering and copying.
+
+Compares current ``Study`` methods, which share images with the original study,
+with rebuilding a study through the constructor on every call, which is what those methods used to do.
+
+Run with ``python benchmarks/study_views.py``.
+"""
+import timeit
+
+import numpy as np
+
+from mrid import Study
+
+
+def make_study() -> Study:
+    return Study(
+        t1=np.random.rand(32, 32, 32).astype(np.float32),
+        t1ce=np.random.rand(32, 32, 32).astype(np.float32),
+        t2=np.random.rand(32, 32, 32).astype(np.float32),
+        flair=np.random.rand(32, 32, 32).astype(np.float32),
+        seg_tumor=np.random.randint(0, 4, (32, 32, 32)).astype(np.uint8),
+        seg_brain=np.random.randint(0, 2, (32, 32, 32)).astype(np.uint8),
+        info_id=12345,
+        info_name="subject",
+    )
+
+
+def rebuild_pipeline(study: Study, steps: int = 20):
+    """Same pipeline, rebuilding a study through the constructor on every call."""
+    for _ in range(steps):
+        scans = Study({k: v for k, v in study.items() if not k.startswith(("seg", "info"))})
+        seg = Study({k: v for k, v in study.items() if k.startswith("seg")})
+        info = Study({k: v for k, v in study.items() if k.startswith("info")})
+        study = Study(**scans, **seg, **info)
+        study = Study({**study, "info_step": 1})
+        study = Study({k: v for k, v in study.items() if k != "info_step"})
+
+
+def shared_pipeline(study: Study, steps: int = 20):
+    """Pipeline using ``Study`` methods."""
+    for _ in range(steps):
+        study = study.apply(None, None)
+        study = study.add("info_step", 1)
+        study = study.remove("info_step")
+
+
+def main():
+    study = make_study()
+    number = 200
+
+    rebuild = timeit.timeit(lambda: rebuild_pipeline(study), number=number) / number
+    shared = timeit.timeit(lambda: shared_pipeline(study), number=number) / number
+
+    print(f"20-step pipeline over {len(study)} keys")
+    print(f"rebuilding studies: {rebuild * 1e3:.3f} ms")
+    print(f"shared images:      {shared * 1e3:.3f} ms ({rebuild / shared:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
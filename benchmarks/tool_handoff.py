@@ -0,0 +1,156 @@
+"""Overhead of passing images to external tools, measured with stub executables instead of the real tools.
+
+Stubs are python scripts that threshold the image they get, so the measured time is what the wrappers spend
+on writing and reading temporary files and starting the tool process, not on the tools themselves.
+For each image size and scratch directory (see ``mrid.utils.set_scratch_dir``) this reports median wall time of:
+
+- ``roundtrip nii.gz`` and ``roundtrip nii``: writing and reading an image in the scratch directory;
+- ``hd_bet``: ``hd_bet.predict_brain_mask`` with a stub ``hd-bet`` command, HD-BET only accepts ``.nii.gz``;
+- ``synthstrip``: ``synthstrip.predict_brain_mask`` with a stub ``mri_synthstrip`` script;
+- ``synthstrip worker``: the same through a ``SynthStripWorker`` that is started once;
+- ``dcm2niix -z y`` and ``dcm2niix -z n``: ``run_dcm2niix`` followed by reading the file,
+  with a stub ``dcm2niix`` that converts a NIfTI file placed in the "DICOM" folder.
+
+Run with ``python benchmarks/tool_handoff.py --sizes 128 256 --scratch default /dev/shm``.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+
+import numpy as np
+import SimpleITK as sitk
+
+from mrid.preprocessing import hd_bet, synthstrip
+from mrid.utils import dcm2niix, set_scratch_dir
+
+_HD_BET = """
+import os, sys
+import SimpleITK as sitk
+args = sys.argv[1:]
+input, output = args[args.index("-i") + 1], args[args.index("-o") + 1]
+if os.path.isdir(input):
+    os.makedirs(output, exist_ok=True)
+    pairs = [(os.path.join(input, f), os.path.join(output, f)) for f in os.listdir(input) if f.endswith(".nii.gz")]
+else:
+    pairs = [(input, output)]
+for i, o in pairs:
+    sitk.WriteImage(sitk.Cast(sitk.ReadImage(i) > 0, sitk.sitkUInt8), o[:-len(".nii.gz")] + "_bet.nii.gz")
+"""
+
+_SYNTHSTRIP = """
+import argparse
+import SimpleITK as sitk
+parser = argparse.ArgumentParser()
+parser.add_argument("-i")
+parser.add_argument("-m")
+args = parser.parse_args()
+sitk.WriteImage(sitk.Cast(sitk.ReadImage(args.i) > 0, sitk.sitkUInt8), args.m)
+"""
+
+_DCM2NIIX = """
+import os, sys
+import SimpleITK as sitk
+args = sys.argv[1:]
+compress, output_dir, name = args[args.index("-z") + 1], args[args.index("-o") + 1], args[args.index("-f") + 1]
+image = sitk.ReadImage(os.path.join(args[-1], "series.nii"))
+sitk.WriteImage(image, os.path.join(output_dir, name + (".nii.gz" if compress == "y" else ".nii")))
+"""
+
+
+def make_image(size: int) -> sitk.Image:
+    """Smooth noise in a sphere on zero background, which compresses like a head scan."""
+    rng = np.random.default_rng(0)
+    array = rng.random((size, size, size), dtype=np.float32)
+    image = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(array), 2.0)
+    grid = np.indices((size, size, size)) - size / 2
+    sphere = (grid ** 2).sum(0) < (0.4 * size) ** 2
+    return sitk.GetImageFromArray(sitk.GetArrayFromImage(image) * 1000 * sphere)
+
+
+def write_stubs(dir: str) -> str:
+    """Writes stub tools to ``dir`` and returns path to the ``mri_synthstrip`` stub,
+    ``hd-bet``, ``dcm2niix`` and ``python`` are added to ``dir`` which should be on PATH."""
+    for name, source in [("hd-bet", _HD_BET), ("dcm2niix", _DCM2NIIX)]:
+        path = os.path.join(dir, name)
+        with open(path, "w", encoding="utf8") as f: f.write(f"#!{sys.executable}\n{source}")
+        os.chmod(path, 0o755)
+
+    # synthstrip scripts are run with "python"
+    os.symlink(sys.executable, os.path.join(dir, "python"))
+    path = os.path.join(dir, "mri_synthstrip")
+    with open(path, "w", encoding="utf8") as f: f.write(_SYNTHSTRIP)
+    return path
+
+
+def median_time(fn: Callable[[], object], repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def roundtrip(image: sitk.Image, ext: str, dir: str | None):
+    with tempfile.TemporaryDirectory(dir=dir) as tmpdir:
+        path = os.path.join(tmpdir, f"image.{ext}")
+        sitk.WriteImage(image, path)
+        sitk.ReadImage(path)
+
+
+def run_dcm2niix(series_dir: str, compress: bool):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = dcm2niix.run_dcm2niix(series_dir, tmpdir, "out", mkdirs=False, compress=compress)
+        sitk.ReadImage(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[128, 256], help="image sizes, e.g. 128 256")
+    parser.add_argument("--scratch", nargs="+", default=["default", "/dev/shm"],
+                        help='scratch directories, "default" is the system temporary directory')
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if sys.platform == "win32": sys.exit("stub tools are scripts with a shebang, which don't run on windows")
+
+    scratch_dirs = [None if d == "default" else d for d in args.scratch]
+    scratch_dirs = [d for d in scratch_dirs if d is None or os.path.isdir(d)]
+
+    with tempfile.TemporaryDirectory() as stub_dir:
+        synthstrip_script = write_stubs(stub_dir)
+        os.environ["PATH"] = f"{stub_dir}{os.pathsep}{os.environ['PATH']}"
+
+        print(f"{'size':>5} {'scratch':<10}{'case':<20}{'time, s':>9}")
+        for size in args.sizes:
+            image = make_image(size)
+            series_dir = os.path.join(stub_dir, f"series_{size}")
+            os.mkdir(series_dir)
+            sitk.WriteImage(image, os.path.join(series_dir, "series.nii"))
+
+            for scratch in scratch_dirs:
+                set_scratch_dir(scratch)
+                with synthstrip.SynthStripWorker.from_script(synthstrip_script, python=sys.executable) as worker:
+                    worker.start()
+                    cases: dict[str, Callable[[], object]] = {
+                        "roundtrip nii.gz": lambda: roundtrip(image, "nii.gz", scratch),
+                        "roundtrip nii": lambda: roundtrip(image, "nii", scratch),
+                        "hd_bet": lambda: hd_bet.predict_brain_mask(image),
+                        "synthstrip": lambda: synthstrip.predict_brain_mask(synthstrip_script, image, verbose=False),
+                        "synthstrip worker": lambda: synthstrip.predict_brain_mask(worker, image), # pylint:disable=cell-var-from-loop
+                        "dcm2niix -z y": lambda: run_dcm2niix(series_dir, compress=True),
+                        "dcm2niix -z n": lambda: run_dcm2niix(series_dir, compress=False),
+                    }
+                    for case, fn in cases.items():
+                        t = median_time(fn, args.repeats)
+                        print(f"{size:>5} {scratch or 'default':<10}{case:<20}{t:>9.3f}", flush=True)
+
+        set_scratch_dir(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
-from . import utils
-from .atlas import get_mni152, get_sri24
+from . import utils, cache
+from .atlas import Atlas, get_mni152, get_mni152_atlas, get_sri24, get_sri24_atlas
 from .preprocessing import *
 from .loading import *
 from .study import Study
+from .lazy import LazyStudy
+from .batch import StudyCollection, StudyResult
@@ -1,7 +1,11 @@
 from . MNI152 import get_mni152
 from .SRI24 import get_sri24
+from .atlas import Atlas, get_mni152_atlas, get_sri24_atlas
 
 __all__ = [
     "get_mni152",
     "get_sri24",
+    "Atlas",
+    "get_mni152_atlas",
+    "get_sri24_atlas",
 ]
\ No newline at end of file
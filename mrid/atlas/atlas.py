@@ -0,0 +1,102 @@
+import functools
+import math
+import os
+from typing import Literal
+
+import SimpleITK as sitk
+
+from ..loading.convert import ImageLike, tositk
+
+__all__ = [
+    "Atlas",
+    "get_mni152_atlas",
+    "get_sri24_atlas",
+]
+
+
+class Atlas:
+    """Template image with an optional brain mask, which can be passed as ``to`` to ``Study.register_SE``,
+    ``mrid.preprocessing.simple_elastix.register`` and other registration functions.
+    The mask is then used as fixed image mask, so that registration only samples voxels inside of the brain.
+
+    The image and the mask are loaded on first access and then reused, and downsampled variants
+    returned by ``at_spacing`` are cached, so registering many subjects to one atlas reads it once.
+    Use ``get_mni152_atlas`` and ``get_sri24_atlas`` to get atlases shared by the whole process.
+
+    Args:
+        image (ImageLike): template image or path to it.
+        mask (ImageLike | None, optional):
+            brain mask or path to it, all non-zero voxels are considered part of the mask,
+            so a skullstripped template can be passed. Defaults to None.
+    """
+    def __init__(self, image: ImageLike, mask: "ImageLike | None" = None):
+        self.image_source = image
+        self.mask_source = mask
+        self._at_spacing: dict[float, "Atlas"] = {}
+
+    def __repr__(self):
+        if isinstance(self.image_source, (str, os.PathLike)): return f"Atlas({os.fspath(self.image_source)!r})"
+        return f"Atlas(<{type(self.image_source).__name__}>)"
+
+    @functools.cached_property
+    def image(self) -> sitk.Image:
+        """The template image."""
+        return tositk(self.image_source)
+
+    @functools.cached_property
+    def mask(self) -> sitk.Image | None:
+        """The brain mask as ``sitk.sitkUInt8`` image with values 0 and 1, or None if atlas has no mask."""
+        if self.mask_source is None: return None
+        mask = sitk.Cast(tositk(self.mask_source) != 0, sitk.sitkUInt8)
+        mask.CopyInformation(self.image)
+        return mask
+
+    def at_spacing(self, spacing: float) -> "Atlas":
+        """Returns this atlas resampled to isotropic ``spacing`` in millimeters, e.g. 2 or 4, with the same origin,
+        direction and physical extent. The image is smoothed before downsampling to avoid aliasing.
+        Results are cached, so this is cheap to call for each subject."""
+        spacing = float(spacing)
+        if spacing not in self._at_spacing:
+            from ..preprocessing.spatial import Grid, resample_to_grid
+
+            image = self.image
+            grid = Grid(
+                size = tuple(max(1, math.ceil(sz * sp / spacing)) for sz, sp in zip(image.GetSize(), image.GetSpacing())),
+                spacing = (spacing, ) * image.GetDimension(),
+                origin = image.GetOrigin(),
+                direction = image.GetDirection(),
+            )
+
+            sigma = [max(0.0, (spacing - sp) / 2) for sp in image.GetSpacing()]
+            smoothed = sitk.SmoothingRecursiveGaussian(image, sigma) if any(s > 0 for s in sigma) else image
+
+            mask = self.mask
+            if mask is not None: mask = resample_to_grid(mask, grid, interpolation=sitk.sitkNearestNeighbor)
+            self._at_spacing[spacing] = Atlas(resample_to_grid(smoothed, grid), mask)
+
+        return self._at_spacing[spacing]
+
+
+@functools.lru_cache(maxsize=None)
+def get_mni152_atlas(
+    type: Literal[
+        "2006 T1w symmetric",
+        "2009a T1w symmetric",
+        "2009a T2w symmetric",
+        "2009a T1w asymmetric",
+        "2009a T2w asymmetric",
+    ],
+    skullstripped: bool = False,
+) -> Atlas:
+    """Returns ``Atlas`` of specified MNI-152 template with brain mask from the skullstripped template.
+    The atlas is created once per process. See ``get_mni152`` for available templates."""
+    from .MNI152 import get_mni152
+    return Atlas(get_mni152(type, skullstripped=skullstripped), mask=get_mni152(type, skullstripped=True))
+
+
+@functools.lru_cache(maxsize=None)
+def get_sri24_atlas(type: Literal["EPI", "EPI_brain", "PD", "PD_brain", "T1", "T1_brain", "T2", "T2_brain"]) -> Atlas:
+    """Returns ``Atlas`` of specified SRI-24 template with brain mask from the skullstripped template.
+    The atlas is created once per process. See ``get_sri24`` for available templates."""
+    from .SRI24 import get_sri24
+    return Atlas(get_sri24(type), mask=get_sri24(f"{type.replace('_brain', '')}_brain"))
@@ -0,0 +1,305 @@
+"""Running ``Study`` pipelines over many study directories.
+
+Example:
+    ```python
+    from operator import methodcaller
+    import mrid
+
+    collection = mrid.StudyCollection.from_root("data/raw")
+    results = collection.run(
+        [
+            methodcaller("register_SE", "t1", mrid.get_sri24("T1")),
+            methodcaller("skullstrip_hd_bet", "t1"),
+        ],
+        out="data/processed",
+        max_workers=4,
+    )
+    ```
+"""
+import importlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import traceback
+import uuid
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Literal, NamedTuple
+
+import SimpleITK as sitk
+
+from .study import Study
+from .utils.parallel import sitk_threads_per_worker
+
+Pipeline = Callable[[Study], Study] | Sequence[Callable[[Study], Study]]
+
+
+class StudyResult(NamedTuple):
+    """Result of running a pipeline on one study."""
+    index: int
+    """index of the study in the collection."""
+    dir: str
+    """directory the study was loaded from."""
+    out_dir: str | None
+    """directory the study was saved to, None if it wasn't saved."""
+    load_time: float
+    """seconds spent loading the study."""
+    process_time: float
+    """seconds spent running the pipeline."""
+    save_time: float
+    """seconds spent saving the study."""
+    error: str | None
+    """traceback if the pipeline failed, otherwise None."""
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def time(self) -> float:
+        return self.load_time + self.process_time + self.save_time
+
+
+def _load_study(dir: str, load_kwargs: dict[str, Any]) -> Study:
+    pickle_module = importlib.import_module(load_kwargs["pickle_module"])
+    return Study.from_dir(dir, **{**load_kwargs, "pickle_module": pickle_module})
+
+def _init_worker(num_threads: int):
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(num_threads)
+
+def _save_atomic(study: Study, out_dir: str, save_kwargs: dict[str, Any]):
+    """Saves ``study`` to a temporary directory next to ``out_dir`` and then moves it to ``out_dir``,
+    so that ``out_dir`` never contains a partially saved study."""
+    parent = os.path.dirname(os.path.normpath(out_dir)) or "."
+    name = os.path.basename(os.path.normpath(out_dir))
+    tmp_dir = tempfile.mkdtemp(prefix=f".{name}.", dir=parent)
+    try:
+        study.save(tmp_dir, **save_kwargs)
+
+        if os.path.exists(out_dir):
+            # os.replace can't replace a non-empty directory, so the old one is moved away first,
+            # to a name that doesn't exist, since Windows can't rename onto an existing directory
+            old_dir = os.path.join(parent, f".{name}.old.{uuid.uuid4().hex}")
+            os.replace(out_dir, old_dir)
+            try:
+                os.replace(tmp_dir, out_dir)
+            except OSError:
+                # put the old study back so that out_dir is never missing
+                os.replace(old_dir, out_dir)
+                raise
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+        else:
+            os.replace(tmp_dir, out_dir)
+
+    finally:
+        if os.path.exists(tmp_dir): shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _run_pipeline(
+    index: int,
+    dir: str,
+    out_dir: str | None,
+    pipeline: Sequence[Callable[[Study], Study]],
+    load_kwargs: dict[str, Any],
+    save_kwargs: dict[str, Any],
+) -> StudyResult:
+    times = [0.0, 0.0, 0.0]
+    stage = 0
+    start = time.perf_counter()
+    try:
+        study = _load_study(dir, load_kwargs)
+        times[0] = time.perf_counter() - start
+
+        stage = 1
+        start = time.perf_counter()
+        for fn in pipeline:
+            study = fn(study)
+        times[1] = time.perf_counter() - start
+
+        stage = 2
+        start = time.perf_counter()
+        if out_dir is not None: _save_atomic(study, out_dir, save_kwargs)
+        times[2] = time.perf_counter() - start
+
+        return StudyResult(index, dir, out_dir, *times, error=None)
+
+    except Exception:
+        times[stage] = time.perf_counter() - start
+        return StudyResult(index, dir, out_dir, *times, error=traceback.format_exc())
+
+
+def _submit(executor: ProcessPoolExecutor, args: tuple) -> "Future[StudyResult] | StudyResult":
+    """Submits ``_run_pipeline`` to ``executor``, returns a failed ``StudyResult`` if that fails,
+    for example when the pool is broken by a crashed worker."""
+    try:
+        return executor.submit(_run_pipeline, *args)
+    except Exception: # pylint:disable=broad-exception-caught
+        return StudyResult(args[0], args[1], args[2], 0.0, 0.0, 0.0, error=traceback.format_exc())
+
+
+class StudyCollection:
+    """A collection of study directories that ``Study`` pipelines can be mapped over.
+
+    Studies are loaded one at a time when they are needed, so the whole dataset is never held in memory.
+
+    Args:
+        dirs: directories with studies that can be loaded with ``Study.from_dir``.
+        prefix: Expected prefix of filenames.
+        suffix: Expected suffix of filenames.
+        ext: Expected file extension for image files. Default is 'nii.gz'.
+        pickle_module: Module used for unpickling info objects. Default is pickle.
+        format: ``"sitk"`` to read images with SimpleITK, or ``"mmap"`` to memory-map images saved
+            with ``format="mmap"``. See ``Study.load``. Default is ``"sitk"``.
+        lazy: if True, only headers of images are read when a study is loaded, voxels are read
+            when an image is first accessed. See ``Study.load``. Default is False.
+    """
+    def __init__(
+        self,
+        dirs: Sequence[str | os.PathLike],
+        prefix: str = '',
+        suffix: str = '',
+        ext: str = 'nii.gz',
+        pickle_module = pickle,
+        format: Literal["sitk", "mmap"] = "sitk",
+        lazy: bool = False,
+    ):
+        self.dirs = [str(d) for d in dirs]
+        # modules can't be pickled, so workers import pickle module by name
+        self.load_kwargs = dict(
+            prefix=prefix, suffix=suffix, ext=ext, pickle_module=pickle_module.__name__, format=format, lazy=lazy
+        )
+
+    @classmethod
+    def from_root(cls, root: str | os.PathLike, **kwargs):
+        """Creates a collection from all subdirectories of ``root``, sorted by name.
+        ``kwargs`` are passed to ``StudyCollection`` constructor."""
+        dirs = sorted(os.path.join(root, d) for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+        return cls(dirs, **kwargs)
+
+    def __len__(self):
+        return len(self.dirs)
+
+    def __getitem__(self, index: int) -> Study:
+        """Loads and returns study at ``index``."""
+        return _load_study(self.dirs[index], self.load_kwargs)
+
+    def __iter__(self) -> Iterator[Study]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def _get_out_dirs(self, out: str | os.PathLike | Sequence[str | os.PathLike] | None) -> list[str | None]:
+        if out is None: return [None for _ in self.dirs]
+
+        if isinstance(out, (str, os.PathLike)):
+            names = [os.path.basename(os.path.normpath(d)) for d in self.dirs]
+            if len(set(names)) != len(names):
+                raise RuntimeError("Study directories have duplicate names, pass a list of output directories to `out`.")
+            return [os.path.join(out, name) for name in names]
+
+        if len(out) != len(self.dirs):
+            raise RuntimeError(f"Got {len(out)} output directories for {len(self.dirs)} studies.")
+        return [str(d) for d in out]
+
+    def map(
+        self,
+        pipeline: Pipeline,
+        out: str | os.PathLike | Sequence[str | os.PathLike] | None = None,
+        max_workers: int | None = None,
+        skip_existing: bool = False,
+        **save_kwargs,
+    ) -> Iterator[StudyResult]:
+        """Runs ``pipeline`` on each study and saves results to ``out``,
+        yields a ``StudyResult`` for each study as soon as it is finished, so they may be out of order.
+
+        Each worker loads a study, runs the pipeline, saves it and returns only the result record.
+        Exceptions are caught and stored in ``StudyResult.error``, including errors of the process pool,
+        such as a crashed worker or a pipeline that can't be pickled.
+        Each study is saved to a temporary directory which is then renamed to its output directory,
+        so output directories of interrupted runs are either complete or missing.
+
+        Args:
+            pipeline: function or sequence of functions that take and return a ``Study``.
+                When ``max_workers`` is more than 1, they must be picklable, use ``operator.methodcaller``
+                to call ``Study`` methods, e.g. ``methodcaller("resize", [128, 128, 128])``, or module-level functions.
+            out: directory where each study is saved to a subdirectory with the name of its input directory,
+                or a sequence of output directories, one per study. If None, studies are not saved. Defaults to None.
+            max_workers: if more than 1, studies are processed in a process pool with this many workers,
+                and each worker gets ``cpu_count // max_workers`` SimpleITK threads. Defaults to None.
+            skip_existing: if True, studies whose output directory already exists are skipped. Defaults to False.
+            save_kwargs: keyword arguments passed to ``Study.save``.
+        """
+        if callable(pipeline): pipeline = [pipeline]
+        pipeline = list(pipeline)
+
+        out_dirs = self._get_out_dirs(out)
+        if out is not None and isinstance(out, (str, os.PathLike)): os.makedirs(out, exist_ok=True)
+
+        indexes = [i for i, d in enumerate(out_dirs) if not (skip_existing and d is not None and os.path.exists(d))]
+        args = [(i, self.dirs[i], out_dirs[i], pipeline, self.load_kwargs, save_kwargs) for i in indexes]
+
+        if max_workers is None or max_workers <= 1:
+            for a in args: yield _run_pipeline(*a)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers, initializer=_init_worker, initargs=(sitk_threads_per_worker(max_workers),)
+        ) as executor:
+            # only keep a few studies in flight so that results are streamed
+            queue = iter(args)
+            running: dict[Future[StudyResult], tuple] = {}
+            for a in queue:
+                future = _submit(executor, a)
+                if isinstance(future, StudyResult): yield future
+                else: running[future] = a
+                if len(running) >= max_workers * 2: break
+
+            while len(running) > 0:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    a = running.pop(future)
+                    try: yield future.result()
+                    except Exception: # pylint:disable=broad-exception-caught
+                        yield StudyResult(a[0], a[1], a[2], 0.0, 0.0, 0.0, error=traceback.format_exc())
+
+                    for a in queue:
+                        future = _submit(executor, a)
+                        if isinstance(future, StudyResult): yield future
+                        else:
+                            running[future] = a
+                            break
+
+    def run(
+        self,
+        pipeline: Pipeline,
+        out: str | os.PathLike | Sequence[str | os.PathLike] | None = None,
+        max_workers: int | None = None,
+        skip_existing: bool = False,
+        verbose: bool = True,
+        **save_kwargs,
+    ) -> list[StudyResult]:
+        """Runs ``pipeline`` on each study and saves results to ``out``, returns a list of ``StudyResult``
+        sorted by study index. See ``StudyCollection.map`` for description of the arguments.
+
+        ``[r._asdict() for r in results]`` can be passed to ``pandas.DataFrame``.
+
+        Args:
+            verbose: if True, prints a line for each finished study and a summary at the end. Defaults to True.
+        """
+        results = []
+        for result in self.map(pipeline, out=out, max_workers=max_workers, skip_existing=skip_existing, **save_kwargs):
+            results.append(result)
+            if verbose:
+                status = "ok" if result.ok else "FAILED"
+                print(f"[{len(results)}/{len(self)}] {result.dir}: {status} in {result.time:.2f}s")
+
+        results.sort(key = lambda r: r.index)
+
+        if verbose:
+            failed = [r for r in results if not r.ok]
+            print(f"Processed {len(results)} studies in {sum(r.time for r in results):.2f}s total, {len(failed)} failed.")
+            for r in failed:
+                print(f"{r.dir}:\n{r.error}")
+
+        return results
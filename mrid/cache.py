@@ -0,0 +1,258 @@
+"""On-disk cache for expensive ``Study`` steps.
+
+Steps like ``Study.register_SE``, ``Study.skullstrip_hd_bet``, ``Study.skullstrip_synthstrip``,
+``Study.harmonize_haca3`` and ``Study.n4_bias_field_correction`` can take from seconds to hours.
+When a cache is enabled, results of those steps are stored in a cache directory,
+keyed by a hash of the study contents (voxels, geometry and info) and call arguments,
+so re-running a notebook or a batch job skips all steps whose inputs didn't change.
+
+Example:
+    ```python
+    mrid.cache.set_cache("/tmp/mrid_cache", max_size=50 * 2**30)
+    study = study.register_SE("t1", mrid.get_sri24("T1")) # computed
+    study = study.register_SE("t1", mrid.get_sri24("T1")) # loaded from cache
+    ```
+
+When total size of the cache exceeds ``max_size``, least recently used entries are removed.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import uuid
+from collections.abc import Callable, Mapping, Sequence
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import numpy as np
+import SimpleITK as sitk
+
+from .atlas.atlas import Atlas
+from .loading.lazy_image import LazyImage
+
+if TYPE_CHECKING:
+    from .study import Study
+
+_MANIFEST = "manifest.json"
+
+def _update_hash(h: "hashlib._Hash", value: Any) -> None:
+    # lazy images hash the same as loaded ones
+    if isinstance(value, LazyImage): value = value.load()
+    # atlases are identified by their voxels and mask
+    if isinstance(value, Atlas): value = ("Atlas", value.image, value.mask)
+
+    if isinstance(value, sitk.Image):
+        h.update(b"sitk.Image")
+        h.update(repr((value.GetSize(), value.GetSpacing(), value.GetOrigin(),
+                       value.GetDirection(), value.GetPixelIDValue())).encode())
+        h.update(np.ascontiguousarray(sitk.GetArrayViewFromImage(value)).data)
+
+    elif isinstance(value, np.ndarray):
+        h.update(b"np.ndarray")
+        h.update(repr((value.shape, value.dtype.str)).encode())
+        h.update(np.ascontiguousarray(value).data)
+
+    elif isinstance(value, str):
+        h.update(b"str")
+        h.update(value.encode())
+
+    elif isinstance(value, os.PathLike):
+        # files are identified by absolute path, size and modification time
+        h.update(b"path")
+        h.update(os.fsencode(os.path.abspath(value)))
+        if os.path.isfile(value):
+            stat = os.stat(value)
+            h.update(repr((stat.st_size, stat.st_mtime_ns)).encode())
+
+    elif value is None or isinstance(value, (bool, int, float, complex, bytes)):
+        h.update(repr(value).encode())
+
+    elif isinstance(value, Mapping) or hasattr(value, "items"):
+        # this includes SimpleElastix parameter maps
+        h.update(b"mapping")
+        for k, v in sorted(value.items(), key = lambda x: repr(x[0])):
+            _update_hash(h, k)
+            _update_hash(h, v)
+
+    elif isinstance(value, (list, tuple)) or hasattr(value, "__iter__"):
+        h.update(b"sequence")
+        for v in value: _update_hash(h, v)
+
+    else:
+        try: h.update(pickle.dumps(value))
+        except Exception: h.update(repr(value).encode())
+
+    h.update(b";")
+
+
+def hash_values(*values: Any) -> str:
+    """Returns a hash of ``values``, which may include images, arrays, paths, mappings, sequences and objects.
+    ``os.PathLike`` values are hashed as files by their absolute path, size and modification time,
+    strings are hashed as strings."""
+    h = hashlib.blake2b(digest_size=20)
+    for v in values: _update_hash(h, v)
+    return h.hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class StudyCache:
+    """Directory that stores results of ``Study`` steps.
+
+    Each entry is a subdirectory named by the hash of the inputs, it contains images and info
+    that the step added or changed, saved with ``Study.save``, and a manifest with the list of output keys.
+
+    Args:
+        dir: cache directory, created if it doesn't exist.
+        max_size: maximal total size of the cache in bytes, least recently used entries are removed
+            when it is exceeded. If None, the size is not limited. Defaults to 20 GB.
+    """
+    def __init__(self, dir: str | os.PathLike, max_size: int | None = 20 * 2**30):
+        self.dir = os.path.abspath(dir)
+        self.max_size = max_size
+        os.makedirs(self.dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"StudyCache({self.dir!r}, max_size={self.max_size})"
+
+    def get(self, key: str, study: "Study") -> "Study | None":
+        """Returns result stored under ``key`` for ``study``, or None if there is no such entry."""
+        path = os.path.join(self.dir, key)
+        if not os.path.isfile(os.path.join(path, _MANIFEST)): return None
+
+        with open(os.path.join(path, _MANIFEST), "r", encoding="utf8") as f:
+            manifest = json.load(f)
+
+        changed = type(study).from_dir(path, ext="nii")
+        result = {k: (changed[k] if k in manifest["changed"] else study.data[k]) for k in manifest["keys"]}
+
+        # mark as recently used
+        os.utime(path)
+        return study._from_images(result)
+
+    def put(self, key: str, study: "Study", result: "Study") -> None:
+        """Stores items of ``result`` that are not in ``study`` under ``key``.
+        Nothing is stored if some info values can't be pickled."""
+        changed = {k: v for k, v in result.data.items() if k not in study.data or study.data[k] is not v}
+
+        for k, v in changed.items():
+            if k.startswith("info"):
+                try: pickle.dumps(v)
+                except Exception: return
+
+        # write to a temporary directory first so that interrupted writes are never read
+        tmp_path = os.path.join(self.dir, f".tmp-{uuid.uuid4().hex}")
+        os.mkdir(tmp_path)
+        try:
+            study._from_images(changed).save(tmp_path, ext="nii", use_compression=False)
+            with open(os.path.join(tmp_path, _MANIFEST), "w", encoding="utf8") as f:
+                json.dump({"keys": list(result.data.keys()), "changed": list(changed.keys())}, f)
+
+            os.replace(tmp_path, os.path.join(self.dir, key))
+
+        except OSError:
+            # same entry was written by another process
+            if not os.path.isfile(os.path.join(self.dir, key, _MANIFEST)): raise
+
+        finally:
+            if os.path.exists(tmp_path): shutil.rmtree(tmp_path, ignore_errors=True)
+
+        self.evict()
+
+    def size(self) -> int:
+        """Returns total size of the cache in bytes."""
+        return _dir_size(self.dir)
+
+    def evict(self) -> None:
+        """Removes least recently used entries until total size is below ``max_size``."""
+        if self.max_size is None: return
+
+        entries = []
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if name.startswith(".tmp-") or not os.path.isdir(path): continue
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size: break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Removes all entries."""
+        for name in os.listdir(self.dir):
+            path = os.path.join(self.dir, name)
+            if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+
+
+_CACHE: StudyCache | None = None
+
+def set_cache(dir: str | os.PathLike | None, max_size: int | None = 20 * 2**30) -> StudyCache | None:
+    """Enables caching of expensive ``Study`` steps in ``dir``, or disables it if ``dir`` is None.
+
+    Args:
+        dir: cache directory, created if it doesn't exist.
+        max_size: maximal total size of the cache in bytes, least recently used entries are removed
+            when it is exceeded. If None, the size is not limited. Defaults to 20 GB.
+    """
+    global _CACHE
+    _CACHE = None if dir is None else StudyCache(dir, max_size=max_size)
+    return _CACHE
+
+def get_cache() -> StudyCache | None:
+    """Returns current cache, or None if caching is disabled."""
+    return _CACHE
+
+
+F = TypeVar("F", bound=Callable)
+
+def cached(
+    *ignore: str,
+    files: Sequence[str] = (),
+    resolve: Mapping[str, Callable[[Any], Any]] | None = None,
+) -> Callable[[F], F]:
+    """Decorator for ``Study`` methods that return a new ``Study``.
+    When a cache is enabled via ``set_cache``, results are looked up in the cache by hash of the study,
+    method name and arguments, except arguments named in ``ignore`` (e.g. ``"verbose"``).
+
+    Args:
+        ignore: names of arguments that don't affect the result.
+        files: names of arguments which are paths to files, such as model weights. When they are passed
+            as strings, they are hashed by absolute path, size and modification time like ``os.PathLike``.
+        resolve: mapping of argument names to functions that are applied to them before hashing,
+            e.g. to resolve ``"auto"`` to the actual value, so that the key doesn't depend on how it was specified.
+    """
+    def decorator(fn: F) -> F:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(self: "Study", *args, **kwargs):
+            cache = _CACHE
+            if cache is None: return fn(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in list(bound.arguments.items())[1:] if k not in ignore}
+            for k in files:
+                if isinstance(arguments.get(k), str): arguments[k] = Path(arguments[k])
+            if resolve is not None:
+                for k, resolve_fn in resolve.items():
+                    if k in arguments: arguments[k] = resolve_fn(arguments[k])
+
+            key = hash_values(fn.__qualname__, self.data, arguments)
+
+            result = cache.get(key, self)
+            if result is not None: return result
+
+            result = fn(self, *args, **kwargs)
+            cache.put(key, self, result)
+            return result
+
+        return wrapper # type:ignore
+    return decorator
@@ -0,0 +1,360 @@
+"""Lazy execution of ``Study`` pipelines.
+
+``study.lazy()`` returns a ``LazyStudy`` which records operations into a plan instead of running them.
+When ``LazyStudy.compute()`` is called, adjacent geometric steps (``resize``, ``downsample``, ``center_crop_or_pad``,
+``resample_to``, ``register_SE``) are fused into a single ``sitk.Resample`` per image, and adjacent intensity steps
+(``apply``, ``apply_numpy``, ``cast``, ``normalize``, ``rescale_intensity``) are chained into a single pass
+per image, with consecutive numpy functions sharing one array conversion.
+
+Images are processed one key at a time, so only one set of intermediate images is alive at any moment.
+"""
+from collections.abc import Callable, Sequence
+from concurrent.futures import Executor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Literal
+
+import numpy as np
+import SimpleITK as sitk
+
+from .atlas.atlas import Atlas
+from .loading.convert import ImageLike, tositk
+from .preprocessing.cropping import center_crop_or_pad_grid
+from .preprocessing import simple_elastix, sitk_registration
+from .preprocessing.spatial import Grid, downsample_size, resample_to_grid, resize_grid
+from .study import Study, _registration_kwargs
+from .utils.parallel import thread_map
+from .utils.profiling import traced_methods
+from .utils.sitk_utils import sitk_apply_numpy
+
+if TYPE_CHECKING:
+    import torch
+
+
+class _GeometricGroup:
+    """Adjacent geometric steps which are fused into one resampling.
+
+    Each step is a function that takes a grid and returns new grid and transform from the new grid to the old grid
+    (or None for identity), and an interpolator for scans or None if the step doesn't interpolate."""
+    def __init__(self):
+        self.steps: list[Callable[[Grid], tuple[Grid, sitk.Transform | None]]] = []
+        self.interpolator: int | None = None
+
+    def add(self, grid_fn: Callable[[Grid], tuple[Grid, sitk.Transform | None]], interpolator: int | None) -> bool:
+        if interpolator is not None:
+            if self.interpolator is not None and self.interpolator != interpolator: return False
+            self.interpolator = interpolator
+        self.steps.append(grid_fn)
+        return True
+
+    def copy(self):
+        group = self.__class__()
+        group.steps = self.steps.copy()
+        group.interpolator = self.interpolator
+        return group
+
+    def grid(self, grid: Grid) -> Grid:
+        for grid_fn in self.steps:
+            grid, _ = grid_fn(grid)
+        return grid
+
+    def __call__(self, image: sitk.Image, is_seg: bool) -> sitk.Image:
+        grid = Grid.from_image(image)
+        transforms = []
+        for grid_fn in self.steps:
+            grid, transform = grid_fn(grid)
+            if transform is not None: transforms.append(transform)
+
+        # transform of each step maps points from its grid to the grid of the previous step,
+        # and ``CompositeTransform`` applies the last transform first.
+        transform = sitk.CompositeTransform(transforms) if len(transforms) > 0 else None
+
+        if is_seg or self.interpolator is None: interpolator = sitk.sitkNearestNeighbor
+        else: interpolator = self.interpolator
+        return resample_to_grid(image, grid, transform, interpolator)
+
+
+class _IntensityGroup:
+    """Adjacent intensity steps which are applied one after another to each image without building a study."""
+    def __init__(self):
+        self.steps: list[tuple[Callable | None, Callable | None, bool]] = []
+
+    def add(self, fn: Callable | None, seg_fn: Callable | None, numpy: bool) -> bool:
+        self.steps.append((fn, seg_fn, numpy))
+        return True
+
+    def copy(self):
+        group = self.__class__()
+        group.steps = self.steps.copy()
+        return group
+
+    def grid(self, grid: Grid) -> Grid:
+        return grid
+
+    def __call__(self, image: sitk.Image, is_seg: bool) -> sitk.Image:
+        numpy_fns = []
+        for fn, seg_fn, numpy in self.steps:
+            if is_seg: fn = seg_fn
+            if fn is None: continue
+
+            if numpy:
+                numpy_fns.append(fn)
+                continue
+
+            if len(numpy_fns) > 0:
+                image = sitk_apply_numpy(image, partial(_chain, fns=numpy_fns))
+                numpy_fns = []
+
+            image = fn(image)
+
+        if len(numpy_fns) > 0:
+            image = sitk_apply_numpy(image, partial(_chain, fns=numpy_fns))
+
+        return image
+
+
+def _chain(x, fns: Sequence[Callable]):
+    for fn in fns: x = fn(x)
+    return x
+
+
+@traced_methods("study")
+class LazyStudy:
+    """Records operations on a ``Study`` into a plan which is executed by ``compute``, create it via ``study.lazy()``.
+
+    Supported operations are recorded, all other ``Study`` methods compute the plan first
+    and are then called on the computed study, and if they return a ``Study``, it is wrapped into a new ``LazyStudy``.
+    Indexing, ``in``, ``keys`` and iteration are also forwarded to the computed study.
+    The computed study is kept until the plan or ``study`` changes, so it is computed once per ``LazyStudy``.
+
+    Note:
+        Fused geometric steps sample the original image directly, so values that an intermediate crop would
+        have removed can reappear if a later step moves them back into the field of view
+        (e.g. cropping and then padding back to the original size).
+
+        Functions passed to ``apply`` and ``apply_numpy`` must not change image geometry.
+
+    Example:
+        ```python
+        study = study.lazy().center_crop_or_pad([192, 224, 192]).resize([96, 112, 96]).normalize().compute()
+        ```
+    """
+    def __init__(self, study: Study):
+        self.study = study
+        self.plan: list[_GeometricGroup | _IntensityGroup] = []
+        self._computed: tuple[tuple[int, ...], Study] | None = None
+
+    def __repr__(self):
+        steps = ", ".join(f"{type(g).__name__[1:]}({len(g.steps)})" for g in self.plan)
+        return f"LazyStudy(keys={list(self.study.keys())}, plan=[{steps}])"
+
+    def _copy(self) -> "LazyStudy":
+        new = self.__class__(self.study)
+        new.plan = self.plan.copy()
+        return new
+
+    def _add(self, group_cls: type, *args) -> "LazyStudy":
+        new = self._copy()
+        if len(new.plan) > 0 and type(new.plan[-1]) is group_cls:
+            # groups are mutable so copy the last one before adding to it
+            last = new.plan[-1].copy()
+            if last.add(*args):
+                new.plan[-1] = last
+                return new
+
+        group = group_cls()
+        group.add(*args)
+        new.plan.append(group)
+        return new
+
+    def _geometric(self, grid_fn: Callable[[Grid], tuple[Grid, sitk.Transform | None]], interpolator: int | None):
+        return self._add(_GeometricGroup, grid_fn, interpolator)
+
+    def _intensity(self, fn: Callable | None, seg_fn: Callable | None, numpy: bool = False):
+        return self._add(_IntensityGroup, fn, seg_fn, numpy)
+
+    def get_grids(self) -> dict[str, Grid]:
+        """Returns grids that images will have after the plan is computed, without computing it."""
+        grids = {}
+        for k, v in self.study.get_images().items():
+            grid = Grid.from_image(v)
+            for group in self.plan: grid = group.grid(grid)
+            grids[k] = grid
+        return grids
+
+    # ------------------------------ intensity steps ----------------------------- #
+    def apply(self, fn: Callable[[sitk.Image], sitk.Image] | None, seg_fn: Callable[[sitk.Image], sitk.Image] | None):
+        """Records ``Study.apply``."""
+        return self._intensity(fn, seg_fn)
+
+    def apply_numpy(self, fn: Callable[[np.ndarray], np.ndarray] | None, seg_fn: Callable[[np.ndarray], np.ndarray] | None):
+        """Records ``Study.apply_numpy``."""
+        return self._intensity(fn, seg_fn, True)
+
+    def cast(self, dtype):
+        """Records ``Study.cast``."""
+        return self.apply(partial(sitk.Cast, pixelID=dtype), seg_fn=None)
+
+    def cast_float64(self):
+        """Records ``Study.cast_float64``."""
+        return self.cast(sitk.sitkFloat64)
+
+    def cast_float32(self):
+        """Records ``Study.cast_float32``."""
+        return self.cast(sitk.sitkFloat32)
+
+    def normalize(self):
+        """Records ``Study.normalize``."""
+        return self.apply(sitk.Normalize, seg_fn=None)
+
+    def rescale_intensity(self, min: float, max: float):
+        """Records ``Study.rescale_intensity``."""
+        return self.apply(partial(sitk.RescaleIntensity, outputMinimum = min, outputMaximum = max), seg_fn=None) # type:ignore
+
+    # ------------------------------ geometric steps ----------------------------- #
+    def center_crop_or_pad(self, size: Sequence[int]):
+        """Records ``Study.center_crop_or_pad``."""
+        shapes = {k: grid.size for k, grid in self.get_grids().items()}
+        if len(set(shapes.values())) > 1:
+            raise RuntimeError(f"center_crop_or_pad can only be applied to a Study where all images have the same shape. "
+                               f"Current shapes: {shapes}")
+
+        return self._geometric(partial(_center_crop_or_pad_step, size=size), None)
+
+    def resize(self, size: Sequence[int], interpolator=sitk.sitkLinear):
+        """Records ``Study.resize``."""
+        return self._geometric(partial(resize_grid, new_size=size), interpolator)
+
+    def downsample(self, factor: float, dims = None, interpolator=sitk.sitkLinear):
+        """Records ``Study.downsample``."""
+        return self._geometric(partial(_downsample_step, factor=factor, dims=dims), interpolator)
+
+    def resample_to(self, to: "np.ndarray | sitk.Image | torch.Tensor | str", interpolation=sitk.sitkLinear):
+        """Records ``Study.resample_to``."""
+        grid = Grid.from_image(tositk(to))
+        return self._geometric(partial(_resample_to_step, to=grid), interpolation)
+
+    def register_SE(
+        self,
+        key: str,
+        to: "ImageLike | Atlas",
+        pmap=None,
+        log_to_console=False,
+        initializer: Literal["moments"] | None = None,
+        fixed_mask: "ImageLike | None" = None,
+        backend: Literal["auto", "elastix", "sitk"] = "auto",
+        interpolator=sitk.sitkLinear,
+        moving_mask: "str | ImageLike | None" = None,
+        preset: Literal["fast", "balanced", "accurate"] | None = None,
+    ):
+        """Records ``Study.register_SE``.
+
+        The transform is found right away by registering ``study[key]`` with all previously recorded steps applied,
+        and it is then fused with other geometric steps, so that each image is resampled once from its original grid.
+        Like ``Study.register_SE``, the transform is stored as ``f"info_transform_{key}"``, it applies to images
+        after the steps recorded before ``register_SE``, not to the original images.
+        Only translation, Euler, similarity and affine transforms can be fused, use ``Study.register_SE`` for others.
+
+        Args:
+            interpolator: interpolation method for scans, segmentations always use nearest neighbor.
+                Unlike ``Study.register_SE`` which uses 3rd order B-spline interpolation, defaults to linear
+                so that registration is fused with ``resize`` and ``downsample`` with default arguments.
+
+            See ``Study.register_SE`` for other arguments.
+        """
+        kwargs = _registration_kwargs(backend, pmap=pmap, initializer=initializer, preset=preset)
+        if sitk_registration.get_backend(backend) is simple_elastix:
+            reg = simple_elastix.SimpleElastix(log_to_console=log_to_console, **kwargs)
+        else:
+            reg = sitk_registration.SitkRegistration(log_to_console=log_to_console, **kwargs)
+
+        if isinstance(moving_mask, str) and moving_mask in self.study.data:
+            moving_mask = self._compute_image(self.study[moving_mask], True)
+
+        reg.find_transform(
+            self._compute_image(self.study[key], key.startswith("seg")), to, fixed_mask=fixed_mask, moving_mask=moving_mask
+        )
+        transform = reg.get_sitk_transform()
+        if transform is None:
+            raise RuntimeError("Registration found a transform that can't be fused with other steps, "
+                               "use `Study.register_SE` instead.")
+
+        if isinstance(to, Atlas): to = to.image
+        grid = Grid.from_image(tositk(to))
+        new = self._geometric(partial(_register_step, to=grid, transform=transform), interpolator)
+
+        # same as ``Study.register_SE``, the transform is relative to images after the steps recorded so far,
+        # e.g. ``resize`` changes origin and direction, so it doesn't apply to the original images
+        new.study = new.study.add(f"info_transform_{key}", reg.get_transform_parameter_maps())
+        return new
+
+    # --------------------------------- execution -------------------------------- #
+    def _compute_image(self, image: sitk.Image, is_seg: bool) -> sitk.Image:
+        for group in self.plan:
+            image = group(image, is_seg)
+        return image
+
+    def compute(self, max_workers: int | None = None, executor: "Executor | None" = None) -> Study:
+        """Executes the plan and returns a new ``Study``.
+
+        Args:
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+        """
+        if len(self.plan) == 0: return self.study
+        # a copy so that adding items to the returned study doesn't change the memoized one
+        return self._get_computed(max_workers=max_workers, executor=executor).copy()
+
+    def _get_computed(self, max_workers: int | None = None, executor: "Executor | None" = None) -> Study:
+        """Returns the computed study, which is memoized until ``plan`` or ``study`` is changed."""
+        if len(self.plan) == 0: return self.study
+
+        # groups are never modified once they are in a plan, so identities of the groups and the study identify it
+        plan_id = (id(self.study), *map(id, self.plan))
+        if self._computed is not None and self._computed[0] == plan_id: return self._computed[1]
+
+        images = self.study.get_images()
+        tasks = {k: partial(self._compute_image, v, k.startswith("seg")) for k, v in images.items()}
+        computed = thread_map(tasks, executor=executor, max_workers=max_workers)
+        study = self.study._from_images({**computed, **self.study.get_info()})
+
+        self._computed = (plan_id, study)
+        return study
+
+    def __getitem__(self, key: str) -> "sitk.Image | Any":
+        return self._get_computed()[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._get_computed()
+
+    def __iter__(self):
+        return iter(self._get_computed())
+
+    def keys(self):
+        """Returns keys of the computed study."""
+        return self._get_computed().keys()
+
+    def __getattr__(self, name: str) -> Any:
+        # all other methods compute the plan first
+        if name.startswith("_") or name in ("study", "plan"): raise AttributeError(name)
+        attr = getattr(self._get_computed(), name)
+        if not callable(attr): return attr
+
+        def method(*args, **kwargs):
+            res = attr(*args, **kwargs)
+            if isinstance(res, Study): return self.__class__(res)
+            return res
+
+        return method
+
+
+def _center_crop_or_pad_step(grid: Grid, size: Sequence[int]) -> tuple[Grid, None]:
+    return center_crop_or_pad_grid(grid, size), None
+
+def _downsample_step(grid: Grid, factor: float, dims) -> tuple[Grid, sitk.Transform]:
+    return resize_grid(grid, downsample_size(grid.size[::-1], factor=factor, dims=dims))
+
+def _resample_to_step(grid: Grid, to: Grid) -> tuple[Grid, None]:
+    return to, None
+
+def _register_step(grid: Grid, to: Grid, transform: sitk.Transform) -> tuple[Grid, sitk.Transform]:
+    return to, transform
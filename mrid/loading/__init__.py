@@ -1 +1,2 @@
-from .convert import tonumpy, tositk, totensor, ImageLike
\ No newline at end of file
+from .convert import tonumpy, tositk, totensor, ImageLike
+from .lazy_image import FileImage, ImageHeader, LazyImage, MemmapImage, save_memmap_image
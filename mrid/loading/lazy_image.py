@@ -0,0 +1,163 @@
+"""Images stored on disk which are only loaded when they are accessed."""
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+import SimpleITK as sitk
+
+from .convert import tositk
+
+_NUMPY_TO_SITK = {
+    np.dtype(np.uint8): sitk.sitkUInt8,
+    np.dtype(np.int8): sitk.sitkInt8,
+    np.dtype(np.uint16): sitk.sitkUInt16,
+    np.dtype(np.int16): sitk.sitkInt16,
+    np.dtype(np.uint32): sitk.sitkUInt32,
+    np.dtype(np.int32): sitk.sitkInt32,
+    np.dtype(np.uint64): sitk.sitkUInt64,
+    np.dtype(np.int64): sitk.sitkInt64,
+    np.dtype(np.float32): sitk.sitkFloat32,
+    np.dtype(np.float64): sitk.sitkFloat64,
+}
+
+_NUMPY_TO_SITK_VECTOR = {
+    np.dtype(np.uint8): sitk.sitkVectorUInt8,
+    np.dtype(np.int8): sitk.sitkVectorInt8,
+    np.dtype(np.uint16): sitk.sitkVectorUInt16,
+    np.dtype(np.int16): sitk.sitkVectorInt16,
+    np.dtype(np.uint32): sitk.sitkVectorUInt32,
+    np.dtype(np.int32): sitk.sitkVectorInt32,
+    np.dtype(np.uint64): sitk.sitkVectorUInt64,
+    np.dtype(np.int64): sitk.sitkVectorInt64,
+    np.dtype(np.float32): sitk.sitkVectorFloat32,
+    np.dtype(np.float64): sitk.sitkVectorFloat64,
+}
+
+
+class ImageHeader(NamedTuple):
+    """Geometry and pixel type of an image, all in SimpleITK (x, y, z) order."""
+    size: tuple[int, ...]
+    spacing: tuple[float, ...]
+    origin: tuple[float, ...]
+    direction: tuple[float, ...]
+    pixel_id: int
+    """SimpleITK pixel type, for example ``sitk.sitkFloat32``."""
+
+    @classmethod
+    def from_image(cls, image: sitk.Image):
+        return cls(image.GetSize(), image.GetSpacing(), image.GetOrigin(), image.GetDirection(), image.GetPixelID())
+
+
+class LazyImage:
+    """Placeholder for an image stored on disk. ``Study`` can store it instead of ``sitk.Image``,
+    and loads it when it is accessed via ``study[key]``."""
+    _image: sitk.Image | None = None
+
+    def _load(self) -> sitk.Image:
+        raise NotImplementedError(self.__class__.__name__)
+
+    def load(self) -> sitk.Image:
+        """Loads and returns the image, it is loaded once and then reused."""
+        if self._image is None: self._image = self._load()
+        return self._image
+
+    def header(self) -> ImageHeader:
+        """Returns header of the image without loading the voxels."""
+        raise NotImplementedError(self.__class__.__name__)
+
+    def view(self) -> np.ndarray:
+        """Returns a read-only array with voxels of the image."""
+        return sitk.GetArrayViewFromImage(self.load())
+
+
+class FileImage(LazyImage):
+    """Image file that can be read by SimpleITK. Only the header is read on creation,
+    voxels are read when the image is loaded.
+
+    Args:
+        path: path to the image file.
+    """
+    def __init__(self, path: str | os.PathLike):
+        self.path = os.fspath(path)
+
+        reader = sitk.ImageFileReader()
+        reader.SetFileName(self.path)
+        reader.ReadImageInformation()
+        self._header = ImageHeader(
+            reader.GetSize(), reader.GetSpacing(), reader.GetOrigin(), reader.GetDirection(), reader.GetPixelID()
+        )
+
+    def __repr__(self):
+        return f"FileImage({self.path!r})"
+
+    def header(self):
+        return self._header
+
+    def _load(self):
+        return tositk(self.path)
+
+
+def _sidecar_path(path: str | os.PathLike) -> str:
+    path = os.fspath(path)
+    if path.endswith(".npy"): path = path[:-4]
+    return f"{path}.json"
+
+
+def save_memmap_image(image: sitk.Image, path: str | os.PathLike):
+    """Saves ``image`` to ``path`` as ``.npy`` file with voxels and ``.json`` sidecar with origin, spacing, direction
+    and number of components per pixel, which can be opened with ``MemmapImage``.
+    Voxels are stored uncompressed so that they can be memory-mapped."""
+    np.save(path, sitk.GetArrayViewFromImage(image), allow_pickle=False)
+    with open(_sidecar_path(path), "w", encoding="utf8") as f:
+        json.dump({
+            "origin": image.GetOrigin(),
+            "spacing": image.GetSpacing(),
+            "direction": image.GetDirection(),
+            "components": image.GetNumberOfComponentsPerPixel(),
+        }, f)
+
+
+class MemmapImage(LazyImage):
+    """Image saved by ``save_memmap_image``. Voxels are memory-mapped, so opening it is instant,
+    and only the parts of the file that are accessed are read from disk.
+
+    Args:
+        path: path to the ``.npy`` file, sidecar is expected next to it with ``.json`` extension.
+    """
+    def __init__(self, path: str | os.PathLike):
+        self.path = os.fspath(path)
+        with open(_sidecar_path(path), "r", encoding="utf8") as f:
+            sidecar = json.load(f)
+
+        self.origin: tuple[float, ...] = tuple(sidecar["origin"])
+        self.spacing: tuple[float, ...] = tuple(sidecar["spacing"])
+        self.direction: tuple[float, ...] = tuple(sidecar["direction"])
+        # vector images have components in the last axis of the array, sidecars without it are scalar
+        self.components: int = sidecar.get("components", 1)
+
+        self._array: np.ndarray | None = None
+
+    def __repr__(self):
+        return f"MemmapImage({self.path!r})"
+
+    def view(self) -> np.ndarray:
+        """Returns a read-only memory-mapped array with voxels of the image."""
+        if self._array is None: self._array = np.load(self.path, mmap_mode="r", allow_pickle=False)
+        return self._array
+
+    def header(self):
+        array = self.view()
+        if array.dtype not in _NUMPY_TO_SITK: raise RuntimeError(f"Unsupported dtype {array.dtype}")
+        if self.components > 1:
+            return ImageHeader(
+                array.shape[:-1][::-1], self.spacing, self.origin, self.direction, _NUMPY_TO_SITK_VECTOR[array.dtype]
+            )
+        return ImageHeader(array.shape[::-1], self.spacing, self.origin, self.direction, _NUMPY_TO_SITK[array.dtype])
+
+    def _load(self):
+        image = sitk.GetImageFromArray(self.view(), isVector=self.components > 1)
+        image.SetOrigin(self.origin)
+        image.SetSpacing(self.spacing)
+        image.SetDirection(self.direction)
+        return image
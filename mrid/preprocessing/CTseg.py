@@ -12,11 +12,12 @@ Then type in the command specified in "Docker" section of the read-me in https:/
 After it is done, the CTseg functions from mrid can be used.
 """
 import os
-import subprocess
 from pathlib import Path
 
 from ..loading import tositk
+from ..utils.profiling import run_subprocess, traced
 
+@traced()
 def run_CTseg(
     pth_ct: str | os.PathLike,
     dir_out: str = "",
@@ -74,7 +75,7 @@ def run_CTseg(
     ]
 
     # run
-    subprocess.run(command, check=True)
+    run_subprocess(command, check=True)
 
 # this creates
 # wc01_1_00001_temp_CT_CTseg.nii
@@ -3,10 +3,10 @@ from .cropping import crop_bg, crop_bg_D, center_crop_or_pad
 from .spatial import downsample, resample_to, resize
 
 # lib wrappers
-from . import hd_bet, CTseg, simple_elastix, synthstrip, mask, haca3
+from . import hd_bet, CTseg, simple_elastix, sitk_registration, synthstrip, mask, haca3
 __all__ = [
     "n4_bias_field_correction",
     "crop_bg", "crop_bg_D",
     "resample_to", "resize", "downsample",
-    "hd_bet", "CTseg", "simple_elastix", "synthstrip", "mask",
+    "hd_bet", "CTseg", "simple_elastix", "sitk_registration", "synthstrip", "mask",
 ]
@@ -1,6 +1,8 @@
 import SimpleITK as sitk
 from ..loading.convert import tositk, ImageLike
+from ..utils.profiling import traced
 
+@traced()
 def n4_bias_field_correction(image: ImageLike, shrink: int = 4) -> sitk.Image:
     """Perform N4 Bias Field Correction to correct low frequency intensity non-uniformity present in MRI image.
 
@@ -3,6 +3,8 @@ from typing import Any
 import SimpleITK as sitk
 
 from ..loading.convert import tositk, ImageLike
+from ..utils.profiling import traced
+from .spatial import Grid
 
 def _get_bbox(image: sitk.Image):
     rescaled = sitk.RescaleIntensity(image, 0, 255)
@@ -11,6 +13,7 @@ def _get_bbox(image: sitk.Image):
     return filt.GetBoundingBox(255)
 
 
+@traced()
 def crop_bg(image: ImageLike) -> sitk.Image:
     """Crops black background of a single 3D image via Otsu's thresholding.
 
@@ -24,6 +27,7 @@ def crop_bg(image: ImageLike) -> sitk.Image:
     bbox = _get_bbox(image)
     return sitk.RegionOfInterest( image, bbox[int(len(bbox) / 2) :],  bbox[0 : int(len(bbox) / 2)],)
 
+@traced()
 def crop_bg_D(images: Mapping[str, ImageLike], key: str) -> dict[str, sitk.Image]:
     """Finds the bounding box of ``images[key]`` and crops all images in ``images`` to that bounding box."""
     images = {k: tositk(v) for k,v in images.items()}
@@ -34,11 +38,7 @@ def crop_bg_D(images: Mapping[str, ImageLike], key: str) -> dict[str, sitk.Image
     ret = {k: sitk.RegionOfInterest(v, bbox[int(len(bbox) / 2) :],  bbox[0 : int(len(bbox) / 2)]) for k,v in images.items()}
     return ret
 
-def center_crop_or_pad(image, size: Sequence[int]) -> "sitk.Image":#[192, 224, 192]
-    """Crops or pads image from the center to ``size``."""
-    image = tositk(image)
-    current_size = list(image.GetSize())
-
+def _crop_or_pad_amounts(current_size: Sequence[int], size: Sequence[int]):
     low_pad = []
     high_pad = []
     low_crop = []
@@ -62,6 +62,14 @@ def center_crop_or_pad(image, size: Sequence[int]) -> "sitk.Image":#[192, 224, 1
             low_crop.append(low)
             high_crop.append(high)
 
+    return low_pad, high_pad, low_crop, high_crop
+
+@traced()
+def center_crop_or_pad(image, size: Sequence[int]) -> "sitk.Image":#[192, 224, 192]
+    """Crops or pads image from the center to ``size``."""
+    image = tositk(image)
+    low_pad, high_pad, low_crop, high_crop = _crop_or_pad_amounts(image.GetSize(), size)
+
     image = sitk.ConstantPad(image, low_pad, high_pad, 0)
     image = sitk.Crop(image, low_crop, high_crop)
 
@@ -70,3 +78,11 @@ def center_crop_or_pad(image, size: Sequence[int]) -> "sitk.Image":#[192, 224, 1
         return image
 
     raise RuntimeError(f"Final size is {image.GetSize()} instead of {size}, crop_or_pad failed for some reason.")
+
+def center_crop_or_pad_grid(grid: Grid, size: Sequence[int]) -> Grid:
+    """Returns grid of ``grid`` cropped or padded from the center to ``size``, without touching any voxels.
+    Resampling onto it with identity transform gives the same result as ``center_crop_or_pad``."""
+    low_pad, _, low_crop, _ = _crop_or_pad_amounts(grid.size, size)
+    shift = [c - p for c, p in zip(low_crop, low_pad)]
+    origin = grid.index_to_physical(shift)
+    return grid._replace(size=tuple(int(s) for s in size), origin=tuple(float(o) for o in origin))
@@ -7,8 +7,6 @@ You also need to download HACA3 weights harmonization.pt and fusion model weight
 """
 import os
 import shlex
-import subprocess
-import tempfile
 from collections.abc import Sequence
 from pathlib import Path
 from typing import Literal
@@ -16,6 +14,8 @@ from typing import Literal
 import SimpleITK as sitk
 
 from ..loading import ImageLike, tositk
+from ..utils.profiling import run_subprocess, traced
+from ..utils.tempfiles import temporary_directory
 from .cropping import center_crop_or_pad
 from .simple_elastix import register, register_D
 
@@ -40,6 +40,7 @@ from .simple_elastix import register, register_D
 # However, this may slightly increase the inference time.
 
 
+@traced()
 def run_HACA3(
     conda_path: str | os.PathLike,
     env_name: str,
@@ -128,8 +129,9 @@ def run_HACA3(
     command = f". {conda_path}/etc/profile.d/conda.sh && conda activate {env_name} && {' '.join(haca3_command)}"
 
     # run
-    subprocess.run(command, shell=True, check=True)
+    run_subprocess(command, name="haca3", shell=True, check=True)
 
+@traced()
 def harmonize(
     conda_path: str | os.PathLike,
     env_name: str,
@@ -202,17 +204,18 @@ def harmonize(
     if target_image is not None: target_image = tositk(target_image)
 
     # --------------------------------- run HACA3 -------------------------------- #
-    with tempfile.TemporaryDirectory() as tmpdir:
+    # inputs are uncompressed to skip gzip, output name is derived by HACA3 from ``out_path``, so it is kept as is
+    with temporary_directory() as tmpdir:
         for i, img in enumerate(inputs):
             if tuple(img.GetSize()) != (192, 224, 192):
                 raise RuntimeError(
                     "all inputs to HACA3 must be in MNI152 space and center-padded to size of ``[192, 224, 192]``. "
                     f"Got image {i} of size {img.GetSize()}")
 
-            sitk.WriteImage(img, os.path.join(tmpdir, f"input_{i}.nii.gz"))
+            sitk.WriteImage(img, os.path.join(tmpdir, f"input_{i}.nii"))
 
         if target_image is not None:
-            target_path = os.path.join(tmpdir, "target_image.nii.gz")
+            target_path = os.path.join(tmpdir, "target_image.nii")
             if tuple(target_image.GetSize()) != (192, 224, 192):
                 raise RuntimeError(
                     "all inputs to HACA3 must be in MNI152 space and center-padded to size of ``[192, 224, 192]``. "
@@ -227,7 +230,7 @@ def harmonize(
             env_name=env_name,
             harmonization_model=harmonization_model,
             fusion_model=fusion_model,
-            in_path = [os.path.join(tmpdir, f"input_{i}.nii.gz") for i in range(len(inputs))],
+            in_path = [os.path.join(tmpdir, f"input_{i}.nii") for i in range(len(inputs))],
             out_path = os.path.join(tmpdir, "output.nii.gz"),
             target_image = target_path,
             target_theta = target_theta,
@@ -1,14 +1,15 @@
 import os
-import subprocess
-import tempfile
-from collections.abc import Mapping
+from collections.abc import Mapping, Sequence
 from typing import Literal
 
+import numpy as np
 import SimpleITK as sitk
 
 from ..loading.convert import ImageLike, tositk
+from ..utils.profiling import run_subprocess, traced
+from ..utils.tempfiles import temporary_directory
 from ..utils.torch_utils import CUDA_IF_AVAILABLE
-from .simple_elastix import register, register_D
+from .simple_elastix import SimpleElastix
 from .mask import expand_binary_mask, apply_mask
 
 # hd_bet -h
@@ -23,6 +24,7 @@ from .mask import expand_binary_mask, apply_mask
 # --no_bet_image        Set this flag to disable generating the skull stripped/brain extracted image. Only makes sense if you also set --save_bet_mask
 # --verbose             Talk to me.
 
+@traced()
 def run_hd_bet(
     input: str | os.PathLike,
     output: str | os.PathLike,
@@ -70,15 +72,133 @@ def run_hd_bet(
     if verbose: command.append("--verbose")
 
     # run dcm2niix
-    subprocess.run(command, check=True)
+    run_subprocess(command, check=True)
 
 
+class HDBetPredictor:
+    """HD-BET network loaded once and kept in memory, so that predicting many brain masks doesn't start the
+    ``hd-bet`` command, import torch and load the weights for each image. Requires the HD-BET python package.
+
+    Pass it as ``predictor`` to ``predict_brain_mask``, ``predict_brain_masks``, ``skullstrip``, ``skullstrip_D``,
+    ``skullstrip_D_batch``, ``Study.skullstrip_hd_bet`` or ``Study.skullstrip_hd_bet_batch``.
+
+    Args:
+        device (str, optional):
+            used to set on which device the prediction will run. Can be 'cuda' (=GPU), 'cpu' or 'mps'.
+            Defaults to CUDA_IF_AVAILABLE.
+        disable_tta (bool, optional):
+            Set this flag to disable test time augmentation.
+            This will make prediction faster at a slight decrease in prediction quality.
+            Recommended for device cpu. Defaults to False.
+        verbose (bool, optional): Talk to me. Defaults to False.
+    """
+    def __init__(
+        self,
+        device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
+        disable_tta: bool = False,
+        verbose: bool = False,
+    ):
+        import torch
+        from HD_BET.checkpoint_download import maybe_download_parameters
+        from HD_BET.hd_bet_prediction import get_hdbet_predictor
+
+        self.device = device
+        self.disable_tta = disable_tta
+        self.verbose = verbose
+
+        maybe_download_parameters()
+        self.predictor = get_hdbet_predictor(use_tta=not disable_tta, device=torch.device(device), verbose=verbose)
+
+    def __repr__(self):
+        return f"HDBetPredictor(device={self.device!r}, disable_tta={self.disable_tta})"
+
+    def __reduce__(self):
+        # the network is loaded again when unpickled, e.g. in a worker process,
+        # so that pickling and hashing for the cache don't serialize the weights
+        return (HDBetPredictor, (self.device, self.disable_tta, self.verbose))
+
+    @traced()
+    def predict(self, input: ImageLike) -> sitk.Image:
+        """Returns brain mask of ``input``, recommended to be T1-w, postcontrast T1-w, T2-w or FLAIR in MNI152 space."""
+        input = tositk(input)
+
+        # same layout as nnU-Net's SimpleITKIO: channels first, then numpy order of axes and spacing
+        array = sitk.GetArrayFromImage(sitk.Cast(input, sitk.sitkFloat32))[None]
+        properties = {"spacing": list(input.GetSpacing())[::-1]}
+        seg = self.predictor.predict_single_npy_array(array, properties, None, None, False)
+
+        mask = sitk.GetImageFromArray(np.asarray(seg).astype(np.uint8))
+        mask.CopyInformation(input)
+        return mask
+
+
+def _predict_brain_mask_cli(
+    input: sitk.Image, device: Literal["cpu", "cuda", "mps"], disable_tta: bool, verbose: bool
+) -> sitk.Image:
+    """Predicts brain mask of ``input`` by running the ``hd-bet`` command on a temporary file.
+    Unlike other tools, HD-BET only accepts ``.nii.gz``, so the file is compressed."""
+    with temporary_directory() as tmpdir:
+        sitk.WriteImage(input, os.path.join(tmpdir, "input.nii.gz"))
+
+        run_hd_bet(
+            input = os.path.join(tmpdir, "input.nii.gz"),
+            output = os.path.join(tmpdir, "output.nii.gz"),
+            device=device, disable_tta=disable_tta, save_bet_mask=True, verbose=verbose,
+        )
+
+        return tositk(os.path.join(tmpdir, "output_bet.nii.gz"))
+
+
+def _predict_brain_masks_cli(
+    inputs: Sequence[sitk.Image], device: Literal["cpu", "cuda", "mps"], disable_tta: bool, verbose: bool
+) -> list[sitk.Image]:
+    """Predicts brain masks of ``inputs`` by running the ``hd-bet`` command once on a temporary folder."""
+    with temporary_directory() as tmpdir:
+        input_dir = os.path.join(tmpdir, "input")
+        output_dir = os.path.join(tmpdir, "output")
+        os.mkdir(input_dir)
+
+        names = [f"{i:05d}" for i in range(len(inputs))]
+        for name, input in zip(names, inputs):
+            sitk.WriteImage(input, os.path.join(input_dir, f"{name}.nii.gz"))
+
+        run_hd_bet(
+            input = input_dir, output = output_dir,
+            device=device, disable_tta=disable_tta, save_bet_mask=True, no_bet_image=True, verbose=verbose,
+        )
+
+        # HD-BET names each mask after its input with "_bet" postfix
+        return [tositk(os.path.join(output_dir, f"{name}_bet.nii.gz")) for name in names]
+
+
+def _to_mni152(
+    input: sitk.Image, register_to_mni152: Literal["T1", "T2"] | None
+) -> tuple[sitk.Image, SimpleElastix | None]:
+    """Registers ``input`` to MNI152 template of ``register_to_mni152`` modality if it isn't None,
+    returns registered input and registration object to register the mask back with."""
+    if register_to_mni152 is None: return input, None
+
+    # atlas is loaded once per process, its brain mask is used as fixed image mask
+    from ..atlas.atlas import get_mni152_atlas
+    mni152 = get_mni152_atlas(f"2009a {register_to_mni152}w asymmetric", skullstripped=False) # type:ignore
+    reg = SimpleElastix()
+    return reg.find_transform(input, mni152), reg
+
+
+def _from_mni152(brain_mask: sitk.Image, reg: SimpleElastix | None) -> sitk.Image:
+    """Registers ``brain_mask`` predicted in MNI152 space back to the original input."""
+    if reg is None: return brain_mask
+    return reg.apply_inverse_transform(brain_mask, use_nearest_interpolation=True)
+
+
+@traced()
 def predict_brain_mask(
     input: ImageLike,
     register_to_mni152: Literal["T1", "T2"] | None = None,
     device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
     disable_tta: bool = False,
     verbose: bool = False,
+    predictor: HDBetPredictor | None = None,
 ) -> sitk.Image:
     """Returns brain mask of ``input`` predicted by HD-BET.
 
@@ -97,47 +217,85 @@ def predict_brain_mask(
             This will make prediction faster at a slight decrease in prediction quality.
             Recommended for device cpu. Defaults to False.
         verbose (bool, optional): Talk to me. Defaults to False.
+        predictor (HDBetPredictor | None, optional):
+            HD-BET network already loaded in this process, if specified, it predicts the mask instead of
+            the ``hd-bet`` command, and ``device`` and ``disable_tta`` are ignored. Defaults to None.
     """
-    input = tositk(input)
+    input_mni, reg = _to_mni152(tositk(input), register_to_mni152)
 
-    # ---------------------------- register to mni152 ---------------------------- #
-    if register_to_mni152 is not None:
-        from ..atlas.MNI152 import get_mni152
-        mni152 = get_mni152(f"2009a {register_to_mni152}w asymmetric", skullstripped=False) # type:ignore
-        input_mni = register(input, mni152)
+    # ---------------------------- predict brain mask ---------------------------- #
+    if predictor is not None:
+        brain_mask_mni = predictor.predict(input_mni)
 
     else:
-        input_mni = input
+        brain_mask_mni = _predict_brain_mask_cli(input_mni, device=device, disable_tta=disable_tta, verbose=verbose)
 
-    # ---------------------------- predict brain mask ---------------------------- #
-    with tempfile.TemporaryDirectory() as tmpdir:
-        sitk.WriteImage(input_mni, os.path.join(tmpdir, "input.nii.gz"))
+    return _from_mni152(brain_mask_mni, reg)
 
-        run_hd_bet(
-            input = os.path.join(tmpdir, "input.nii.gz"),
-            output = os.path.join(tmpdir, "output.nii.gz"),
-            device=device, disable_tta=disable_tta, save_bet_mask=True, verbose=verbose,
-        )
 
-        brain_mask_mni = tositk(os.path.join(tmpdir, "output_bet.nii.gz"))
+@traced()
+def predict_brain_masks(
+    inputs: Sequence[ImageLike],
+    register_to_mni152: Literal["T1", "T2"] | None = None,
+    device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
+    disable_tta: bool = False,
+    verbose: bool = False,
+    predictor: HDBetPredictor | None = None,
+    chunk_size: int | None = 32,
+) -> list[sitk.Image]:
+    """Returns brain masks of all ``inputs`` predicted by HD-BET, in the same order.
 
-    # ------------------------- unregister mask if needed ------------------------ #
-    if register_to_mni152 is not None:
-        study_mni = dict(image=input_mni, seg_brain=brain_mask_mni)
-        study = register_D(study_mni, key="image", to=input)
-        brain_mask = study["seg_brain"]
+    Unlike calling ``predict_brain_mask`` for each image, inputs are written to one folder
+    and HD-BET runs once per ``chunk_size`` inputs, so its startup and weight loading are paid once per chunk.
 
-    else:
-        brain_mask = brain_mask_mni
+    Args:
+        inputs (Sequence[ImageLike]): inputs to skullstrip. Recommended T1-w, postcontrast T1-w, T2-w or FLAIR sequences in MNI152 space.
+        register_to_mni152 (str | None, optional):
+            Modality of MNI152 template to pre-register each input to. Should be ``"T1"``, ``"T2"`` or ``None``.
+            if specified, inputs will be registered to specified MNI152 template,
+            then after prediction brain masks registered back to original inputs.
+            Note that HD-BET expects images to be in MNI152 space. Defaults to None.
+        device (str, optional):
+            used to set on which device the prediction will run. Can be 'cuda' (=GPU), 'cpu' or 'mps'.
+            Defaults to CUDA_IF_AVAILABLE.
+        disable_tta (bool, optional):
+            Set this flag to disable test time augmentation.
+            This will make prediction faster at a slight decrease in prediction quality.
+            Recommended for device cpu. Defaults to False.
+        verbose (bool, optional): Talk to me. Defaults to False.
+        predictor (HDBetPredictor | None, optional):
+            HD-BET network already loaded in this process, if specified, it predicts the masks instead of
+            the ``hd-bet`` command, and ``device`` and ``disable_tta`` are ignored. Defaults to None.
+        chunk_size (int | None, optional):
+            maximal number of inputs per run of HD-BET, limits disk space of temporary files
+            and number of images held in memory. If None, all inputs are processed in one run. Defaults to 32.
+    """
+    if chunk_size is None: chunk_size = max(len(inputs), 1)
+    if chunk_size < 1: raise RuntimeError(f"chunk_size must be positive, got {chunk_size}")
 
-    return brain_mask
+    brain_masks = []
+    for start in range(0, len(inputs), chunk_size):
+        chunk = [_to_mni152(tositk(i), register_to_mni152) for i in inputs[start: start + chunk_size]]
+        inputs_mni = [input_mni for input_mni, _ in chunk]
 
+        if predictor is not None:
+            brain_masks_mni = [predictor.predict(input_mni) for input_mni in inputs_mni]
+
+        else:
+            brain_masks_mni = _predict_brain_masks_cli(inputs_mni, device=device, disable_tta=disable_tta, verbose=verbose)
+
+        brain_masks.extend(_from_mni152(mask, reg) for mask, (_, reg) in zip(brain_masks_mni, chunk))
+
+    return brain_masks
+
+@traced()
 def skullstrip(
     input: ImageLike,
     register_to_mni152: Literal["T1", "T2"] | None = None,
     device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
     disable_tta: bool = False,
     verbose: bool = False,
+    predictor: HDBetPredictor | None = None,
 
     expand: int = 0,
 ) -> sitk.Image:
@@ -157,6 +315,9 @@ def skullstrip(
             Set this flag to disable test time augmentation. This will make prediction faster
             at a slight decrease in prediction quality. Recommended for device cpu. Defaults to False.
         verbose (bool, optional): Talk to me. Defaults to False.
+        predictor (HDBetPredictor | None, optional):
+            HD-BET network already loaded in this process, if specified, it predicts the mask instead of
+            the ``hd-bet`` command, and ``device`` and ``disable_tta`` are ignored. Defaults to None.
         expand (int, optional):
             Positive values expand brain mask by this many pixels, meaning inner parts of the skull will be included;
             Negative values dilate brain mask by this many pixels, meaning outer parts of the brain will be excluded.
@@ -164,7 +325,7 @@ def skullstrip(
     """
     input = tositk(input)
     mask = predict_brain_mask(input=input, register_to_mni152=register_to_mni152,
-                                  device=device, disable_tta=disable_tta, verbose=verbose)
+                                  device=device, disable_tta=disable_tta, verbose=verbose, predictor=predictor)
 
     if expand != 0:
         mask = expand_binary_mask(mask, expand=expand)
@@ -172,6 +333,7 @@ def skullstrip(
     return apply_mask(input, mask)
 
 
+@traced()
 def skullstrip_D(
     images: Mapping[str, ImageLike],
     key: str,
@@ -179,6 +341,7 @@ def skullstrip_D(
     device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
     disable_tta: bool = False,
     verbose: bool = False,
+    predictor: HDBetPredictor | None = None,
 
     expand: int = 0,
 
@@ -202,6 +365,9 @@ def skullstrip_D(
             Set this flag to disable test time augmentation. This will make prediction faster
             at a slight decrease in prediction quality. Recommended for device cpu. Defaults to False.
         verbose (bool, optional): Talk to me. Defaults to False.
+        predictor (HDBetPredictor | None, optional):
+            HD-BET network already loaded in this process, if specified, it predicts the mask instead of
+            the ``hd-bet`` command, and ``device`` and ``disable_tta`` are ignored. Defaults to None.
         expand (int, optional):
             Positive values expand brain mask by this many pixels, meaning inner parts of the skull will be included;
             Negative values dilate brain mask by this many pixels, meaning outer parts of the brain will be excluded.
@@ -215,8 +381,57 @@ def skullstrip_D(
     images = {k: tositk(v) for k,v in images.items()}
 
     mask = predict_brain_mask(input=images[key], register_to_mni152=register_to_mni152,
-                          device=device, disable_tta=disable_tta, verbose=verbose)
+                          device=device, disable_tta=disable_tta, verbose=verbose, predictor=predictor)
+
+    return _skullstrip_D_with_mask(
+        images, key, mask, expand=expand, include_mask=include_mask, keep_original=keep_original
+    )
 
+
+@traced()
+def skullstrip_D_batch(
+    images: Sequence[Mapping[str, ImageLike]],
+    key: str,
+    register_to_mni152: Literal["T1", "T2"] | None = None,
+    device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
+    disable_tta: bool = False,
+    verbose: bool = False,
+    predictor: HDBetPredictor | None = None,
+    chunk_size: int | None = 32,
+
+    expand: int = 0,
+
+    include_mask: bool = False,
+    keep_original: bool = False,
+) -> list[dict[str, sitk.Image]]:
+    """Same as ``skullstrip_D`` for each dictionary in ``images``, but brain masks are predicted
+    by ``predict_brain_masks``, which runs HD-BET once per ``chunk_size`` dictionaries.
+
+    Args:
+        images (Sequence[Mapping[str, ImageLike]]): dictionaries of images that align with each other, e.g. studies.
+        key (str): key of the image in each dictionary to pass to HD-BET for brain mask prediction.
+        chunk_size (int | None, optional):
+            maximal number of images per run of HD-BET. If None, all images are processed in one run. Defaults to 32.
+
+        Other arguments are the same as in ``skullstrip_D``.
+    """
+    images = [{k: tositk(v) for k,v in d.items()} for d in images]
+
+    masks = predict_brain_masks(
+        [d[key] for d in images], register_to_mni152=register_to_mni152, device=device,
+        disable_tta=disable_tta, verbose=verbose, predictor=predictor, chunk_size=chunk_size,
+    )
+
+    return [
+        _skullstrip_D_with_mask(d, key, mask, expand=expand, include_mask=include_mask, keep_original=keep_original)
+        for d, mask in zip(images, masks)
+    ]
+
+
+def _skullstrip_D_with_mask(
+    images: dict[str, sitk.Image], key: str, mask: sitk.Image, expand: int, include_mask: bool, keep_original: bool
+) -> dict[str, sitk.Image]:
+    """Skullstrips all ``images`` with ``mask`` predicted for ``images[key]``, see ``skullstrip_D``."""
     skullstripped = {}
 
     # include mask before expanding
@@ -2,8 +2,10 @@ import SimpleITK as sitk
 import numpy as np
 
 from ..loading.convert import ImageLike, tositk, tonumpy
+from ..utils.profiling import traced
 
 
+@traced()
 def expand_binary_mask(binary_mask: ImageLike, expand: int) -> sitk.Image:
     """Expand or dilate a binary mask.
 
@@ -23,6 +25,7 @@ def expand_binary_mask(binary_mask: ImageLike, expand: int) -> sitk.Image:
 
     return binary_mask
 
+@traced()
 def apply_mask(image: ImageLike, mask: ImageLike) -> sitk.Image:
     """Applies ``mask`` to ``image``, that is all values where ``mask > 0`` are kept.
 
@@ -1,189 +1,699 @@
-from collections.abc import Mapping, Sequence
-from typing import TYPE_CHECKING, Any
-
-import os
-import numpy as np
-import SimpleITK as sitk
-
-from ..loading.convert import tositk, ImageLike
-
-
-def _default_pmap():
-    """Default parameter maps for registration"""
-    euler = sitk.GetDefaultParameterMap('translation')
-    euler['Transform'] = ['EulerTransform']
-    pmap = sitk.VectorOfParameterMap()
-    pmap.append(sitk.GetDefaultParameterMap("translation"))
-    pmap.append(euler)
-    pmap.append(sitk.GetDefaultParameterMap("rigid"))
-    pmap.append(sitk.GetDefaultParameterMap("affine"))
-    return pmap
-
-class SimpleElastix:
-    """Class for image registration via SimpleElastix.
-
-    Args:
-        pmap (Any, optional): parameter map, if None, uses default parameter map. Defaults to None.
-        log_to_console (bool, optional): if False, disables SimpleElastix logging a lot of stuff to your console. Defaults to False.
-    """
-    def __init__(self, pmap: Any = None, log_to_console=False):
-        if pmap is None: pmap = _default_pmap()
-        self.pmap: sitk.VectorOfParameterMap = pmap
-        self.log_to_console = log_to_console
-
-        # create elastix filter
-        self.elastix = sitk.ElastixImageFilter()
-        if log_to_console: self.elastix.LogToConsoleOn()
-        else: self.elastix.LogToConsoleOff()
-
-        self.elastix.SetParameterMap(self.pmap)
-
-        self._moving = None
-        self._transformed = None
-        self.inverse: "SimpleElastix | None" = None
-
-    def find_transform(self, input: ImageLike, to: ImageLike) -> sitk.Image:
-        """Find a transform that transforms ``input`` to ``to`` and save it to this ``Registration`` object.
-        Returns ``input`` registered to ``to``.
-
-        Args:
-            input (ImageLike): Moving image.
-            to (ImageLike): Fixed image.
-        """
-        if self._transformed is not None:
-            raise RuntimeError("`find_transform` has already been called on this Registration object.")
-
-        self._moving = tositk(input)
-        to = tositk(to)
-
-        self.elastix.SetFixedImage(to)
-        self.elastix.SetMovingImage(self._moving)
-        self.elastix.Execute()
-
-        self._transformed = self.elastix.GetResultImage()
-        return self.elastix.GetResultImage() # return copy
-
-    def apply_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
-        """Applies transform stored in this ``Registration`` object to ``input``.
-
-        You have to use ``find_transform`` method first to find the transform.
-
-        Args:
-            input (ImageLike): Moving image to apply transform to.
-            use_nearest_interpolation (bool, optional):
-                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
-
-        Returns:
-            sitk.Image: transformed ``input``.
-        """
-        if self._transformed is None:
-            raise RuntimeError("First find transform parameters using `find_transform` method.")
-
-        input = tositk(input)
-        input.CopyInformation(self._moving)
-
-        transform = sitk.TransformixImageFilter()
-        tmap = self.elastix.GetTransformParameterMap()
-        if use_nearest_interpolation:
-            for t in tmap:
-                t["ResampleInterpolator"] = ["FinalNearestNeighborInterpolator"]
-
-        transform.SetTransformParameterMap(tmap)
-        transform.SetMovingImage(input)
-        if not self.log_to_console: transform.LogToConsoleOff()
-
-        return transform.Execute()
-
-    def apply_inverse_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
-        """Applies inverse of the transform stored in this ``Registration`` object to ``input``.
-
-        This is done by finding another transform that undoes the current one. Note that this may not be as robust as
-        using other tools like freesurfer (because in SimpleElastix transform inverse is not implemented, and
-        "DisplacementMagnitudePenalty" metric is not included in python build).
-
-        Args:
-            input (ImageLike): input image to apply inverse transform to.
-            use_nearest_interpolation (bool, optional):
-                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
-        """
-        if self.inverse is None:
-            if (self._transformed is None) or (self._moving is None):
-                raise RuntimeError("First find transform parameters using `find_transform` method.")
-            inverse_pmap = self.elastix.GetParameterMap() # this returns a copy
-            # for p in inverse_pmap:
-            #     p["Metric"] = "MeanSquaredDifference" # not implemented
-            self.inverse = SimpleElastix(pmap=inverse_pmap, log_to_console=self.log_to_console)
-            self.inverse.find_transform(
-                input=self._transformed,
-                to=self._moving
-            )
-
-        return self.inverse.apply_transform(input, use_nearest_interpolation=use_nearest_interpolation)
-
-
-def register(input: ImageLike, to: ImageLike, pmap: Any = None, log_to_console=False):
-    """Register ``input`` to ``reference``. Returns ``input`` with the same shape and spatial position as ``reference``
-
-    Registering means finding a transform which alligns ``input`` to match with ``reference``,
-    it will have the same size, orientation, etc. By default this used affine transform.
-
-    This uses ``SimpleITK-SimpleElastix`` which is very robust.
-    Note that if you don't have it installed, you need to uninstall normal SimpleITK
-    and install https://pypi.org/project/SimpleITK-SimpleElastix/, don't worry, it's
-    the same as SimpleITK but it additionally includes SimpleElastix.
-    """
-    reg = SimpleElastix(pmap=pmap, log_to_console=log_to_console)
-    return reg.find_transform(input=input, to=to)
-
-
-def register_D(
-    images: Mapping[str, ImageLike],
-    key: str,
-    to: ImageLike,
-    pmap: Any = None,
-    log_to_console=False,
-) -> dict[str, sitk.Image]:
-    """Register ``images[key]`` to ``reference``, then use that transformation
-    to transform other values in ``images`` that are assumed to be aligned with ``images[key]`` (e.g. segmentation).
-
-    Make sure segmentation with hard edges is under a key that starts with ``"seg"``,
-    it will use nearest neighbour interpolation, otherwise it will mess up the edges.
-    """
-    reg = SimpleElastix(pmap=pmap, log_to_console=log_to_console)
-    registered = {key: reg.find_transform(images[key], to)}
-
-    # process segs last because it sets resample interpolator to nearest
-    for k,v in sorted(list(images.items()), key = lambda x: 1 if x[0].startswith('seg') else 0):
-        if k != key:
-            use_nearest_interpolation = k.startswith('seg')
-            registered[k] = reg.apply_transform(v, use_nearest_interpolation=use_nearest_interpolation)
-
-    return registered
-
-def register_each(
-    images: Mapping[str, ImageLike],
-    key: str,
-    to: "ImageLike | None" = None,
-    pmap: Any = None,
-    log_to_console=False,
-) -> dict[str, sitk.Image]:
-    """Registers all other images to ``images[key]``.
-    If ``to`` is specified, register ``images[key]`` to ``to`` beforehand.
-    Uses SimpleElastix.
-
-    Use this when you have multiple modalities that do not align."""
-    images = {k: tositk(v) for k,v in images.items()}
-
-    input = images[key]
-    if to is not None:
-        to = tositk(to)
-        input_reg = register(input=input, to=to, pmap=pmap, log_to_console=log_to_console)
-    else:
-        input_reg = input
-
-    registered = {key: input_reg}
-    for k,v in images.items():
-        if k != key:
-            registered[k] = register(input=v, to=input_reg, pmap=pmap, log_to_console=log_to_console)
-
-    return registered
+from collections.abc import Mapping, Sequence
+from functools import partial
+from typing import TYPE_CHECKING, Any, Literal
+
+import os
+import re
+import numpy as np
+import SimpleITK as sitk
+
+from ..atlas.atlas import Atlas
+from ..loading.convert import tositk, ImageLike
+from ..utils.parallel import process_map, sitk_threads_per_worker
+from ..utils.profiling import traced
+from ..utils.tempfiles import temporary_directory
+from .spatial import Grid, resample_to_grid
+
+
+PRESETS: dict[str, dict[str, str]] = {
+    "fast": {"NumberOfResolutions": "3", "MaximumNumberOfIterations": "128", "NumberOfSpatialSamples": "1024"},
+    "balanced": {"NumberOfResolutions": "4", "MaximumNumberOfIterations": "256", "NumberOfSpatialSamples": "2048"},
+    "accurate": {"NumberOfResolutions": "4", "MaximumNumberOfIterations": "512", "NumberOfSpatialSamples": "8192"},
+}
+"""parameters that each preset sets in all default parameter maps, ``"balanced"`` is the same as elastix defaults.
+See ``benchmarks/registration.py`` for speed and accuracy of each preset."""
+
+def _default_pmap(
+    initializer: Literal["moments"] | None = None, preset: Literal["fast", "balanced", "accurate"] | None = None
+):
+    """Default parameter maps for registration.
+    With ``initializer="moments"`` translation stages are skipped, since they mostly recover the same offset.
+    ``preset`` sets number of resolutions, iterations and spatial samples of each map, see ``PRESETS``."""
+    if preset is not None and preset not in PRESETS: raise RuntimeError(f"Unknown preset {preset}")
+
+    pmap = sitk.VectorOfParameterMap()
+    if initializer == "moments":
+        maps = [sitk.GetDefaultParameterMap("rigid"), sitk.GetDefaultParameterMap("affine")]
+
+    else:
+        euler = sitk.GetDefaultParameterMap('translation')
+        euler['Transform'] = ['EulerTransform']
+        maps = [sitk.GetDefaultParameterMap("translation"), euler,
+                sitk.GetDefaultParameterMap("rigid"), sitk.GetDefaultParameterMap("affine")]
+
+    for m in maps:
+        if preset is not None:
+            for k, v in PRESETS[preset].items(): m[k] = [v]
+        pmap.append(m)
+    return pmap
+
+def _picklable_pmap(pmap: Any) -> Any:
+    """Converts parameter maps to lists of dictionaries, which unlike SimpleITK parameter maps can be pickled."""
+    if pmap is None or isinstance(pmap, (str, os.PathLike)): return pmap
+    if hasattr(pmap, "keys"): pmap = [pmap]
+    return [{k: tuple(m[k]) for k in m.keys()} for m in pmap]
+
+def _same_information(image: sitk.Image, other: sitk.Image) -> bool:
+    return (image.GetSize() == other.GetSize() and image.GetSpacing() == other.GetSpacing()
+            and image.GetOrigin() == other.GetOrigin() and image.GetDirection() == other.GetDirection())
+
+# result pixel types that transformix can be replaced with ``sitk.Resample`` for
+_RESULT_PIXEL_TYPES = {"float": sitk.sitkFloat32, "double": sitk.sitkFloat64}
+
+_INTERPOLATORS = {
+    "FinalNearestNeighborInterpolator": sitk.sitkNearestNeighbor,
+    "FinalLinearInterpolator": sitk.sitkLinear,
+}
+
+_BSPLINE_INTERPOLATORS = {
+    0: sitk.sitkNearestNeighbor,
+    1: sitk.sitkLinear,
+    2: sitk.sitkBSpline2,
+    3: sitk.sitkBSpline3,
+    4: sitk.sitkBSpline4,
+    5: sitk.sitkBSpline5,
+}
+
+def _floats(tmap, key: str) -> list[float]:
+    return [float(v) for v in tmap[key]]
+
+def _get(tmap, key: str, default: str) -> str:
+    return tmap[key][0] if key in tmap else default
+
+def elastix_to_sitk_transform(tmap) -> sitk.Transform | None:
+    """Converts elastix transform parameter map of a translation, Euler, similarity or affine transform
+    to an equivalent SimpleITK transform. Returns None for other transforms, e.g. B-spline.
+
+    Like elastix transforms, the returned transform maps points from the fixed image to the moving image."""
+    name = tmap["Transform"][0]
+    dim = len(tmap["Size"])
+    params = _floats(tmap, "TransformParameters")
+
+    if name == "TranslationTransform":
+        return sitk.TranslationTransform(dim, params)
+
+    if name == "EulerTransform":
+        if dim == 3:
+            transform = sitk.Euler3DTransform()
+            transform.SetComputeZYX(_get(tmap, "ComputeZYX", "false") == "true")
+        elif dim == 2: transform = sitk.Euler2DTransform()
+        else: return None
+
+    elif name == "SimilarityTransform":
+        if dim == 3: transform = sitk.Similarity3DTransform()
+        elif dim == 2: transform = sitk.Similarity2DTransform()
+        else: return None
+
+    elif name == "AffineTransform":
+        transform = sitk.AffineTransform(dim)
+
+    else:
+        return None
+
+    transform.SetCenter(_floats(tmap, "CenterOfRotationPoint"))
+    transform.SetParameters(params)
+    return transform
+
+def elastix_to_sitk_transforms(tmaps) -> sitk.Transform | None:
+    """Converts a chain of elastix transform parameter maps, e.g. returned by
+    ``sitk.ElastixImageFilter.GetTransformParameterMap()``, to a SimpleITK transform.
+    Returns None if any of the transforms can't be converted by ``elastix_to_sitk_transform``."""
+    transforms = []
+    for tmap in tmaps:
+        if _get(tmap, "HowToCombineTransforms", "Compose") != "Compose": return None
+        transform = elastix_to_sitk_transform(tmap)
+        if transform is None: return None
+        transforms.append(transform)
+
+    # elastix applies the first transform of the chain first, ``CompositeTransform`` applies the last one first.
+    if len(transforms) == 1: return transforms[0]
+    return sitk.CompositeTransform(transforms[::-1])
+
+def invert_linear_transform(transform: sitk.Transform, dim: int) -> sitk.AffineTransform | None:
+    """Returns inverse of a linear ``transform`` (or a composite of linear transforms) as an affine transform,
+    or None if it is not invertible."""
+    # a linear transform is ``x -> matrix @ x + offset``, recover them from images of the origin and basis vectors
+    offset = np.array(transform.TransformPoint((0.0,) * dim))
+    matrix = np.stack([np.array(transform.TransformPoint(tuple(np.eye(dim)[i]))) - offset for i in range(dim)], axis=1)
+
+    try: inverse_matrix = np.linalg.inv(matrix)
+    except np.linalg.LinAlgError: return None
+    if not np.all(np.isfinite(inverse_matrix)): return None
+
+    inverse = sitk.AffineTransform(dim)
+    inverse.SetMatrix(inverse_matrix.ravel().tolist())
+    inverse.SetTranslation((-inverse_matrix @ offset).tolist())
+    return inverse
+
+def elastix_grid(tmap) -> Grid:
+    """Returns grid of the fixed image from elastix transform parameter map, which is the grid of transformed images."""
+    dim = len(tmap["Size"])
+    # elastix stores direction in column-major order
+    direction = np.array(_floats(tmap, "Direction")).reshape(dim, dim).T
+    return Grid(
+        size = tuple(int(v) for v in tmap["Size"]),
+        spacing = tuple(_floats(tmap, "Spacing")),
+        origin = tuple(_floats(tmap, "Origin")),
+        direction = tuple(direction.ravel().tolist()),
+    )
+
+def linear_transform_parameter_map(transform: sitk.Transform, grid: Grid) -> dict[str, tuple[str, ...]]:
+    """Returns elastix affine transform parameter map equivalent to a linear SimpleITK ``transform``
+    (or a composite of linear transforms) which maps points from ``grid`` to the moving image.
+    The map uses 3rd order B-spline interpolation and ``float`` result pixel type, same as elastix defaults."""
+    dim = len(grid.size)
+    # same as in ``invert_linear_transform``, recover matrix and offset from images of the origin and basis vectors
+    offset = np.array(transform.TransformPoint((0.0,) * dim))
+    matrix = np.stack([np.array(transform.TransformPoint(tuple(np.eye(dim)[i]))) - offset for i in range(dim)], axis=1)
+
+    def strs(values) -> tuple[str, ...]: return tuple(repr(float(v)) for v in values)
+    return {
+        "Transform": ("AffineTransform", ),
+        "NumberOfParameters": (str(dim * dim + dim), ),
+        "TransformParameters": strs([*matrix.ravel(), *offset]),
+        "CenterOfRotationPoint": strs([0] * dim),
+        "InitialTransformParametersFileName": ("NoInitialTransform", ),
+        "HowToCombineTransforms": ("Compose", ),
+        "FixedImageDimension": (str(dim), ),
+        "MovingImageDimension": (str(dim), ),
+        "FixedInternalImagePixelType": ("float", ),
+        "MovingInternalImagePixelType": ("float", ),
+        "Size": tuple(str(s) for s in grid.size),
+        "Index": ("0", ) * dim,
+        "Spacing": strs(grid.spacing),
+        "Origin": strs(grid.origin),
+        # elastix stores direction in column-major order
+        "Direction": strs(np.array(grid.direction).reshape(dim, dim).T.ravel()),
+        "UseDirectionCosines": ("true", ),
+        "ResampleInterpolator": ("FinalBSplineInterpolator", ),
+        "FinalBSplineInterpolationOrder": ("3", ),
+        "Resampler": ("DefaultResampler", ),
+        "DefaultPixelValue": ("0", ),
+        "ResultImageFormat": ("nii", ),
+        "ResultImagePixelType": ("float", ),
+    }
+
+def write_parameter_file(pmap: Mapping[str, Sequence[str]], path: str | os.PathLike) -> None:
+    """Writes a parameter map to ``path`` in elastix parameter file format, same as ``sitk.WriteParameterFile``,
+    but doesn't require SimpleElastix. Numbers are written as is and other values are quoted."""
+    lines = []
+    for k, values in pmap.items():
+        tokens = []
+        for v in values:
+            try:
+                float(v)
+                tokens.append(v)
+            except ValueError:
+                tokens.append(f'"{v}"')
+        lines.append(f"({k} {' '.join(tokens)})")
+
+    with open(path, "w", encoding="utf8") as f:
+        f.write("\n".join(lines) + "\n")
+
+def read_parameter_file(path: str | os.PathLike) -> dict[str, tuple[str, ...]]:
+    """Reads elastix parameter file written by ``write_parameter_file`` or by elastix,
+    returns a dictionary with tuples of strings as values, which can be passed to SimpleElastix."""
+    pmap = {}
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            line = line.split("//", 1)[0].strip()
+            if not (line.startswith("(") and line.endswith(")")): continue
+            key, _, values = line[1:-1].strip().partition(" ")
+            pmap[key] = tuple(quoted if quoted else plain for quoted, plain in _TOKEN.findall(values))
+    return pmap
+
+_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+def _resample_with_tmap(
+    input: sitk.Image, tmap, grid: Grid, transform: sitk.Transform, use_nearest_interpolation: bool
+) -> sitk.Image | None:
+    """Resamples ``input`` onto ``grid`` with interpolation and pixel type from the transform parameter map,
+    returns None if they are not supported."""
+    interpolator = sitk.sitkNearestNeighbor if use_nearest_interpolation else _elastix_interpolator(tmap)
+    pixel_type = _RESULT_PIXEL_TYPES.get(_get(tmap, "ResultImagePixelType", "float"), None)
+    use_direction = _get(tmap, "UseDirectionCosines", "true") == "true"
+    if interpolator is None or pixel_type is None or not use_direction: return None
+
+    return resample_to_grid(
+        sitk.Cast(input, pixel_type), grid, transform, interpolator, float(_get(tmap, "DefaultPixelValue", "0"))
+    )
+
+def _transformix(input: sitk.Image, tmaps, use_nearest_interpolation: bool, log_to_console: bool) -> sitk.Image:
+    transform = sitk.TransformixImageFilter()
+    if use_nearest_interpolation:
+        for t in tmaps:
+            t["ResampleInterpolator"] = ["FinalNearestNeighborInterpolator"]
+
+    transform.SetTransformParameterMap(tmaps)
+    transform.SetMovingImage(input)
+    if not log_to_console: transform.LogToConsoleOff()
+
+    # transformix writes result image to the output directory, which defaults to the working directory
+    with temporary_directory() as tmpdir:
+        transform.SetOutputDirectory(tmpdir)
+        return transform.Execute()
+
+@traced()
+def apply_transform_parameter_maps(
+    input: ImageLike,
+    tmaps: Sequence[Mapping[str, Sequence[str]]],
+    use_nearest_interpolation: bool = False,
+    log_to_console: bool = False,
+) -> sitk.Image:
+    """Applies a chain of elastix transform parameter maps to ``input``, e.g. maps returned by
+    ``SimpleElastix.get_transform_parameter_maps`` or stored by ``Study.register_SE``.
+    Returns ``input`` on the grid of the fixed image.
+
+    Translation, Euler, similarity and affine transforms are applied via ``sitk.Resample``,
+    other transforms are applied via Transformix, which requires SimpleITK-SimpleElastix.
+
+    Args:
+        input (ImageLike): image in the space of the moving image.
+        tmaps (Sequence[Mapping[str, Sequence[str]]]): transform parameter maps, the first one is applied first.
+        use_nearest_interpolation (bool, optional):
+            whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
+        log_to_console (bool, optional): if True, Transformix logs to console. Defaults to False.
+    """
+    input = tositk(input)
+    transform = elastix_to_sitk_transforms(tmaps)
+    if transform is not None:
+        transformed = _resample_with_tmap(input, tmaps[-1], elastix_grid(tmaps[-1]), transform, use_nearest_interpolation)
+        if transformed is not None: return transformed
+
+    # copy maps since interpolator is modified in place
+    return _transformix(input, [dict(t) for t in tmaps], use_nearest_interpolation, log_to_console)
+
+def moments_initial_transform(input: ImageLike, to: ImageLike, shrink_factor: int = 4) -> sitk.TranslationTransform:
+    """Returns translation which maps the center of mass of ``to`` to the center of mass of ``input``,
+    computed via ``sitk.CenteredTransformInitializer`` with MOMENTS on copies of the images shrunk by ``shrink_factor``.
+
+    Args:
+        input (ImageLike): Moving image.
+        to (ImageLike): Fixed image.
+        shrink_factor (int, optional): factor to shrink images by, each dimension is kept at 8 voxels or more. Defaults to 4.
+    """
+    input = tositk(input); to = tositk(to)
+    dim = to.GetDimension()
+
+    def shrink(image: sitk.Image) -> sitk.Image:
+        factors = [max(1, min(shrink_factor, s // 8)) for s in image.GetSize()]
+        return sitk.BinShrink(sitk.Cast(image, sitk.sitkFloat32), factors)
+
+    initial = sitk.CenteredTransformInitializer(
+        shrink(to), shrink(input), sitk.Euler3DTransform() if dim == 3 else sitk.Euler2DTransform(),
+        sitk.CenteredTransformInitializerFilter.MOMENTS,
+    )
+    # moments initializer doesn't rotate, so the transform is a translation by the offset between centers of mass
+    return sitk.TranslationTransform(dim, initial.GetTranslation())
+
+def _shift_origin(image: sitk.Image, offset: Sequence[float]) -> sitk.Image:
+    """Returns a copy of ``image`` with ``offset`` added to its origin, this doesn't resample voxels."""
+    image = sitk.Image(image)
+    image.SetOrigin([o + t for o, t in zip(image.GetOrigin(), offset)])
+    return image
+
+def _elastix_interpolator(tmap) -> int | None:
+    interpolator = _get(tmap, "ResampleInterpolator", "FinalBSplineInterpolator")
+    if interpolator in _INTERPOLATORS: return _INTERPOLATORS[interpolator]
+    if interpolator == "FinalBSplineInterpolator":
+        return _BSPLINE_INTERPOLATORS.get(int(_get(tmap, "FinalBSplineInterpolationOrder", "3")), None)
+    return None
+
+class SimpleElastix:
+    """Class for image registration via SimpleElastix.
+
+    Args:
+        pmap (Any, optional): parameter map, if None, uses default parameter map. Defaults to None.
+        log_to_console (bool, optional): if False, disables SimpleElastix logging a lot of stuff to your console. Defaults to False.
+        num_threads (int | None, optional): number of threads elastix uses, if None uses all cores. Defaults to None.
+        initializer (Literal["moments"] | None, optional):
+            if ``"moments"``, the moving image is first moved so that its center of mass matches the fixed image
+            (see ``moments_initial_transform``), and the default parameter map skips translation stages.
+            If None, registration starts from identity transform. Defaults to None.
+        preset (Literal["fast", "balanced", "accurate"] | None, optional):
+            sets number of resolutions, iterations and spatial samples of default parameter maps, see ``PRESETS``.
+            Can't be used together with ``pmap``. If None, uses elastix defaults, same as ``"balanced"``. Defaults to None.
+    """
+    def __init__(
+        self,
+        pmap: Any = None,
+        log_to_console=False,
+        num_threads: int | None = None,
+        initializer: Literal["moments"] | None = None,
+        preset: Literal["fast", "balanced", "accurate"] | None = None,
+    ):
+        if initializer not in (None, "moments"): raise RuntimeError(f"Unknown initializer {initializer}")
+        if pmap is not None and preset is not None: raise RuntimeError("`pmap` and `preset` can't be used together.")
+        if pmap is None: pmap = _default_pmap(initializer, preset)
+        self.pmap: sitk.VectorOfParameterMap = pmap
+        self.log_to_console = log_to_console
+        self.initializer = initializer
+
+        # create elastix filter
+        self.elastix = sitk.ElastixImageFilter()
+        if log_to_console: self.elastix.LogToConsoleOn()
+        else: self.elastix.LogToConsoleOff()
+        if num_threads is not None: self.elastix.SetNumberOfThreads(num_threads)
+
+        self.elastix.SetParameterMap(self.pmap)
+
+        self._moving = None
+        self._transformed = None
+        self._initial_transform: sitk.TranslationTransform | None = None
+        self._transform: sitk.Transform | None = None
+        self._inverse_transform: sitk.Transform | None = None
+        self.inverse: "SimpleElastix | None" = None
+
+    def find_transform(
+        self,
+        input: ImageLike,
+        to: "ImageLike | Atlas",
+        fixed_mask: "ImageLike | None" = None,
+        moving_mask: "ImageLike | None" = None,
+    ) -> sitk.Image:
+        """Find a transform that transforms ``input`` to ``to`` and save it to this ``Registration`` object.
+        Returns ``input`` registered to ``to``.
+
+        Args:
+            input (ImageLike): Moving image.
+            to (ImageLike | Atlas): Fixed image, or an ``Atlas``, then its mask is used as ``fixed_mask``.
+            fixed_mask (ImageLike | None, optional):
+                mask of the fixed image, only voxels inside of it are used to compute the metric.
+                If None and ``to`` is an ``Atlas`` with a mask, uses that mask. Defaults to None.
+            moving_mask (ImageLike | None, optional):
+                mask of the moving image, samples that map outside of it are not used to compute the metric,
+                for example a brain mask of ``input``. Defaults to None.
+        """
+        if self._transformed is not None:
+            raise RuntimeError("`find_transform` has already been called on this Registration object.")
+
+        self._moving = tositk(input)
+        if isinstance(to, Atlas):
+            if fixed_mask is None: fixed_mask = to.mask
+            to = to.image
+        to = tositk(to)
+
+        if fixed_mask is not None:
+            self.elastix.SetFixedMask(sitk.Cast(tositk(fixed_mask) != 0, sitk.sitkUInt8))
+
+        if self.initializer == "moments":
+            # moving the origin of the moving image is the same as starting from the initial translation,
+            # images passed to ``apply_transform`` get the same origin because their information is copied from it
+            self._initial_transform = moments_initial_transform(self._moving, to)
+            self._moving = _shift_origin(self._moving, [-t for t in self._initial_transform.GetOffset()])
+            if moving_mask is not None:
+                moving_mask = _shift_origin(tositk(moving_mask), [-t for t in self._initial_transform.GetOffset()])
+
+        if moving_mask is not None:
+            self.elastix.SetMovingMask(sitk.Cast(tositk(moving_mask) != 0, sitk.sitkUInt8))
+            # elastix erodes the moving mask at each resolution by default,
+            # which at coarse resolutions can leave no valid samples, so erosion is disabled unless set explicitly
+            pmaps = self.elastix.GetParameterMap()
+            for m in pmaps:
+                if "ErodeMovingMask" not in m.keys(): m["ErodeMovingMask"] = ["false"]
+            self.elastix.SetParameterMap(pmaps)
+
+        self.elastix.SetFixedImage(to)
+        self.elastix.SetMovingImage(self._moving)
+        # elastix writes transform parameter files and result images to the output directory,
+        # which defaults to the working directory, so registrations in parallel would overwrite each other's files
+        with temporary_directory() as tmpdir:
+            self.elastix.SetOutputDirectory(tmpdir)
+            self.elastix.Execute()
+
+        self._transformed = self.elastix.GetResultImage()
+        self._transform = elastix_to_sitk_transforms(self.elastix.GetTransformParameterMap())
+        if self._transform is not None:
+            self._inverse_transform = invert_linear_transform(self._transform, self._moving.GetDimension())
+        return self.elastix.GetResultImage() # return copy
+
+    def get_sitk_transform(self) -> sitk.Transform | None:
+        """Returns found transform as a SimpleITK transform which maps points from the fixed image to the moving image,
+        or None if it includes transforms that can't be converted, e.g. B-spline."""
+        if self._transformed is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+        if self._transform is None or self._initial_transform is None: return self._transform
+        return sitk.CompositeTransform([self._initial_transform, self._transform])
+
+    def apply_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
+        """Applies transform stored in this ``Registration`` object to ``input``.
+
+        You have to use ``find_transform`` method first to find the transform.
+
+        Translation, Euler, similarity and affine transforms are applied via ``sitk.Resample``,
+        other transforms are applied via Transformix.
+
+        Args:
+            input (ImageLike): Moving image to apply transform to.
+            use_nearest_interpolation (bool, optional):
+                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
+
+        Returns:
+            sitk.Image: transformed ``input``.
+        """
+        if self._transformed is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+
+        input = tositk(input)
+        if not _same_information(input, self._moving):
+            # copy the image so that its owner's information isn't modified, this doesn't copy voxels
+            input = sitk.Image(input)
+            input.CopyInformation(self._moving)
+
+        tmap = self.elastix.GetTransformParameterMap()
+
+        # linear transforms are applied in memory without running transformix
+        if self._transform is not None:
+            transformed = self._resample_linear(input, elastix_grid(tmap[-1]), self._transform, use_nearest_interpolation)
+            if transformed is not None: return transformed
+
+        return _transformix(input, tmap, use_nearest_interpolation, self.log_to_console)
+
+    def _resample_linear(
+        self, input: sitk.Image, grid: Grid, transform: sitk.Transform, use_nearest_interpolation: bool
+    ) -> sitk.Image | None:
+        return _resample_with_tmap(
+            input, self.elastix.GetTransformParameterMap()[-1], grid, transform, use_nearest_interpolation
+        )
+
+    def get_transform_parameter_maps(self) -> list[dict[str, tuple[str, ...]]]:
+        """Returns found transform as a list of elastix transform parameter maps converted to dictionaries,
+        which can be pickled, saved with ``write_parameter_file`` and applied with ``apply_transform_parameter_maps``
+        to images aligned with the moving image."""
+        if self._transformed is None or self._moving is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+
+        tmaps = _picklable_pmap(self.elastix.GetTransformParameterMap())
+        if self._initial_transform is not None:
+            # the moving image was shifted by the initializer, so its translation is applied after elastix transforms
+            dim = self._moving.GetDimension()
+            initial = {k: v for k, v in tmaps[-1].items() if k != "CenterOfRotationPoint"}
+            initial.update({
+                "Transform": ("TranslationTransform", ),
+                "NumberOfParameters": (str(dim), ),
+                "TransformParameters": tuple(repr(float(v)) for v in self._initial_transform.GetOffset()),
+                "HowToCombineTransforms": ("Compose", ),
+            })
+            tmaps.append(initial)
+        return tmaps
+
+    def _to_original_origin(self, image: sitk.Image) -> sitk.Image:
+        """Moves image in the space of the moving image shifted by the initializer back to the original moving image."""
+        if self._initial_transform is None: return image
+        return _shift_origin(image, self._initial_transform.GetOffset())
+
+    def apply_inverse_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
+        """Applies inverse of the transform stored in this ``Registration`` object to ``input``,
+        returns ``input`` moved back to the space of the moving image.
+
+        Translation, Euler, similarity and affine transforms are inverted analytically.
+        Otherwise the inverse is found by registering the transformed image back to the moving image,
+        note that this may not be as robust as using other tools like freesurfer (because in SimpleElastix
+        transform inverse is not implemented, and "DisplacementMagnitudePenalty" metric is not included in python build).
+
+        Args:
+            input (ImageLike): input image to apply inverse transform to.
+            use_nearest_interpolation (bool, optional):
+                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
+        """
+        if (self._transformed is None) or (self._moving is None):
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+
+        if self._inverse_transform is not None:
+            input = tositk(input)
+            if not _same_information(input, self._transformed):
+                # copy the image so that its owner's information isn't modified, this doesn't copy voxels
+                input = sitk.Image(input)
+                input.CopyInformation(self._transformed)
+
+            inverted = self._resample_linear(
+                input, Grid.from_image(self._moving), self._inverse_transform, use_nearest_interpolation
+            )
+            if inverted is not None: return self._to_original_origin(inverted)
+
+        if self.inverse is None:
+            inverse_pmap = self.elastix.GetParameterMap() # this returns a copy
+            # for p in inverse_pmap:
+            #     p["Metric"] = "MeanSquaredDifference" # not implemented
+            self.inverse = SimpleElastix(pmap=inverse_pmap, log_to_console=self.log_to_console)
+            self.inverse.find_transform(
+                input=self._transformed,
+                to=self._moving
+            )
+
+        return self._to_original_origin(
+            self.inverse.apply_transform(input, use_nearest_interpolation=use_nearest_interpolation)
+        )
+
+
+@traced()
+def register(
+    input: ImageLike,
+    to: "ImageLike | Atlas",
+    pmap: Any = None,
+    log_to_console=False,
+    num_threads: int | None = None,
+    initializer: Literal["moments"] | None = None,
+    fixed_mask: "ImageLike | None" = None,
+    moving_mask: "ImageLike | None" = None,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+):
+    """Register ``input`` to ``reference``. Returns ``input`` with the same shape and spatial position as ``reference``
+
+    Registering means finding a transform which alligns ``input`` to match with ``reference``,
+    it will have the same size, orientation, etc. By default this used affine transform.
+
+    This uses ``SimpleITK-SimpleElastix`` which is very robust.
+    Note that if you don't have it installed, you need to uninstall normal SimpleITK
+    and install https://pypi.org/project/SimpleITK-SimpleElastix/, don't worry, it's
+    the same as SimpleITK but it additionally includes SimpleElastix.
+
+    Set ``initializer="moments"`` to start from a translation that matches centers of mass
+    and use a shorter default chain, see ``SimpleElastix``.
+
+    ``to`` can be an ``Atlas``, then its brain mask is used as ``fixed_mask``, see ``SimpleElastix.find_transform``.
+    Masks restrict the metric to voxels inside of them, which is faster and ignores air and skull.
+
+    ``preset`` is one of ``"fast"``, ``"balanced"`` and ``"accurate"``, see ``PRESETS``.
+    """
+    reg = SimpleElastix(
+        pmap=pmap, log_to_console=log_to_console, num_threads=num_threads, initializer=initializer, preset=preset
+    )
+    return reg.find_transform(input=input, to=to, fixed_mask=fixed_mask, moving_mask=moving_mask)
+
+
+def _register_with_transform(
+    input: ImageLike,
+    to: "ImageLike | Atlas",
+    pmap: Any = None,
+    log_to_console=False,
+    num_threads: int | None = None,
+    initializer: Literal["moments"] | None = None,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> tuple[sitk.Image, list[dict[str, tuple[str, ...]]]]:
+    """Same as ``register``, but also returns transform parameter maps of the found transform."""
+    reg = SimpleElastix(
+        pmap=pmap, log_to_console=log_to_console, num_threads=num_threads, initializer=initializer, preset=preset
+    )
+    registered = reg.find_transform(input=input, to=to)
+    return registered, reg.get_transform_parameter_maps()
+
+
+@traced()
+def register_D(
+    images: Mapping[str, ImageLike],
+    key: str,
+    to: "ImageLike | Atlas",
+    pmap: Any = None,
+    log_to_console=False,
+    initializer: Literal["moments"] | None = None,
+    fixed_mask: "ImageLike | None" = None,
+    include_transform: bool = False,
+    moving_mask: "ImageLike | None" = None,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> dict[str, sitk.Image | Any]:
+    """Register ``images[key]`` to ``reference``, then use that transformation
+    to transform other values in ``images`` that are assumed to be aligned with ``images[key]`` (e.g. segmentation).
+
+    Make sure segmentation with hard edges is under a key that starts with ``"seg"``,
+    it will use nearest neighbour interpolation, otherwise it will mess up the edges.
+
+    ``to`` can be an ``Atlas``, then its brain mask is used as ``fixed_mask``, see ``SimpleElastix.find_transform``.
+
+    If ``include_transform`` is True, adds ``f"info_transform_{key}"`` with transform parameter maps
+    (see ``SimpleElastix.get_transform_parameter_maps``) to returned dictionary.
+
+    ``moving_mask`` is a mask of ``images[key]``, and ``preset`` is one of ``"fast"``, ``"balanced"`` and ``"accurate"``,
+    see ``register``.
+    """
+    reg = SimpleElastix(pmap=pmap, log_to_console=log_to_console, initializer=initializer, preset=preset)
+    registered = {key: reg.find_transform(images[key], to, fixed_mask=fixed_mask, moving_mask=moving_mask)}
+
+    # process segs last because it sets resample interpolator to nearest
+    for k,v in sorted(list(images.items()), key = lambda x: 1 if x[0].startswith('seg') else 0):
+        if k != key:
+            use_nearest_interpolation = k.startswith('seg')
+            registered[k] = reg.apply_transform(v, use_nearest_interpolation=use_nearest_interpolation)
+
+    if include_transform: registered[f"info_transform_{key}"] = reg.get_transform_parameter_maps()
+    return registered
+
+@traced()
+def register_each(
+    images: Mapping[str, ImageLike],
+    key: str,
+    to: "ImageLike | Atlas | None" = None,
+    pmap: Any = None,
+    log_to_console=False,
+    max_workers: int | None = None,
+    initializer: Literal["moments"] | None = None,
+    include_transform: bool = False,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> dict[str, sitk.Image | Any]:
+    """Registers all other images to ``images[key]``.
+    If ``to`` is specified, register ``images[key]`` to ``to`` beforehand.
+    Uses SimpleElastix.
+
+    Use this when you have multiple modalities that do not align.
+
+    Args:
+        max_workers: if more than 1, other images are registered in parallel in a process pool with this many workers,
+            and each worker gets ``cpu_count // max_workers`` elastix threads. Defaults to None.
+        initializer: initializer for all registrations, see ``SimpleElastix``. Defaults to None.
+        include_transform: if True, adds ``f"info_transform_{k}"`` with transform parameter maps
+            of each registered image to returned dictionary. Defaults to False.
+        preset: preset for all registrations, see ``SimpleElastix``. Defaults to None.
+    """
+    images = {k: tositk(v) for k,v in images.items()}
+
+    input = images[key]
+    transforms = {}
+    if to is not None:
+        input_reg, transforms[key] = _register_with_transform(
+            input=input, to=to, pmap=pmap, log_to_console=log_to_console, initializer=initializer, preset=preset
+        )
+    else:
+        input_reg = input
+
+    # registrations are independent once the reference is fixed
+    num_threads = None
+    if max_workers is not None and max_workers > 1:
+        num_threads = sitk_threads_per_worker(min(max_workers, len(images) - 1))
+
+    pmap = _picklable_pmap(pmap)
+    tasks = {
+        k: partial(
+            _register_with_transform, input=v, to=input_reg, pmap=pmap, log_to_console=log_to_console,
+            num_threads=num_threads, initializer=initializer, preset=preset,
+        )
+        for k, v in images.items() if k != key
+    }
+
+    registered = {key: input_reg}
+    for k, (image, tmaps) in process_map(tasks, max_workers=max_workers).items():
+        registered[k] = image
+        transforms[k] = tmaps
+
+    registered = {k: registered[k] for k in images}
+    if include_transform: registered.update({f"info_transform_{k}": transforms[k] for k in images if k in transforms})
+    return registered
@@ -0,0 +1,404 @@
+"""Image registration via ``sitk.ImageRegistrationMethod``, which is included in stock SimpleITK.
+
+This has the same ``register``, ``register_D`` and ``register_each`` functions as ``simple_elastix``,
+and can be used when SimpleITK-SimpleElastix can't be installed. Registration is multi-resolution,
+with Mattes mutual information computed on a random subset of voxels, which is multi-threaded by SimpleITK.
+"""
+import math
+from collections.abc import Mapping, Sequence
+from functools import partial
+from types import ModuleType
+from typing import Any, Literal
+
+import SimpleITK as sitk
+
+from ..atlas.atlas import Atlas
+from ..loading.convert import tositk, ImageLike
+from ..utils.parallel import process_map, sitk_threads_per_worker
+from ..utils.profiling import traced
+from .simple_elastix import invert_linear_transform, linear_transform_parameter_map, moments_initial_transform
+from .spatial import Grid, resample_to_grid
+
+_MIN_SAMPLES = 2000
+"""minimal number of voxels sampled to compute the metric at each resolution level"""
+
+PRESETS: dict[str, dict[str, Any]] = {
+    "fast": dict(shrink_factors=(4, 2), smoothing_sigmas=(2, 1), sampling_percentage=0.02, number_of_iterations=100),
+    "balanced": dict(shrink_factors=(4, 2, 1), smoothing_sigmas=(2, 1, 0), sampling_percentage=0.05, number_of_iterations=300),
+    "accurate": dict(shrink_factors=(8, 4, 2, 1), smoothing_sigmas=(4, 2, 1, 0), sampling_percentage=0.1, number_of_iterations=500),
+}
+"""arguments of ``SitkRegistration`` that each preset sets, ``"balanced"`` is the same as defaults.
+See ``benchmarks/registration.py`` for speed and accuracy of each preset."""
+
+
+def get_backend(backend: Literal["auto", "elastix", "sitk"] = "auto") -> ModuleType:
+    """Returns module with ``register``, ``register_D`` and ``register_each`` functions for ``backend``.
+
+    Args:
+        backend: ``"elastix"`` for ``simple_elastix``, ``"sitk"`` for ``sitk_registration``,
+            ``"auto"`` for ``simple_elastix`` if SimpleElastix is installed, otherwise ``sitk_registration``.
+    """
+    from . import simple_elastix, sitk_registration
+    if backend == "auto": backend = "elastix" if hasattr(sitk, "ElastixImageFilter") else "sitk"
+    if backend == "elastix": return simple_elastix
+    if backend == "sitk": return sitk_registration
+    raise RuntimeError(f"Unknown registration backend {backend}")
+
+
+def _initial_transform(dim: int, initial: sitk.TranslationTransform | None, center: Sequence[float]) -> sitk.Euler3DTransform | sitk.Euler2DTransform:
+    transform = sitk.Euler3DTransform() if dim == 3 else sitk.Euler2DTransform()
+    transform.SetCenter(center)
+    if initial is not None: transform.SetTranslation(initial.GetOffset())
+    return transform
+
+def _to_affine(transform: sitk.Transform, dim: int) -> sitk.AffineTransform:
+    affine = sitk.AffineTransform(dim)
+    affine.SetCenter(transform.GetCenter())
+    affine.SetMatrix(transform.GetMatrix())
+    affine.SetTranslation(transform.GetTranslation())
+    return affine
+
+
+class SitkRegistration:
+    """Class for image registration via ``sitk.ImageRegistrationMethod``, same interface as ``SimpleElastix``.
+
+    Registration runs rigid and then, if ``transform="affine"``, affine stage, each at all resolutions
+    from ``shrink_factors``. Results are resampled with 3rd order B-spline interpolation to ``sitk.sitkFloat32``,
+    same as SimpleElastix defaults.
+
+    Args:
+        transform (Literal["rigid", "affine"], optional): final transform type. Defaults to "affine".
+        log_to_console (bool, optional): if True, prints metric value at each iteration. Defaults to False.
+        num_threads (int | None, optional): number of threads, if None uses all cores. Defaults to None.
+        initializer (Literal["moments"] | None, optional):
+            if ``"moments"``, starts from translation that matches centers of mass, otherwise starts
+            from identity transform. Defaults to "moments".
+        shrink_factors (Sequence[int], optional): shrink factors of each resolution level. Defaults to (4, 2, 1).
+        smoothing_sigmas (Sequence[float], optional): smoothing sigmas in voxels of each resolution level. Defaults to (2, 1, 0).
+        sampling_percentage (float, optional):
+            fraction of voxels used to compute the metric, levels with few voxels use at least 2000 voxels. Defaults to 0.05.
+        number_of_iterations (int, optional): maximal number of iterations at each resolution level. Defaults to 300.
+        max_step (float, optional): initial optimizer step in millimeters. Defaults to 2.0.
+        number_of_histogram_bins (int, optional): number of histogram bins for Mattes mutual information. Defaults to 32.
+        seed (int, optional):
+            seed for metric sampling, so that results are reproducible. 0 is ``sitk.sitkWallClock``,
+            which seeds from the clock so that each run samples different voxels. Defaults to 1.
+        preset (Literal["fast", "balanced", "accurate"] | None, optional):
+            if specified, overrides ``shrink_factors``, ``smoothing_sigmas``, ``sampling_percentage``
+            and ``number_of_iterations`` with values from ``PRESETS``. Defaults to None.
+    """
+    def __init__(
+        self,
+        transform: Literal["rigid", "affine"] = "affine",
+        log_to_console=False,
+        num_threads: int | None = None,
+        initializer: Literal["moments"] | None = "moments",
+        shrink_factors: Sequence[int] = (4, 2, 1),
+        smoothing_sigmas: Sequence[float] = (2, 1, 0),
+        sampling_percentage: float = 0.05,
+        number_of_iterations: int = 300,
+        max_step: float = 2.0,
+        number_of_histogram_bins: int = 32,
+        seed: int = 1,
+        preset: Literal["fast", "balanced", "accurate"] | None = None,
+    ):
+        if transform not in ("rigid", "affine"): raise RuntimeError(f"Unknown transform {transform}")
+        if initializer not in (None, "moments"): raise RuntimeError(f"Unknown initializer {initializer}")
+        if preset is not None:
+            if preset not in PRESETS: raise RuntimeError(f"Unknown preset {preset}")
+            shrink_factors = PRESETS[preset]["shrink_factors"]
+            smoothing_sigmas = PRESETS[preset]["smoothing_sigmas"]
+            sampling_percentage = PRESETS[preset]["sampling_percentage"]
+            number_of_iterations = PRESETS[preset]["number_of_iterations"]
+        if len(shrink_factors) != len(smoothing_sigmas):
+            raise RuntimeError(f"Got {len(shrink_factors)} shrink factors and {len(smoothing_sigmas)} smoothing sigmas.")
+
+        self.transform = transform
+        self.log_to_console = log_to_console
+        self.num_threads = num_threads
+        self.initializer = initializer
+        self.shrink_factors = list(shrink_factors)
+        self.smoothing_sigmas = list(smoothing_sigmas)
+        self.sampling_percentage = sampling_percentage
+        self.number_of_iterations = number_of_iterations
+        self.max_step = max_step
+        self.number_of_histogram_bins = number_of_histogram_bins
+        self.seed = seed
+
+        self._moving: sitk.Image | None = None
+        self._grid: Grid | None = None
+        self._transform: sitk.Transform | None = None
+        self._inverse_transform: sitk.Transform | None = None
+
+    def _sampling_percentages(self, fixed: sitk.Image) -> list[float]:
+        """Sampling percentage of each resolution level, increased on small levels so that they get
+        at least ``_MIN_SAMPLES`` samples, otherwise registration of small images often diverges."""
+        percentages = []
+        for factor in self.shrink_factors:
+            num_voxels = math.prod(max(1, math.ceil(s / factor)) for s in fixed.GetSize())
+            percentages.append(min(1.0, max(self.sampling_percentage, _MIN_SAMPLES / num_voxels)))
+        return percentages
+
+    def _registration_method(
+        self, fixed: sitk.Image, fixed_mask: sitk.Image | None, moving_mask: sitk.Image | None
+    ) -> sitk.ImageRegistrationMethod:
+        method = sitk.ImageRegistrationMethod()
+        method.SetMetricAsMattesMutualInformation(numberOfHistogramBins=self.number_of_histogram_bins)
+        method.SetMetricSamplingStrategy(method.RANDOM)
+        method.SetMetricSamplingPercentagePerLevel(self._sampling_percentages(fixed), self.seed)
+        if fixed_mask is not None: method.SetMetricFixedMask(fixed_mask)
+        if moving_mask is not None: method.SetMetricMovingMask(moving_mask)
+        method.SetInterpolator(sitk.sitkLinear)
+
+        # step starts at ``max_step`` mm and is halved each time the gradient changes direction,
+        # plain gradient descent with estimated learning rate oscillates by several millimeters
+        method.SetOptimizerAsRegularStepGradientDescent(
+            learningRate=self.max_step, minStep=1e-4, numberOfIterations=self.number_of_iterations,
+            relaxationFactor=0.5, gradientMagnitudeTolerance=1e-8,
+        )
+        method.SetOptimizerScalesFromPhysicalShift()
+
+        method.SetShrinkFactorsPerLevel(self.shrink_factors)
+        method.SetSmoothingSigmasPerLevel(self.smoothing_sigmas)
+        method.SmoothingSigmasAreSpecifiedInPhysicalUnitsOff()
+
+        if self.num_threads is not None: method.SetNumberOfThreads(self.num_threads)
+        if self.log_to_console:
+            method.AddCommand(sitk.sitkIterationEvent, lambda: print(
+                f"level {method.GetCurrentLevel()}, iteration {method.GetOptimizerIteration()}: {method.GetMetricValue():.5f}"
+            ))
+        return method
+
+    def find_transform(
+        self,
+        input: ImageLike,
+        to: "ImageLike | Atlas",
+        fixed_mask: "ImageLike | None" = None,
+        moving_mask: "ImageLike | None" = None,
+    ) -> sitk.Image:
+        """Find a transform that transforms ``input`` to ``to`` and save it to this object.
+        Returns ``input`` registered to ``to``.
+
+        Args:
+            input (ImageLike): Moving image.
+            to (ImageLike | Atlas): Fixed image, or an ``Atlas``, then its mask is used as ``fixed_mask``.
+            fixed_mask (ImageLike | None, optional):
+                mask of the fixed image, only voxels inside of it are used to compute the metric.
+                If None and ``to`` is an ``Atlas`` with a mask, uses that mask. Defaults to None.
+            moving_mask (ImageLike | None, optional):
+                mask of the moving image, samples that map outside of it are not used to compute the metric.
+                Defaults to None.
+        """
+        if self._transform is not None:
+            raise RuntimeError("`find_transform` has already been called on this Registration object.")
+
+        self._moving = tositk(input)
+        if isinstance(to, Atlas):
+            if fixed_mask is None: fixed_mask = to.mask
+            to = to.image
+        to = tositk(to)
+        if fixed_mask is not None: fixed_mask = sitk.Cast(tositk(fixed_mask) != 0, sitk.sitkUInt8)
+        if moving_mask is not None: moving_mask = sitk.Cast(tositk(moving_mask) != 0, sitk.sitkUInt8)
+
+        dim = to.GetDimension()
+        fixed = sitk.Cast(to, sitk.sitkFloat32)
+        moving = sitk.Cast(self._moving, sitk.sitkFloat32)
+
+        initial = moments_initial_transform(moving, fixed) if self.initializer == "moments" else None
+        center = fixed.TransformContinuousIndexToPhysicalPoint([(s - 1) / 2 for s in fixed.GetSize()])
+        transform: sitk.Transform = _initial_transform(dim, initial, center)
+
+        stages = [transform]
+        if self.transform == "affine": stages.append(None)
+        for stage in stages:
+            if stage is None: stage = _to_affine(transform, dim)
+            method = self._registration_method(fixed, fixed_mask, moving_mask)
+            method.SetInitialTransform(stage, inPlace=True)
+            method.Execute(fixed, moving)
+            transform = stage
+
+        self._grid = Grid.from_image(to)
+        self._transform = transform
+        self._inverse_transform = invert_linear_transform(transform, dim)
+        return self.apply_transform(self._moving)
+
+    def get_sitk_transform(self) -> sitk.Transform:
+        """Returns found transform which maps points from the fixed image to the moving image."""
+        if self._transform is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+        return self._transform
+
+    def get_transform_parameter_maps(self) -> list[dict[str, tuple[str, ...]]]:
+        """Returns found transform as a list with one elastix affine transform parameter map,
+        same format as ``SimpleElastix.get_transform_parameter_maps``."""
+        if self._transform is None or self._grid is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+        return [linear_transform_parameter_map(self._transform, self._grid)]
+
+    def apply_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
+        """Applies transform stored in this object to ``input``, which must be aligned with the moving image.
+
+        Args:
+            input (ImageLike): Moving image to apply transform to.
+            use_nearest_interpolation (bool, optional):
+                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
+        """
+        if self._transform is None or self._grid is None or self._moving is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+
+        input = tositk(input)
+        input = sitk.Image(input)
+        input.CopyInformation(self._moving)
+        if use_nearest_interpolation:
+            return resample_to_grid(input, self._grid, self._transform, sitk.sitkNearestNeighbor)
+        return resample_to_grid(sitk.Cast(input, sitk.sitkFloat32), self._grid, self._transform, sitk.sitkBSpline3)
+
+    def apply_inverse_transform(self, input: ImageLike, use_nearest_interpolation: bool = False) -> sitk.Image:
+        """Applies inverse of the transform stored in this object to ``input``,
+        returns ``input`` moved back to the space of the moving image.
+
+        Args:
+            input (ImageLike): input image to apply inverse transform to.
+            use_nearest_interpolation (bool, optional):
+                whether to use nearest interpolation, enable when transforming segmentations. Defaults to False.
+        """
+        if self._transform is None or self._grid is None or self._moving is None:
+            raise RuntimeError("First find transform parameters using `find_transform` method.")
+        if self._inverse_transform is None:
+            raise RuntimeError("Found transform is not invertible.")
+
+        input = tositk(input)
+        grid = Grid.from_image(self._moving)
+        if use_nearest_interpolation:
+            return resample_to_grid(input, grid, self._inverse_transform, sitk.sitkNearestNeighbor)
+        return resample_to_grid(sitk.Cast(input, sitk.sitkFloat32), grid, self._inverse_transform, sitk.sitkBSpline3)
+
+
+@traced()
+def register(
+    input: ImageLike,
+    to: "ImageLike | Atlas",
+    transform: Literal["rigid", "affine"] = "affine",
+    log_to_console=False,
+    num_threads: int | None = None,
+    initializer: Literal["moments"] | None = "moments",
+    fixed_mask: "ImageLike | None" = None,
+    moving_mask: "ImageLike | None" = None,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+):
+    """Register ``input`` to ``to`` via ``sitk.ImageRegistrationMethod``.
+    Returns ``input`` with the same shape and spatial position as ``to``.
+
+    ``to`` can be an ``Atlas``, then its brain mask is used as ``fixed_mask``.
+    See ``SitkRegistration`` and ``SitkRegistration.find_transform`` for arguments.
+    """
+    reg = SitkRegistration(
+        transform=transform, log_to_console=log_to_console, num_threads=num_threads, initializer=initializer, preset=preset
+    )
+    return reg.find_transform(input=input, to=to, fixed_mask=fixed_mask, moving_mask=moving_mask)
+
+
+def _register_with_transform(
+    input: ImageLike,
+    to: "ImageLike | Atlas",
+    transform: Literal["rigid", "affine"] = "affine",
+    log_to_console=False,
+    num_threads: int | None = None,
+    initializer: Literal["moments"] | None = "moments",
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> tuple[sitk.Image, list[dict[str, tuple[str, ...]]]]:
+    """Same as ``register``, but also returns transform parameter maps of the found transform."""
+    reg = SitkRegistration(
+        transform=transform, log_to_console=log_to_console, num_threads=num_threads, initializer=initializer, preset=preset
+    )
+    registered = reg.find_transform(input=input, to=to)
+    return registered, reg.get_transform_parameter_maps()
+
+
+@traced()
+def register_D(
+    images: Mapping[str, ImageLike],
+    key: str,
+    to: "ImageLike | Atlas",
+    transform: Literal["rigid", "affine"] = "affine",
+    log_to_console=False,
+    initializer: Literal["moments"] | None = "moments",
+    fixed_mask: "ImageLike | None" = None,
+    include_transform: bool = False,
+    moving_mask: "ImageLike | None" = None,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> dict[str, sitk.Image | Any]:
+    """Register ``images[key]`` to ``to``, then use that transformation
+    to transform other values in ``images`` that are assumed to be aligned with ``images[key]`` (e.g. segmentation).
+
+    Images under keys that start with ``"seg"`` use nearest neighbour interpolation.
+    If ``include_transform`` is True, adds ``f"info_transform_{key}"`` with transform parameter maps
+    (see ``SitkRegistration.get_transform_parameter_maps``) to returned dictionary.
+    ``moving_mask`` is a mask of ``images[key]``. See ``SitkRegistration`` for other arguments.
+    """
+    reg = SitkRegistration(transform=transform, log_to_console=log_to_console, initializer=initializer, preset=preset)
+    registered = {key: reg.find_transform(images[key], to, fixed_mask=fixed_mask, moving_mask=moving_mask)}
+
+    for k, v in images.items():
+        if k != key:
+            registered[k] = reg.apply_transform(v, use_nearest_interpolation=k.startswith("seg"))
+
+    if include_transform: registered[f"info_transform_{key}"] = reg.get_transform_parameter_maps()
+    return registered
+
+
+@traced()
+def register_each(
+    images: Mapping[str, ImageLike],
+    key: str,
+    to: "ImageLike | Atlas | None" = None,
+    transform: Literal["rigid", "affine"] = "affine",
+    log_to_console=False,
+    max_workers: int | None = None,
+    initializer: Literal["moments"] | None = "moments",
+    include_transform: bool = False,
+    preset: Literal["fast", "balanced", "accurate"] | None = None,
+) -> dict[str, sitk.Image | Any]:
+    """Registers all other images to ``images[key]``.
+    If ``to`` is specified, register ``images[key]`` to ``to`` beforehand.
+
+    Use this when you have multiple modalities that do not align.
+
+    Args:
+        max_workers: if more than 1, other images are registered in parallel in a process pool with this many workers,
+            and each worker gets ``cpu_count // max_workers`` threads. Defaults to None.
+        include_transform: if True, adds ``f"info_transform_{k}"`` with transform parameter maps
+            of each registered image to returned dictionary. Defaults to False.
+        preset: preset for all registrations, see ``SitkRegistration``. Defaults to None.
+    """
+    images = {k: tositk(v) for k,v in images.items()}
+
+    input = images[key]
+    transforms = {}
+    if to is not None:
+        input_reg, transforms[key] = _register_with_transform(
+            input=input, to=to, transform=transform, log_to_console=log_to_console, initializer=initializer, preset=preset
+        )
+    else:
+        input_reg = input
+
+    num_threads = None
+    if max_workers is not None and max_workers > 1:
+        num_threads = sitk_threads_per_worker(min(max_workers, len(images) - 1))
+
+    tasks = {
+        k: partial(
+            _register_with_transform, input=v, to=input_reg, transform=transform, log_to_console=log_to_console,
+            num_threads=num_threads, initializer=initializer, preset=preset,
+        )
+        for k, v in images.items() if k != key
+    }
+
+    registered = {key: input_reg}
+    for k, (image, tmaps) in process_map(tasks, max_workers=max_workers).items():
+        registered[k] = image
+        transforms[k] = tmaps
+
+    registered = {k: registered[k] for k in images}
+    if include_transform: registered.update({f"info_transform_{k}": transforms[k] for k in images if k in transforms})
+    return registered
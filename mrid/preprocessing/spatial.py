@@ -1,12 +1,53 @@
 from collections.abc import Mapping, Sequence
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import numpy as np
 import SimpleITK as sitk
 
 from ..loading.convert import tositk, ImageLike
-
-
+from ..utils.profiling import traced
+
+
+class Grid(NamedTuple):
+    """Spatial grid of an image - size, spacing, origin and direction, without any voxels."""
+    size: tuple[int, ...]
+    spacing: tuple[float, ...]
+    origin: tuple[float, ...]
+    direction: tuple[float, ...]
+
+    @classmethod
+    def from_image(cls, image: sitk.Image) -> "Grid":
+        return cls(
+            size=tuple(image.GetSize()),
+            spacing=tuple(image.GetSpacing()),
+            origin=tuple(image.GetOrigin()),
+            direction=tuple(image.GetDirection()),
+        )
+
+    def index_to_physical(self, index: Sequence[float]) -> np.ndarray:
+        """Same as ``sitk.Image.TransformContinuousIndexToPhysicalPoint``."""
+        dimension = len(self.size)
+        direction = np.array(self.direction).reshape(dimension, dimension)
+        return np.array(self.origin) + direction @ (np.asarray(index, dtype=np.float64) * np.array(self.spacing))
+
+
+def resample_to_grid(
+    input: ImageLike,
+    grid: Grid,
+    transform: sitk.Transform | None = None,
+    interpolation=sitk.sitkLinear,
+    default_value: float = 0.0,
+) -> sitk.Image:
+    """Resample ``input`` onto ``grid``, ``transform`` maps points from ``grid`` to ``input``."""
+    input = tositk(input)
+    if transform is None: transform = sitk.Transform()
+    return sitk.Resample(
+        input, grid.size, transform, interpolation, grid.origin, grid.spacing, grid.direction,
+        default_value, input.GetPixelID(),
+    )
+
+
+@traced()
 def resample_to(input: ImageLike, to: ImageLike, interpolation=sitk.sitkNearestNeighbor) -> sitk.Image:
     """Resample ``input`` to ``reference``.
 
@@ -19,64 +60,75 @@ def resample_to(input: ImageLike, to: ImageLike, interpolation=sitk.sitkNearestN
     return sitk.Resample(tositk(input), tositk(to), sitk.Transform(), interpolation)
 
 
-def resize(img: ImageLike, new_size: Sequence[int], interpolator=sitk.sitkLinear) -> sitk.Image:
-    """Resize ``sitk.Image`` to ``new_size``. Retains correct spatial information.
-    source: https://gist.github.com/lixinqi98/1bbd3596492f20b776fed2778f7cd48c"""
-    img = tositk(img)
+def resize_grid(grid: Grid, new_size: Sequence[int]) -> tuple[Grid, sitk.Transform]:
+    """Returns grid of ``grid`` resized to ``new_size`` and a transform from the new grid to ``grid``,
+    without touching any voxels. ``sitk.Resample`` with those gives the same result as ``resize``."""
     new_size = list(reversed(new_size))
-
-    # img = sitk.ReadImage(img)
-    dimension = img.GetDimension()
+    dimension = len(grid.size)
 
     # Physical image size corresponds to the largest physical size in the training set, or any other arbitrary size.
     reference_physical_size = np.zeros(dimension)
 
     reference_physical_size[:] = [(sz - 1) * spc if sz * spc > mx else mx for sz, spc, mx in
-                                  zip(img.GetSize(), img.GetSpacing(), reference_physical_size)]
+                                  zip(grid.size, grid.spacing, reference_physical_size)]
 
-    # Create the reference image with a zero origin, identity direction cosine matrix and dimension
+    # Create the reference grid with a zero origin, identity direction cosine matrix and dimension
     reference_origin = np.zeros(dimension)
     reference_direction = np.identity(dimension).flatten()
     reference_size = new_size
     reference_spacing = [phys_sz / (sz - 1) for sz, phys_sz in zip(reference_size, reference_physical_size)]
 
-    reference_image = sitk.Image(reference_size, img.GetPixelIDValue())
-    reference_image.SetOrigin(reference_origin)
-    reference_image.SetSpacing(reference_spacing)
-    reference_image.SetDirection(reference_direction)
+    reference_grid = Grid(
+        size=tuple(int(s) for s in reference_size),
+        spacing=tuple(float(s) for s in reference_spacing),
+        origin=tuple(float(o) for o in reference_origin),
+        direction=tuple(float(d) for d in reference_direction),
+    )
 
-    # Always use the TransformContinuousIndexToPhysicalPoint to compute an indexed point's physical coordinates as
+    # Always use the index_to_physical to compute an indexed point's physical coordinates as
     # this takes into account size, spacing and direction cosines. For the vast majority of images the direction
     # cosines are the identity matrix, but when this isn't the case simply multiplying the central index by the
     # spacing will not yield the correct coordinates resulting in a long debugging session.
-    reference_center = np.array(
-        reference_image.TransformContinuousIndexToPhysicalPoint(np.array(reference_image.GetSize()) / 2.0))
+    reference_center = reference_grid.index_to_physical(np.array(reference_grid.size) / 2.0)
 
-    # Transform which maps from the reference_image to the current img with the translation mapping the image
+    # Transform which maps from the reference grid to the current grid with the translation mapping the image
     # origins to each other.
     transform = sitk.AffineTransform(dimension)
-    transform.SetMatrix(img.GetDirection())
-    transform.SetTranslation(np.array(img.GetOrigin()) - reference_origin)
+    transform.SetMatrix(grid.direction)
+    transform.SetTranslation(np.array(grid.origin) - reference_origin)
     # Modify the transformation to align the centers of the original and reference image instead of their origins.
     centering_transform = sitk.TranslationTransform(dimension)
-    img_center = np.array(img.TransformContinuousIndexToPhysicalPoint(np.array(img.GetSize()) / 2.0))
+    img_center = grid.index_to_physical(np.array(grid.size) / 2.0)
     centering_transform.SetOffset(np.array(transform.GetInverse().TransformPoint(img_center) - reference_center))
 
     # centered_transform = sitk.Transform(transform)
     # centered_transform.AddTransform(centering_transform)
 
     centered_transform = sitk.CompositeTransform([transform, centering_transform])
+    return reference_grid, centered_transform
+
+
+@traced()
+def resize(img: ImageLike, new_size: Sequence[int], interpolator=sitk.sitkLinear) -> sitk.Image:
+    """Resize ``sitk.Image`` to ``new_size``. Retains correct spatial information.
+    source: https://gist.github.com/lixinqi98/1bbd3596492f20b776fed2778f7cd48c"""
+    img = tositk(img)
+    reference_grid, centered_transform = resize_grid(Grid.from_image(img), new_size)
 
     # Using the linear interpolator as these are intensity images, if there is a need to resample a ground truth
     # segmentation then the segmentation image should be resampled using the NearestNeighbor interpolator so that
     # no new labels are introduced.
+    return resample_to_grid(img, reference_grid, centered_transform, interpolator)
+
 
-    return sitk.Resample(img, reference_image, centered_transform, interpolator, 0.0)
+def downsample_size(size: Sequence[int], factor: float, dims: int | Sequence[int] | None) -> list[int]:
+    """Returns numpy-ordered ``size`` downsampled by ``factor`` along ``dims``."""
+    if isinstance(dims, int): dims = (dims, )
+    return [round(s/factor) if (dims is None or i in dims) else s for i,s in enumerate(size)]
 
+@traced()
 def downsample(image:ImageLike, factor:float, dims: int | Sequence[int] | None, interpolator=sitk.sitkLinear) -> sitk.Image:
     """factor = 2 for 2x downsampling"""
-    if isinstance(dims, int): dims = (dims, )
     image = tositk(image)
-    size = sitk.GetArrayFromImage(image).shape
-    size = [round(s/factor) if (dims is None or i in dims) else s for i,s in enumerate(size)]
+    size = downsample_size(image.GetSize()[::-1], factor=factor, dims=dims)
     return resize(image, size, interpolator=interpolator)
\ No newline at end of file
@@ -10,15 +10,24 @@ Pick one and run it, this will download a script file which installs synthstrip
 if it isn't installed, and provides a command-line interface for it.
 
 Pass path to the script to mrid functions in this module.
+
+To skullstrip many images, pass a ``SynthStripWorker`` instead of the path,
+it starts SynthStrip once and passes images to it, instead of starting the script (and the container) for each image.
+
+Images are passed to SynthStrip as uncompressed ``.nii`` files in the scratch directory,
+see ``mrid.utils.set_scratch_dir``.
 """
+import json
 import os
 import subprocess
-import tempfile
-from collections.abc import Mapping
+import threading
+from collections.abc import Mapping, Sequence
 
 import SimpleITK as sitk
 
 from ..loading import ImageLike, tositk
+from ..utils.profiling import run_subprocess, traced
+from ..utils.tempfiles import temporary_directory
 from .mask import apply_mask, expand_binary_mask
 
 # Running SynthStrip version 1.8 from Docker
@@ -58,6 +67,39 @@ def _verify_input(value, t: type, name: str):
         if not isinstance(value, t):
             raise TypeError(f"`{name}` should be {t} or None, got {type(value)}")
 
+def _synthstrip_args(
+    image: str | os.PathLike,
+    out: str | os.PathLike | None,
+    mask: str | os.PathLike | None = None,
+    sdt: str | os.PathLike | None = None,
+    gpu: bool | None = None,
+    border: int | None = None,
+    threads: int | None = None,
+    fill: int | None = None,
+    no_csf: bool | None = None,
+    model: str | os.PathLike | None = None,
+) -> list[str]:
+    """Command-line arguments of ``mri_synthstrip``, see ``run_synthstrip``."""
+    # verify inputs that go into subprocess
+    _verify_input(border, int, "border")
+    _verify_input(threads, int, "threads")
+    _verify_input(fill, int, "fill")
+
+    args = ["-i", os.path.normpath(image)]
+
+    if out is not None: args.extend(["-o", os.path.normpath(out)])
+    if mask is not None: args.extend(["-m", os.path.normpath(mask)])
+    if sdt is not None: args.extend(["-d", os.path.normpath(sdt)])
+    if gpu is not None: args.append("-g")
+    if border is not None: args.extend(["-b", f"{border}"])
+    if threads is not None: args.extend(["-t", f"{threads}"])
+    if fill is not None: args.extend(["-f", f"{fill}"])
+    if no_csf is not None: args.append("--no_csf")
+    if model is not None: args.extend(["--model", os.path.normpath(model)])
+
+    return args
+
+@traced()
 def run_synthstrip(
     synthstrip_script_path: str | os.PathLike,
     image: str | os.PathLike,
@@ -87,35 +129,161 @@ def run_synthstrip(
         no_csf (bool | None, optional): exclude CSF from brain border.
         model (str | os.PathLike | None, optional): alternative model weights
     """
-    # verify inputs that go into subprocess
-    _verify_input(border, int, "border")
-    _verify_input(threads, int, "threads")
-    _verify_input(fill, int, "fill")
-
-    command = [
-        "python",
-        os.path.normpath(synthstrip_script_path),
-        "-i", os.path.normpath(image),
-    ]
-
-    if out is not None: command.extend(["-o", os.path.normpath(out)])
-    if mask is not None: command.extend(["-m", os.path.normpath(mask)])
-    if sdt is not None: command.extend(["-d", os.path.normpath(sdt)])
-    if gpu is not None: command.append("-g")
-    if border is not None: command.extend(["-b", f"{border}"])
-    if threads is not None: command.extend(["-t", f"{threads}"])
-    if fill is not None: command.extend(["-f", f"{fill}"])
-    if no_csf is not None: command.append("--no_csf")
-    if model is not None: command.extend(["--model", os.path.normpath(model)])
+    command = ["python", os.path.normpath(synthstrip_script_path)]
+    command.extend(_synthstrip_args(
+        image=image, out=out, mask=mask, sdt=sdt, gpu=gpu, border=border,
+        threads=threads, fill=fill, no_csf=no_csf, model=model,
+    ))
 
     # run
     if verbose:
-        subprocess.run(command, check=True)
+        run_subprocess(command, check=True)
     else:
-        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        run_subprocess(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synthstrip_worker.py")
+"""path to the script that ``SynthStripWorker`` runs in the SynthStrip environment, see ``synthstrip_worker.py``."""
+
+class SynthStripWorker:
+    """SynthStrip process that is started once and skullstrips many images.
+
+    ``command`` should start ``WORKER_SCRIPT`` with python of the SynthStrip environment, or any program
+    that follows its protocol: JSON lines with ``mri_synthstrip`` arguments on stdin, JSON replies on stdout.
+    Images are passed as files in ``shared_dir``, so they have to be accessible to the worker at the same paths.
+    The process is started on first use and runs until ``close`` is called.
+    This saves starting python, importing torch and starting the container for each image,
+    and model weights are read once by the worker and reused for all images, see ``synthstrip_worker.py``.
+
+    Pass it instead of ``synthstrip_script_path`` to functions in this module and to ``Study.skullstrip_synthstrip``,
+    then their ``verbose`` argument is ignored, output is controlled by ``verbose`` of the worker.
+
+    Example:
+        with FreeSurfer installed:
+        ```python
+        worker = SynthStripWorker.from_script("/usr/local/freesurfer/bin/mri_synthstrip")
+        ```
+        with Docker, the worker script and the shared directory are mounted into the container:
+        ```python
+        worker = SynthStripWorker(
+            ["docker", "run", "-i", "--rm", "-v", f"{shared}:{shared}", "-v", f"{WORKER_SCRIPT}:/worker.py",
+            "--entrypoint", "python3", "freesurfer/synthstrip:1.8", "/worker.py", "/freesurfer/mri_synthstrip"],
+            shared_dir=shared,
+        )
+        ```
+
+    Args:
+        command (Sequence[str]): command that starts the worker.
+        shared_dir (str | os.PathLike | None, optional):
+            directory for images passed to and from the worker.
+            If None, the system temporary directory is used. Defaults to None.
+        verbose (bool, optional): if False, output of the worker is discarded. Defaults to True.
+    """
+    def __init__(self, command: Sequence[str | os.PathLike], shared_dir: str | os.PathLike | None = None, verbose: bool = True):
+        self.command = [os.fspath(c) for c in command]
+        self.shared_dir = None if shared_dir is None else os.path.abspath(shared_dir)
+        self.verbose = verbose
+
+        self._process: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_script(
+        cls,
+        synthstrip_path: str | os.PathLike,
+        python: str | os.PathLike = "python",
+        shared_dir: str | os.PathLike | None = None,
+        verbose: bool = True,
+    ) -> "SynthStripWorker":
+        """Worker that runs ``mri_synthstrip`` script at ``synthstrip_path`` with ``python`` executable,
+        for example when FreeSurfer is installed. Docker and Apptainer wrapper scripts can be used too,
+        but they start the container for each image, to start it once run the worker inside the container."""
+        return cls([python, WORKER_SCRIPT, os.path.normpath(synthstrip_path)], shared_dir=shared_dir, verbose=verbose)
+
+    def __repr__(self):
+        return f"SynthStripWorker({self.command!r}, shared_dir={self.shared_dir!r})"
+
+    def __reduce__(self):
+        # a copy in another process starts its own worker
+        return (SynthStripWorker, (self.command, self.shared_dir, self.verbose))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self) -> None:
+        """Starts the worker process if it isn't running."""
+        if self._process is not None and self._process.poll() is None: return
+        self._process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=None if self.verbose else subprocess.DEVNULL, text=True, bufsize=1,
+        )
 
+    def close(self) -> None:
+        """Stops the worker process, it will be started again on next use."""
+        with self._lock:
+            process, self._process = self._process, None
+            if process is None: return
+
+            assert process.stdin is not None
+            process.stdin.close()
+            try: process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    @traced()
+    def run(self, args: Sequence[str]) -> None:
+        """Runs SynthStrip in the worker with ``mri_synthstrip`` command-line ``args``."""
+        with self._lock:
+            self.start()
+            process = self._process
+            assert process is not None and process.stdin is not None and process.stdout is not None
+
+            try:
+                process.stdin.write(json.dumps({"args": list(args)}) + "\n")
+                process.stdin.flush()
+                line = process.stdout.readline()
+            except OSError:
+                line = ""
+
+            if len(line) == 0:
+                self._process = None
+                raise RuntimeError(f"SynthStrip worker exited with code {process.wait()}, command: {self.command}")
+
+        reply = json.loads(line)
+        if not reply["ok"]: raise RuntimeError(f"SynthStrip worker failed:\n{reply.get('error')}")
+
+    def predict_brain_mask(
+        self,
+        image: ImageLike,
+        gpu: bool | None = None,
+        border: int | None = None,
+        threads: int | None = None,
+        model: str | os.PathLike | None = None,
+    ) -> sitk.Image:
+        """Returns brain mask of ``image`` predicted by the worker, see ``predict_brain_mask``."""
+        image = tositk(image)
+        with temporary_directory(dir=self.shared_dir) as tmpdir:
+            sitk.WriteImage(image, os.path.join(tmpdir, "image.nii"))
+
+            self.run(_synthstrip_args(
+                image=os.path.join(tmpdir, "image.nii"),
+                out=None,
+                mask=os.path.join(tmpdir, "synthstrip_mask.nii"),
+                gpu=gpu,
+                border=border,
+                threads=threads,
+                model=model,
+            ))
+
+            return tositk(os.path.join(tmpdir, "synthstrip_mask.nii"))
+
+
+@traced()
 def predict_brain_mask(
-    synthstrip_script_path: str | os.PathLike,
+    synthstrip_script_path: str | os.PathLike | SynthStripWorker,
     image: ImageLike,
     gpu: bool | None = None,
     border: int | None = None,
@@ -126,22 +294,28 @@ def predict_brain_mask(
     """Returns brain mask of ``input`` predicted by ``synthstrip``.
 
     Args:
-        synthstrip_script_path (str | os.PathLike): path to synthstrip script.
+        synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+            path to synthstrip script, or a ``SynthStripWorker`` to run it in.
         image (ImageLike): image to predict brain mask of.
         gpu (bool | None, optional): use the GPU, defaults to False if unset.
         border (int | None, optional): mask border threshold in mm, defaults to 1 if unset.
         threads (int | None, optional): PyTorch CPU threads, PyTorch default if unset.
         model (str | os.PathLike | None, optional): alternative model weights
+        verbose (bool, optional): if False, output of SynthStrip is discarded. Ignored when a worker is passed,
+            then its own ``verbose`` is used. Defaults to True.
     """
+    if isinstance(synthstrip_script_path, SynthStripWorker):
+        return synthstrip_script_path.predict_brain_mask(image, gpu=gpu, border=border, threads=threads, model=model)
+
     image = tositk(image)
-    with tempfile.TemporaryDirectory() as tmpdir:
-        sitk.WriteImage(image, os.path.join(tmpdir, "image.nii.gz"))
+    with temporary_directory() as tmpdir:
+        sitk.WriteImage(image, os.path.join(tmpdir, "image.nii"))
 
         run_synthstrip(
             synthstrip_script_path=synthstrip_script_path,
-            image=os.path.join(tmpdir, "image.nii.gz"),
+            image=os.path.join(tmpdir, "image.nii"),
             out=None,
-            mask=os.path.join(tmpdir, "synthstrip_mask.nii.gz"),
+            mask=os.path.join(tmpdir, "synthstrip_mask.nii"),
             gpu=gpu,
             border=border,
             threads=threads,
@@ -149,12 +323,48 @@ def predict_brain_mask(
             verbose=verbose,
         )
 
-        brain_mask = tositk(os.path.join(tmpdir, "synthstrip_mask.nii.gz"))
+        brain_mask = tositk(os.path.join(tmpdir, "synthstrip_mask.nii"))
 
     return brain_mask
 
+@traced()
+def predict_brain_masks(
+    synthstrip_script_path: str | os.PathLike | SynthStripWorker,
+    images: Sequence[ImageLike],
+    gpu: bool | None = None,
+    border: int | None = None,
+    threads: int | None = None,
+    model: str | os.PathLike | None = None,
+    verbose: bool = True,
+) -> list[sitk.Image]:
+    """Returns brain masks of all ``images`` predicted by ``synthstrip``, in the same order.
+
+    All images are processed by one ``SynthStripWorker``, so SynthStrip environment starts
+    and model weights are loaded once. If ``synthstrip_script_path`` is a path, a worker that runs that script
+    is started for this call, to run a container once for all images pass a worker started in the container,
+    see ``SynthStripWorker``.
+
+    Args:
+        synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+            path to synthstrip script, or a ``SynthStripWorker`` to run it in.
+        images (Sequence[ImageLike]): images to predict brain masks of.
+        gpu (bool | None, optional): use the GPU, defaults to False if unset.
+        border (int | None, optional): mask border threshold in mm, defaults to 1 if unset.
+        threads (int | None, optional): PyTorch CPU threads, PyTorch default if unset.
+        model (str | os.PathLike | None, optional): alternative model weights
+        verbose (bool, optional): if False, output of SynthStrip is discarded. Ignored when a worker is passed,
+            then its own ``verbose`` is used. Defaults to True.
+    """
+    if isinstance(synthstrip_script_path, SynthStripWorker):
+        worker = synthstrip_script_path
+        return [worker.predict_brain_mask(image, gpu=gpu, border=border, threads=threads, model=model) for image in images]
+
+    with SynthStripWorker.from_script(synthstrip_script_path, verbose=verbose) as worker:
+        return predict_brain_masks(worker, images, gpu=gpu, border=border, threads=threads, model=model)
+
+@traced()
 def skullstrip(
-    synthstrip_script_path: str | os.PathLike,
+    synthstrip_script_path: str | os.PathLike | SynthStripWorker,
     image: ImageLike,
     gpu: bool | None = None,
     border: int | None = None,
@@ -166,7 +376,8 @@ def skullstrip(
     """Skullstrips ``input`` using synthstrip.
 
     Args:
-        synthstrip_script_path (str | os.PathLike): path to synthstrip script.
+        synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+            path to synthstrip script, or a ``SynthStripWorker`` to run it in.
         image (ImageLike): image to skullstrip.
         gpu (bool | None, optional): use the GPU, defaults to False if unset.
         border (int | None, optional): mask border threshold in mm, defaults to 1 if unset.
@@ -197,8 +408,9 @@ def skullstrip(
 
 
 
+@traced()
 def skullstrip_D(
-    synthstrip_script_path: str | os.PathLike,
+    synthstrip_script_path: str | os.PathLike | SynthStripWorker,
     images: Mapping[str, ImageLike],
     key: str,
     gpu: bool | None = None,
@@ -216,7 +428,8 @@ def skullstrip_D(
     """Predicts brain mask of ``images[key]`` using synthstrip, then uses this mask to skull strip all values in ``images``.
 
     Args:
-        synthstrip_script_path (str | os.PathLike): path to synthstrip script.
+        synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+            path to synthstrip script, or a ``SynthStripWorker`` to run it in.
         images (Mapping[str, ImageLike]): dictionary of images that align with each other.
         key (str): key of the image to pass to HD-BET for brain mask prediction.
         gpu (bool | None, optional): use the GPU, defaults to False if unset.
@@ -245,6 +458,59 @@ def skullstrip_D(
         model=model,
         verbose=verbose,
     )
+    return _skullstrip_D_with_mask(
+        images, key, mask, expand=expand, include_mask=include_mask, keep_original=keep_original
+    )
+
+
+@traced()
+def skullstrip_D_batch(
+    synthstrip_script_path: str | os.PathLike | SynthStripWorker,
+    images: Sequence[Mapping[str, ImageLike]],
+    key: str,
+    gpu: bool | None = None,
+    border: int | None = None,
+    threads: int | None = None,
+    model: str | os.PathLike | None = None,
+    expand: int = 0,
+
+    include_mask: bool = False,
+    keep_original: bool = False,
+
+    verbose: bool = True,
+) -> list[dict[str, sitk.Image]]:
+    """Same as ``skullstrip_D`` for each dictionary in ``images``,
+    but brain masks are predicted by ``predict_brain_masks`` in one SynthStrip worker.
+
+    Args:
+        synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+            path to synthstrip script, or a ``SynthStripWorker`` to run it in.
+        images (Sequence[Mapping[str, ImageLike]]): dictionaries of images that align with each other, e.g. studies.
+        key (str): key of the image in each dictionary to pass to synthstrip for brain mask prediction.
+
+        Other arguments are the same as in ``skullstrip_D``.
+    """
+    images = [{k: tositk(v) for k,v in d.items()} for d in images]
+
+    masks = predict_brain_masks(
+        synthstrip_script_path=synthstrip_script_path,
+        images=[d[key] for d in images],
+        gpu=gpu,
+        border=border,
+        threads=threads,
+        model=model,
+        verbose=verbose,
+    )
+    return [
+        _skullstrip_D_with_mask(d, key, mask, expand=expand, include_mask=include_mask, keep_original=keep_original)
+        for d, mask in zip(images, masks)
+    ]
+
+
+def _skullstrip_D_with_mask(
+    images: dict[str, sitk.Image], key: str, mask: sitk.Image, expand: int, include_mask: bool, keep_original: bool
+) -> dict[str, sitk.Image]:
+    """Skullstrips all ``images`` with ``mask`` predicted for ``images[key]``, see ``skullstrip_D``."""
     skullstripped = {}
 
     # include mask before expanding
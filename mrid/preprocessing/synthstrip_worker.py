@@ -0,0 +1,99 @@
+"""Worker that runs SynthStrip on many images in one process, used by ``mrid.preprocessing.synthstrip.SynthStripWorker``.
+
+This file doesn't import mrid, it is meant to be run by python of the SynthStrip environment, e.g. inside its container:
+
+```
+python synthstrip_worker.py /path/to/mri_synthstrip
+```
+
+Each line of stdin is a JSON object ``{"args": [...]}`` with command-line arguments of ``mri_synthstrip``,
+for example ``{"args": ["-i", "/shared/image.nii.gz", "-m", "/shared/mask.nii.gz"]}``,
+input and output images are files in a directory shared with mrid.
+For each line the worker writes one JSON line to stdout, ``{"ok": true}`` or ``{"ok": false, "error": "..."}``.
+Output of SynthStrip itself goes to stderr, file descriptor 1 is redirected while it runs, so this includes
+output of C extensions and subprocesses, such as wrapper scripts that start a container.
+
+``mri_synthstrip`` is executed in this process with ``runpy``, so python startup, imports of torch
+and starting a container happen once, not once per image. ``mri_synthstrip`` parses its arguments and builds
+the model at module level, so it can't be imported and called as a function, instead when torch is installed,
+``torch.load`` is replaced with a version that returns the same checkpoint for the same unchanged file,
+so model weights are read once and only copied into a new model for each image.
+"""
+import functools
+import importlib.util
+import json
+import os
+import runpy
+import sys
+import traceback
+from contextlib import contextmanager
+
+
+@contextmanager
+def _stdout_to_stderr():
+    """Redirects file descriptor 1 to stderr, unlike ``contextlib.redirect_stdout``
+    this also affects C extensions and subprocesses."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def _cache_torch_load():
+    """Makes ``torch.load`` of a file path return the checkpoint loaded on the first call with the same arguments,
+    until the file is modified. Does nothing if torch is not installed, e.g. in an environment of a wrapper script."""
+    if importlib.util.find_spec("torch") is None: return
+    import torch
+
+    load = torch.load
+    checkpoints = {}
+
+    @functools.wraps(load)
+    def cached_load(f, *args, **kwargs):
+        if not isinstance(f, (str, os.PathLike)): return load(f, *args, **kwargs)
+        stat = os.stat(f)
+        key = (os.path.abspath(f), stat.st_size, stat.st_mtime_ns, repr(args), repr(sorted(kwargs.items())))
+        if key not in checkpoints: checkpoints[key] = load(f, *args, **kwargs)
+        return checkpoints[key]
+
+    torch.load = cached_load
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit("usage: python synthstrip_worker.py /path/to/mri_synthstrip")
+
+    script = sys.argv[1]
+    # replies are written to a duplicate of stdout, so that stdout itself can be redirected
+    protocol = os.fdopen(os.dup(1), "w")
+    _cache_torch_load()
+
+    for line in sys.stdin:
+        if len(line.strip()) == 0: continue
+
+        try:
+            sys.argv = [script, *json.loads(line)["args"]]
+            # SynthStrip prints progress, which would break the protocol on stdout
+            with _stdout_to_stderr():
+                runpy.run_path(script, run_name="__main__")
+            reply = {"ok": True}
+
+        except SystemExit as e:
+            # argparse and scripts that finish with ``exit``
+            if e.code in (None, 0): reply = {"ok": True}
+            else: reply = {"ok": False, "error": f"mri_synthstrip exited with {e.code}"}
+
+        except Exception: # pylint:disable=broad-exception-caught
+            reply = {"ok": False, "error": traceback.format_exc()}
+
+        protocol.write(json.dumps(reply) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    main()
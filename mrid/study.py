@@ -1,10 +1,11 @@
 import os
 import pickle
+import re
 import shutil
-import tempfile
 import warnings
 from collections import UserDict
 from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import Executor
 from functools import partial
 from typing import TYPE_CHECKING, Any, Literal, overload
 
@@ -12,15 +13,56 @@ import numpy as np
 import SimpleITK as sitk
 
 from . import preprocessing
+from .cache import cached
 from .loading.convert import ImageLike, tonumpy, tositk, totensor
+from .loading.lazy_image import FileImage, ImageHeader, LazyImage, MemmapImage, save_memmap_image
 from .utils.torch_utils import CUDA_IF_AVAILABLE
+from .utils.parallel import thread_map
+from .utils.profiling import traced_methods
 from .utils.sitk_utils import sitk_apply_numpy
+from .utils.tempfiles import temporary_directory
 
 if TYPE_CHECKING:
     import torch
 
-def _identity(x): return x
-
+    from .atlas import Atlas
+    from .lazy import LazyStudy
+
+def _apply_sitk(fn: Callable[[sitk.Image], Any], image: sitk.Image) -> sitk.Image:
+    return tositk(fn(image))
+
+def _registration_backend_name(backend: str) -> str:
+    """Returns name of the module that registers with ``backend``, used to resolve ``"auto"`` for the cache."""
+    return preprocessing.sitk_registration.get_backend(backend).__name__ # type:ignore
+
+def _registration_kwargs(backend: str, pmap: Any, initializer: str | None, preset: str | None = None) -> dict[str, Any]:
+    """Keyword arguments for registration functions of ``backend``, arguments that are None use backend defaults."""
+    kwargs = {}
+    if pmap is not None:
+        if preprocessing.sitk_registration.get_backend(backend) is not preprocessing.simple_elastix:
+            raise RuntimeError("`pmap` is only supported by \"elastix\" registration backend.")
+        kwargs["pmap"] = pmap
+    if initializer is not None: kwargs["initializer"] = initializer
+    if preset is not None: kwargs["preset"] = preset
+    return kwargs
+
+def _is_parameter_maps(value: Any) -> bool:
+    """Whether ``value`` is a list of transform parameter maps stored by ``Study.register_SE``."""
+    return isinstance(value, (list, tuple)) and all(isinstance(v, Mapping) for v in value)
+
+def _write_image(image: sitk.Image, path: str, ext: str, use_compression: bool, compression_level: int):
+    if path.isascii():
+        sitk.WriteImage(image, path, useCompression=use_compression, compressionLevel=compression_level)
+        return
+
+    # SimpleITK may fail to write to paths with non ascii chars,
+    # so write to a temporary directory first and then move the file
+    with temporary_directory() as temp_path:
+        temp_file = os.path.join(temp_path, f"image.{ext}")
+        sitk.WriteImage(image, temp_file, useCompression=use_compression, compressionLevel=compression_level)
+        shutil.move(temp_file, path)
+
+@traced_methods("study")
 class Study(UserDict[str, sitk.Image | Any]):
     """A dictionary of scans, segmentations and other info.
 
@@ -56,6 +98,37 @@ class Study(UserDict[str, sitk.Image | Any]):
 
         super().__init__(proc)
 
+    @classmethod
+    def _from_images(cls, dict: "Mapping[str, sitk.Image | Any]") -> "Study":
+        """Creates a study from ``dict`` whose values are already ``sitk.Image`` (or info), without converting them.
+        Values are not copied, ``sitk.Image`` copies its voxels on write so sharing them between studies is safe."""
+        study = cls.__new__(cls)
+        study.data = dict # pyright:ignore[reportAttributeAccessIssue]
+        return study
+
+    def copy(self) -> "Study":
+        """Returns a shallow copy of this study, images are shared."""
+        return self._from_images(self.data.copy())
+
+    def __getitem__(self, key: str) -> "sitk.Image | Any":
+        item = super().__getitem__(key)
+        # images saved with ``format="mmap"`` are loaded on first access
+        if isinstance(item, LazyImage): return item.load()
+        return item
+
+    def _view(self, key: str) -> np.ndarray:
+        """Returns a read-only view of voxels of ``study[key]``, lazy images are not loaded."""
+        item = self.data[key]
+        if isinstance(item, LazyImage): return item.view()
+        return sitk.GetArrayViewFromImage(item)
+
+    def get_header(self, key: str) -> ImageHeader:
+        """Returns size, spacing, origin, direction and pixel type of ``study[key]``.
+        Images loaded with ``lazy=True`` or ``format="mmap"`` are not loaded."""
+        item = self.data[key]
+        if isinstance(item, LazyImage): return item.header()
+        return ImageHeader.from_image(item)
+
     def __setitem__(self, key: str, item: "ImageLike | Any") -> None:
         if not key.startswith("info"): item = tositk(item)
         return super().__setitem__(key, item)
@@ -69,16 +142,16 @@ class Study(UserDict[str, sitk.Image | Any]):
             reference_key (str | None, optional):
                 if specified, ``item`` will have SimpleITK attributes copied from ``self[reference_key]``. Defaults to None.
         """
-        study = self.copy()
         if key.startswith('info'):
             if reference_key: raise RuntimeError(f"Can't copy sitk attributes for an non-image item {key}")
-            study[key] = item
-            return study
+            return self._from_images({**self.data, key: item})
 
-        item = tositk(item)
-        if reference_key is not None: item.CopyInformation(study[reference_key])
-        study[key] = item
-        return study
+        if reference_key is not None:
+            # copy the image so that its owner's information isn't modified, this doesn't copy voxels
+            item = sitk.Image(item) if isinstance(item, sitk.Image) else tositk(item)
+            item.CopyInformation(self[reference_key])
+
+        return self._from_images({**self.data, key: tositk(item)})
 
     def remove(self, *keys: str | Sequence[str]):
         """Returns a new study without specified keys"""
@@ -87,29 +160,50 @@ class Study(UserDict[str, sitk.Image | Any]):
             if isinstance(k, str): keys_proc.append(k)
             else: keys_proc.extend(k)
 
-        study = self.copy()
         for k in keys_proc:
-            del study[k]
+            if k not in self.data: raise KeyError(k)
 
-        return study
+        return self._from_images({k: v for k, v in self.data.items() if k not in keys_proc})
 
     def get_scans(self):
-        """Returns a new ``Study`` with segmentations and info removed."""
-        return self.__class__({k:v for k,v in self.items() if not k.startswith(("seg", "info"))})
+        """Returns a new ``Study`` with segmentations and info removed. Images are shared with this study."""
+        return self._from_images({k:v for k,v in self.data.items() if not k.startswith(("seg", "info"))})
 
     def get_images(self):
-        """Returns a new ``Study`` with info removed."""
-        return self.__class__({k:v for k,v in self.items() if not k.startswith("info")})
+        """Returns a new ``Study`` with info removed. Images are shared with this study."""
+        return self._from_images({k:v for k,v in self.data.items() if not k.startswith("info")})
 
     def get_segmentations(self):
-        """Returns a new ``Study`` with scans and info removed."""
-        return self.__class__({k:v for k,v in self.items() if k.startswith("seg")})
+        """Returns a new ``Study`` with scans and info removed. Images are shared with this study."""
+        return self._from_images({k:v for k,v in self.data.items() if k.startswith("seg")})
 
     def get_info(self):
         """Returns a new ``Study`` with scans and segmentations removed."""
-        return self.__class__({k:v for k,v in self.items() if k.startswith("info")})
+        return self._from_images({k:v for k,v in self.data.items() if k.startswith("info")})
+
+    def lazy(self) -> "LazyStudy":
+        """Returns a ``LazyStudy`` which records operations into a plan instead of running them right away.
+
+        When the plan is computed via ``compute()``, adjacent geometric steps (``resize``, ``downsample``,
+        ``center_crop_or_pad``, ``resample_to``, ``register_SE``) are fused into a single resampling per image,
+        and adjacent intensity steps (``apply``, ``apply_numpy``, ``cast``, ``normalize``, ``rescale_intensity``)
+        are applied in one pass per image. Other methods compute the plan first.
 
-    def apply(self, fn:Callable[[sitk.Image], sitk.Image] | None, seg_fn: Callable[[sitk.Image], sitk.Image] | None,) -> "Study":
+        Example:
+            ```python
+            study = study.lazy().center_crop_or_pad([192, 224, 192]).resize([96, 112, 96]).compute()
+            ```
+        """
+        from .lazy import LazyStudy
+        return LazyStudy(self)
+
+    def apply(
+        self,
+        fn:Callable[[sitk.Image], sitk.Image] | None,
+        seg_fn: Callable[[sitk.Image], sitk.Image] | None,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
+    ) -> "Study":
         """Returns a new ``Study`` with ``fn`` applied to scans and ``seg_fn`` applied to segmentations.
 
         Args:
@@ -117,16 +211,27 @@ class Study(UserDict[str, sitk.Image | Any]):
                 If None, identity function is used.
             seg_fn: Function to apply to segmentation images. Must take and return ``sitk.Image``.
                 If None, identity function is used.
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
-        if fn is None: fn = _identity
-        if seg_fn is None: seg_fn = _identity
+        # images that are not changed are shared with this study
+        tasks = {}
+        if fn is not None:
+            tasks.update({k: partial(_apply_sitk, fn, v) for k,v in self.get_scans().items()})
 
-        scans = {k: fn(v) for k,v in self.get_scans().items()}
-        seg = {k: seg_fn(v) for k,v in self.get_segmentations().items()}
+        if seg_fn is not None:
+            tasks.update({k: partial(_apply_sitk, seg_fn, v) for k,v in self.get_segmentations().items()})
 
-        return Study(**scans, **seg, **self.get_info())
+        applied = thread_map(tasks, executor=executor, max_workers=max_workers)
+        return self._from_images({**self.get_scans().data, **self.get_segmentations().data, **applied, **self.get_info()})
 
-    def apply_numpy(self, fn:Callable[[np.ndarray], np.ndarray] | None, seg_fn: Callable[[np.ndarray], np.ndarray] | None) -> "Study":
+    def apply_numpy(
+        self,
+        fn:Callable[[np.ndarray], np.ndarray] | None,
+        seg_fn: Callable[[np.ndarray], np.ndarray] | None,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
+    ) -> "Study":
         """Returns a new ``Study`` with ``fn`` applied to scans and ``seg_fn`` applied to segmentations.
 
         Args:
@@ -134,58 +239,81 @@ class Study(UserDict[str, sitk.Image | Any]):
                 If None, identity function is used.
             seg_fn: Function to apply to segmentation images. Must take and return ``sitk.Image``.
                 If None, identity function is used.
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
-        scans = self.get_scans()
-        seg = self.get_segmentations()
-
+        tasks = {}
         if fn is not None:
-            scans = {k: sitk_apply_numpy(v, fn) for k,v in scans.items()}
+            tasks.update({k: partial(sitk_apply_numpy, v, fn) for k,v in self.get_scans().items()})
 
         if seg_fn is not None:
-            seg = {k: sitk_apply_numpy(v, seg_fn) for k,v in seg.items()}
+            tasks.update({k: partial(sitk_apply_numpy, v, seg_fn) for k,v in self.get_segmentations().items()})
 
-        return Study(**scans, **seg, **self.get_info())
+        applied = thread_map(tasks, executor=executor, max_workers=max_workers)
+        return self._from_images({**self.get_scans().data, **self.get_segmentations().data, **applied, **self.get_info()})
 
-    def cast(self, dtype) -> "Study":
+    def cast(self, dtype, max_workers: int | None = None, executor: "Executor | None" = None) -> "Study":
         """Returns a new study with all scans cast to the specified SimpleITK dtype.
 
+        Args:
+            dtype: SimpleITK pixel type, for example ``sitk.sitkFloat32``.
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+
         Note:
             This operation does not affect segmentations.
         """
-        return self.apply(partial(sitk.Cast, pixelID=dtype), seg_fn=None)
+        return self.apply(partial(sitk.Cast, pixelID=dtype), seg_fn=None, max_workers=max_workers, executor=executor)
 
-    def cast_float64(self) -> "Study":
+    def cast_float64(self, max_workers: int | None = None, executor: "Executor | None" = None) -> "Study":
         """Returns a new study with all scans cast to float64.
 
+        Args:
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+
         Note:
             This operation does not affect segmentations.
         """
-        return self.cast(sitk.sitkFloat64)
+        return self.cast(sitk.sitkFloat64, max_workers=max_workers, executor=executor)
 
-    def cast_float32(self) -> "Study":
+    def cast_float32(self, max_workers: int | None = None, executor: "Executor | None" = None) -> "Study":
         """Returns a new study with all scans cast to float32.
 
+        Args:
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+
         Note:
             This operation does not affect segmentations.
         """
-        return self.cast(sitk.sitkFloat32)
+        return self.cast(sitk.sitkFloat32, max_workers=max_workers, executor=executor)
 
-    def normalize(self) -> "Study":
+    def normalize(self, max_workers: int | None = None, executor: "Executor | None" = None) -> "Study":
         """Returns a new study where all scans are separately z-normalized to 0 mean and 1 variance.
 
+        Args:
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+
         Note:
             This operation does not affect segmentations.
         """
-        return self.apply(sitk.Normalize, seg_fn=None)
+        return self.apply(sitk.Normalize, seg_fn=None, max_workers=max_workers, executor=executor)
 
-    def rescale_intensity(self, min: float, max: float) -> "Study":
+    def rescale_intensity(
+        self, min: float, max: float, max_workers: int | None = None, executor: "Executor | None" = None
+    ) -> "Study":
         """Returns a new study where all scans are separately rescaled to the specified intensity range.
 
         Args:
             min: Minimum value for the output intensity range.
             max: Maximum value for the output intensity range.
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
-        return self.apply(partial(sitk.RescaleIntensity, outputMinimum = min, outputMaximum = max), seg_fn=None) # type:ignore
+        fn = partial(sitk.RescaleIntensity, outputMinimum = min, outputMaximum = max)
+        return self.apply(fn, seg_fn=None, max_workers=max_workers, executor=executor) # type:ignore
 
     def crop_bg(self, key: str) -> "Study":
         """Returns a new study with cropped black background. Finds the foreground bounding box of ``study[key]``,
@@ -195,13 +323,15 @@ class Study(UserDict[str, sitk.Image | Any]):
             key: The key of the image (scan or segmentation) to use for finding the foreground bounding box.
         """
         d = preprocessing.cropping.crop_bg_D(self.get_images(), key)
-        return Study(**d, **self.get_info())
+        return self._from_images({**d, **self.get_info()})
 
-    def center_crop_or_pad(self, size: Sequence[int]):
+    def center_crop_or_pad(self, size: Sequence[int], max_workers: int | None = None, executor: "Executor | None" = None):
         """Returns a new study with all images cropped or padded from the center to ``size``.
 
         Args:
             size: target image shape in pixels.
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
         shapes = {k: tuple(img.GetSize()) for k, img in self.get_images().items()}
         if len(set(shapes.values())) > 1:
@@ -209,8 +339,9 @@ class Study(UserDict[str, sitk.Image | Any]):
                                f"Current shapes: {shapes}")
 
         fn = partial(preprocessing.center_crop_or_pad, size=size)
-        return self.apply(fn=fn, seg_fn=fn)
+        return self.apply(fn=fn, seg_fn=fn, max_workers=max_workers, executor=executor)
 
+    @cached("verbose")
     def skullstrip_hd_bet(
         self,
         key: str,
@@ -218,6 +349,7 @@ class Study(UserDict[str, sitk.Image | Any]):
         device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
         disable_tta: bool = False,
         verbose: bool = False,
+        predictor: "preprocessing.hd_bet.HDBetPredictor | None" = None,
 
         expand: int = 0,
 
@@ -244,6 +376,10 @@ class Study(UserDict[str, sitk.Image | Any]):
                 Set this flag to disable test time augmentation. This will make prediction faster
                 at a slight decrease in prediction quality. Recommended for device cpu. Defaults to False.
             verbose (bool, optional): Talk to me. Defaults to False.
+            predictor (HDBetPredictor | None, optional):
+                HD-BET network already loaded in this process with ``preprocessing.hd_bet.HDBetPredictor``,
+                if specified, it is used instead of the ``hd-bet`` command, and ``device`` and ``disable_tta``
+                are ignored. Reuse one predictor for many studies to load the weights once. Defaults to None.
             expand (int, optional):
                 Positive values expand brain mask by this many pixels, meaning inner parts of the skull will be included;
                 Negative values dilate brain mask by this many pixels, meaning outer parts of the brain will be excluded.
@@ -261,15 +397,65 @@ class Study(UserDict[str, sitk.Image | Any]):
             device=device,
             disable_tta=disable_tta,
             verbose=verbose,
+            predictor=predictor,
             include_mask=include_mask,
             keep_original=keep_original,
             expand=expand,
         )
-        return Study(**d, **self.get_segmentations(), **self.get_info())
+        return self._from_images({**d, **self.get_segmentations(), **self.get_info()})
 
+    @classmethod
+    def skullstrip_hd_bet_batch(
+        cls,
+        studies: Sequence["Study"],
+        key: str,
+        register_to_mni152: Literal["T1", "T2"] | None = None,
+        device: Literal["cpu", "cuda", "mps"] = CUDA_IF_AVAILABLE,
+        disable_tta: bool = False,
+        verbose: bool = False,
+        predictor: "preprocessing.hd_bet.HDBetPredictor | None" = None,
+        chunk_size: int | None = 32,
+
+        expand: int = 0,
+
+        include_mask: bool = False,
+        keep_original: bool = False,
+    ) -> "list[Study]":
+        """Returns a list with ``skullstrip_hd_bet`` applied to each of ``studies``.
+
+        Images of all studies are written to one folder and HD-BET runs once per ``chunk_size`` studies,
+        instead of once per study, so its startup and weight loading are paid once per chunk.
+
+        Args:
+            studies: studies to skullstrip.
+            key: Key of the image in each study to pass to HD-BET for brain mask prediction.
+            chunk_size:
+                maximal number of studies per run of HD-BET. If None, all studies are processed in one run.
+                Defaults to 32.
+
+            Other arguments are the same as in ``skullstrip_hd_bet``.
+        """
+        ds = preprocessing.hd_bet.skullstrip_D_batch(
+            images=[study.get_scans() for study in studies],
+            key=key,
+            register_to_mni152=register_to_mni152,
+            device=device,
+            disable_tta=disable_tta,
+            verbose=verbose,
+            predictor=predictor,
+            chunk_size=chunk_size,
+            include_mask=include_mask,
+            keep_original=keep_original,
+            expand=expand,
+        )
+        return [
+            study._from_images({**d, **study.get_segmentations(), **study.get_info()}) for study, d in zip(studies, ds)
+        ]
+
+    @cached("threads", "verbose", files=("synthstrip_script_path", "model"))
     def skullstrip_synthstrip(
         self,
-        synthstrip_script_path: str | os.PathLike,
+        synthstrip_script_path: "str | os.PathLike | preprocessing.synthstrip.SynthStripWorker",
         key: str,
         gpu: bool | None = None,
         border: int | None = None,
@@ -288,7 +474,9 @@ class Study(UserDict[str, sitk.Image | Any]):
         then uses this mask to skullstrip all scans. Doesn't affect segmentations.
 
         Args:
-            synthstrip_script_path (str | os.PathLike): path to synthstrip script.
+            synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+                path to synthstrip script, or a ``preprocessing.synthstrip.SynthStripWorker``,
+                which runs SynthStrip in one process for many studies.
             key (str): key of the image to pass to HD-BET for brain mask prediction.
             gpu (bool | None, optional): use the GPU, defaults to False if unset.
             border (int | None, optional): mask border threshold in mm, defaults to 1 if unset.
@@ -312,8 +500,51 @@ class Study(UserDict[str, sitk.Image | Any]):
             expand=expand, include_mask=include_mask, keep_original=keep_original,
             verbose=verbose,
         )
-        return Study(**d, **self.get_segmentations(), **self.get_info())
+        return self._from_images({**d, **self.get_segmentations(), **self.get_info()})
+
+    @classmethod
+    def skullstrip_synthstrip_batch(
+        cls,
+        synthstrip_script_path: "str | os.PathLike | preprocessing.synthstrip.SynthStripWorker",
+        studies: Sequence["Study"],
+        key: str,
+        gpu: bool | None = None,
+        border: int | None = None,
+        threads: int | None = None,
+        model: str | os.PathLike | None = None,
+        expand: int = 0,
+
+        include_mask: bool = False,
+        keep_original: bool = False,
+
+        verbose: bool = True,
+    ) -> "list[Study]":
+        """Returns a list with ``skullstrip_synthstrip`` applied to each of ``studies``.
+
+        Brain masks of all studies are predicted in one SynthStrip worker, so the SynthStrip environment starts
+        and model weights are loaded once, see ``preprocessing.synthstrip.predict_brain_masks``.
+
+        Args:
+            synthstrip_script_path (str | os.PathLike | SynthStripWorker):
+                path to synthstrip script, or a ``preprocessing.synthstrip.SynthStripWorker``.
+            studies: studies to skullstrip.
+            key (str): key of the image in each study to pass to synthstrip for brain mask prediction.
+
+            Other arguments are the same as in ``skullstrip_synthstrip``.
+        """
+        ds = preprocessing.synthstrip.skullstrip_D_batch(
+            synthstrip_script_path=synthstrip_script_path,
+            images=[study.get_scans() for study in studies],
+            key=key,
+            gpu=gpu, border=border, threads=threads, model=model,
+            expand=expand, include_mask=include_mask, keep_original=keep_original,
+            verbose=verbose,
+        )
+        return [
+            study._from_images({**d, **study.get_segmentations(), **study.get_info()}) for study, d in zip(studies, ds)
+        ]
 
+    @cached("gpu_id", "num_batches", "intermediate_out_dir", files=("harmonization_model", "fusion_model"))
     def harmonize_haca3(
         self,
         conda_path: str | os.PathLike,
@@ -393,19 +624,26 @@ class Study(UserDict[str, sitk.Image | Any]):
         return self.add(new_key, harmonized)
 
 
-    def resize(self, size: Sequence[int], interpolator=sitk.sitkLinear):
+    def resize(
+        self, size: Sequence[int], interpolator=sitk.sitkLinear, max_workers: int | None = None, executor: "Executor | None" = None
+    ):
         """Returns a new study with all images resized to to ``size``.
 
         Args:
             size: Target size as a sequence of integers (e.g., [height, width, depth]).
             interpolator: Interpolation method for scans (segmentations always use nearest neighbor).
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
         return self.apply(
             partial(preprocessing.resize, new_size=size, interpolator=interpolator,),
             partial(preprocessing.resize, new_size=size, interpolator=sitk.sitkNearestNeighbor,),
+            max_workers=max_workers, executor=executor,
         )
 
-    def downsample(self, factor: float, dims = None, interpolator=sitk.sitkLinear):
+    def downsample(
+        self, factor: float, dims = None, interpolator=sitk.sitkLinear, max_workers: int | None = None, executor: "Executor | None" = None
+    ):
         """Returns a new study with all images downsampled by ``factor`` along ``dims``.
         For example, ``factor=2`` for 2x downsampling.
         Set ``dims`` to ``None`` to downsample along all dimensions.
@@ -414,44 +652,102 @@ class Study(UserDict[str, sitk.Image | Any]):
             factor: Downsampling factor (e.g., 2 for 2x downsampling).
             dims: Specific dimensions to downsample, or None for all dimensions.
             interpolator: Interpolation method for scans (segmentations always use nearest neighbor).
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
         """
         return self.apply(
             partial(preprocessing.downsample, factor=factor, dims=dims, interpolator=interpolator,),
             partial(preprocessing.downsample, factor=factor, dims=dims, interpolator=sitk.sitkNearestNeighbor,),
+            max_workers=max_workers, executor=executor,
         )
 
-    def register_SE(self, key: str, to: ImageLike, pmap=None, log_to_console=False) -> "Study":
+    @cached("log_to_console", files=("to", "pmap", "fixed_mask"), resolve={"backend": _registration_backend_name})
+    def register_SE(
+        self,
+        key: str,
+        to: "ImageLike | Atlas",
+        pmap=None,
+        log_to_console=False,
+        initializer: Literal["moments"] | None = None,
+        fixed_mask: "ImageLike | None" = None,
+        backend: Literal["auto", "elastix", "sitk"] = "auto",
+        moving_mask: "str | ImageLike | None" = None,
+        preset: Literal["fast", "balanced", "accurate"] | None = None,
+    ) -> "Study":
         """Returns a new Study.
-        Registers ``study[key]`` to ``to`` via SimpleElastix,
+        Registers ``study[key]`` to ``to`` via SimpleElastix or SimpleITK,
         and use transformation parameters to register all other images including segmentation.
         This assumes that all images are aligned, if they are not, use ``register_many`` method.
 
+        The transform is stored as ``f"info_transform_{key}"`` with a list of elastix transform parameter maps,
+        so that images added later can be transformed without registering again, see ``apply_stored_transform``.
+
         Args:
             key: The key of the image to use as reference for registration.
-            to: Target image or path to register to.
-            pmap: Parameter map for registration. If None, uses default parameters.
+            to: Target image or path to register to, or an ``Atlas``, for example ``mrid.get_sri24_atlas("T1")``,
+                then its brain mask is used as ``fixed_mask``.
+            pmap: Parameter map for registration, only supported by ``"elastix"`` backend.
+                If None, uses default parameters.
             log_to_console: Whether to log registration progress to console.
+            initializer: if ``"moments"``, registration starts from a translation that matches centers of mass
+                of the images, and default parameters skip translation stages, which is faster.
+                If None, uses default of the backend, which is identity transform for ``"elastix"``
+                and ``"moments"`` for ``"sitk"``.
+            fixed_mask: mask of ``to``, only voxels inside of it are used for registration. Defaults to None.
+            backend: ``"elastix"`` to use SimpleElastix, ``"sitk"`` to use ``sitk.ImageRegistrationMethod``
+                which doesn't need SimpleITK-SimpleElastix, ``"auto"`` to use SimpleElastix if it is installed.
+                Defaults to "auto".
+            moving_mask: mask of ``study[key]`` or a key of it in this study, e.g. ``"seg_brain"``,
+                so that air and skull are not used for registration. Defaults to None.
+            preset: ``"fast"``, ``"balanced"`` or ``"accurate"``, sets number of resolutions, iterations and samples,
+                see ``PRESETS`` in ``mrid.preprocessing.simple_elastix`` and ``mrid.preprocessing.sitk_registration``.
+                Can't be used together with ``pmap``. If None, uses defaults of the backend. Defaults to None.
         """
-        d = preprocessing.simple_elastix.register_D(
+        if isinstance(moving_mask, str) and moving_mask in self.data: moving_mask = self[moving_mask]
+
+        d = preprocessing.sitk_registration.get_backend(backend).register_D(
             images=self.get_images(),
             key=key,
             to=to,
-            pmap=pmap,
             log_to_console=log_to_console,
+            fixed_mask=fixed_mask,
+            moving_mask=moving_mask,
+            include_transform=True,
+            **_registration_kwargs(backend, pmap=pmap, initializer=initializer, preset=preset),
         )
-        return Study(**d, **self.get_info())
+        return self._from_images({**self.data, **d})
 
-    def register_each_SE(self, key: str, to: "ImageLike | None" = None, pmap=None, log_to_console=False) -> "Study":
+    @cached("log_to_console", "max_workers", files=("to", "pmap"), resolve={"backend": _registration_backend_name})
+    def register_each_SE(
+        self,
+        key: str,
+        to: "ImageLike | Atlas | None" = None,
+        pmap=None,
+        log_to_console=False,
+        max_workers: int | None = None,
+        initializer: Literal["moments"] | None = None,
+        backend: Literal["auto", "elastix", "sitk"] = "auto",
+        preset: Literal["fast", "balanced", "accurate"] | None = None,
+    ) -> "Study":
         """Returns a new study.
         Registers all other images to ``study[key]``.
         If ``to`` is specified, register ``study[key]`` to ``to`` beforehand.
-        Uses SimpleElastix.
+        Uses SimpleElastix or SimpleITK depending on ``backend``, see ``Study.register_SE``.
+
+        Transform of each registered image is stored as ``f"info_transform_{k}"``, see ``apply_stored_transform``.
 
         Args:
             key: The key of the image to use as reference for registration.
             to: Target image or path to register the reference image to. If None, uses key as reference.
-            pmap: Parameter map for registration. If None, uses default parameters.
+            pmap: Parameter map for registration, only supported by ``"elastix"`` backend.
+                If None, uses default parameters.
             log_to_console: Whether to log registration progress to console.
+            max_workers: if more than 1, other images are registered in parallel in a process pool
+                with this many workers, and each worker gets ``cpu_count // max_workers`` SimpleITK threads.
+                Each worker receives a copy of the reference image. If None, registers sequentially.
+            initializer: initializer for all registrations, see ``Study.register_SE``.
+            backend: registration backend, see ``Study.register_SE``. Defaults to "auto".
+            preset: preset for all registrations, see ``Study.register_SE``. Defaults to None.
 
         Note:
             If called on a study with segmentations, they will be removed from the returned study.
@@ -461,26 +757,62 @@ class Study(UserDict[str, sitk.Image | Any]):
             warnings.warn(f"`register_many` was called on a study with segmentations ({keys}), "
                           "they will be removed from the returned study", stacklevel=3)
 
-        d = self.get_scans()
-        if to is not None:
-            d[key] = preprocessing.simple_elastix.register(d[key], to=to, pmap=pmap, log_to_console=log_to_console)
+        d = preprocessing.sitk_registration.get_backend(backend).register_each(
+            self.get_scans(), key=key, to=to, log_to_console=log_to_console, max_workers=max_workers,
+            include_transform=True, **_registration_kwargs(backend, pmap=pmap, initializer=initializer, preset=preset),
+        )
+        return self._from_images({**d, **self.get_info(), **{k: v for k, v in d.items() if k.startswith("info")}})
 
-        for k in d:
-            if k != key:
-                d[k] = preprocessing.simple_elastix.register(d[k], to=d[key], pmap=pmap, log_to_console=log_to_console)
+    def apply_stored_transform(self, key: str, transform_key: str | None = None) -> "Study":
+        """Returns a new study with ``study[key]`` transformed by a transform stored by ``register_SE``
+        or ``register_each_SE``, without registering again. Linear transforms are applied via ``sitk.Resample``.
 
-        return Study(**d, **self.get_info())
+        ``study[key]`` should be aligned with the image the transform was found for, as it was before registration,
+        for example a segmentation added to the study after registration. Segmentations use nearest interpolation.
+        With ``LazyStudy.register_SE``, that is the image after the steps recorded before registration,
+        e.g. if ``resize`` was recorded before it, the transform applies to the resized images, not the original ones.
 
-    def resample_to(self, to: "np.ndarray | sitk.Image | torch.Tensor | str", interpolation=sitk.sitkLinear) -> "Study":
+        Args:
+            key: The key of the image to transform.
+            transform_key: applies transform stored as ``f"info_transform_{transform_key}"``,
+                if None, uses the only stored transform. Defaults to None.
+        """
+        if transform_key is None:
+            stored = [k for k in self.data if k.startswith("info_transform_")]
+            if len(stored) != 1:
+                raise RuntimeError(f"`transform_key` must be specified when study has {len(stored)} stored transforms.")
+            transform_key = stored[0][len("info_transform_"):]
+
+        transformed = preprocessing.simple_elastix.apply_transform_parameter_maps(
+            self[key], self[f"info_transform_{transform_key}"], use_nearest_interpolation=key.startswith("seg"),
+        )
+        return self._from_images({**self.data, key: transformed})
+
+    def resample_to(
+        self,
+        to: "np.ndarray | sitk.Image | torch.Tensor | str",
+        interpolation=sitk.sitkLinear,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
+    ) -> "Study":
         """Returns a new study with all images including segmentation resampled to ``to``.
-        Segmentation always uses nearest interpolation"""
+        Segmentation always uses nearest interpolation.
+
+        Args:
+            to: image to resample to.
+            interpolation: Interpolation method for scans (segmentations always use nearest neighbor).
+            max_workers: if more than 1, images are processed in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to process images in parallel. Defaults to None.
+        """
         to = tositk(to)
 
         return self.apply(
             partial(preprocessing.resample_to, to=to, interpolation=interpolation),
             partial(preprocessing.resample_to, to=to, interpolation=sitk.sitkNearestNeighbor),
+            max_workers=max_workers, executor=executor,
         )
 
+    @cached()
     def n4_bias_field_correction(self, key: str, shrink: int = 4, postfix: str = "") -> "Study":
         """Returns a new study with corrected bias field of the image under ``key``. Doesn't affect other images.
 
@@ -494,9 +826,8 @@ class Study(UserDict[str, sitk.Image | Any]):
                 if specified, N4-corrected image is added to returned study with specified postfix rather than
                 replacing current ``key``.
         """
-        new = self.copy()
-        new[f"{key}{postfix}"] = preprocessing.bias_field_correction.n4_bias_field_correction(new[key], shrink=shrink)
-        return new
+        corrected = preprocessing.bias_field_correction.n4_bias_field_correction(self[key], shrink=shrink)
+        return self.add(f"{key}{postfix}", corrected)
 
     def expand_binary_mask(self, key: str, expand: int, postfix: str = ""):
         """Returns a new study with binary mask under ``key`` expanded or dilated by ``expand`` pixels.
@@ -510,9 +841,8 @@ class Study(UserDict[str, sitk.Image | Any]):
                 if specified, expanded/dilated mask is added to returned study with specified postfix rather than
                 replacing current ``key``.
         """
-        new = self.copy()
-        new[f"{key}{postfix}"] = preprocessing.mask.expand_binary_mask(new[key], expand=expand)
-        return new
+        expanded = preprocessing.mask.expand_binary_mask(self[key], expand=expand)
+        return self.add(f"{key}{postfix}", expanded)
 
     def remove_small_objects(
         self,
@@ -590,26 +920,41 @@ class Study(UserDict[str, sitk.Image | Any]):
         arr = tfm(self.to_numpy(key))
         return self.add(f'{key}{postfix}', arr, reference_key=key)
 
-    def to_numpy(self, key: str):
-        """returns ``study[key]`` converted to a numpy array."""
+    def to_numpy(self, key: str, view: bool = False) -> np.ndarray:
+        """returns ``study[key]`` converted to a numpy array.
+
+        Args:
+            key: key of the image.
+            view: if True, returns a read-only view of the image voxels without copying them,
+                it is only valid while ``study[key]`` isn't modified. For studies loaded with ``format="mmap"``
+                this is a memory-mapped array. Defaults to False.
+        """
+        if view: return self._view(key)
+        if isinstance(self.data[key], LazyImage): return np.array(self._view(key))
         return tonumpy(self[key])
 
     def to_tensor(self, key: str):
         """returns ``study[key]`` converted to a tensor."""
         return totensor(self[key])
 
-    def _get_sorted_items(self, scans: bool, seg: bool, order: Sequence[str] | None = None) -> list[tuple[str, sitk.Image]]:
+    def _get_sorted_keys(self, scans: bool, seg: bool, order: Sequence[str] | None = None) -> list[str]:
         if not (scans or seg): raise ValueError("At least one of `scans` or `seg` must be True")
 
         if order is not None:
-            return [(k, self[k]) for k in order]
+            return list(order)
 
         # make sure items are always sorted in the same order
-        items = []
-        if scans: items = sorted(self.get_scans().items(), key = lambda x: x[0])
-        if seg: items.extend(sorted(self.get_segmentations().items(), key = lambda x: x[0]))
-        return items
-
+        keys = []
+        if scans: keys = sorted(self.get_scans().keys())
+        if seg: keys.extend(sorted(self.get_segmentations().keys()))
+        return keys
+
+    def _get_sorted_views(self, scans: bool, seg: bool, order: Sequence[str] | None = None) -> list[np.ndarray]:
+        views = [self._view(k) for k in self._get_sorted_keys(scans=scans, seg=seg, order=order)]
+        shapes = {v.shape for v in views}
+        if len(shapes) > 1:
+            raise RuntimeError(f"Can only stack images with the same shape, got shapes {shapes}")
+        return views
 
     def stack_numpy(self, scans:bool = True, seg: bool = False, dtype=None, order: Sequence[str] | None = None) -> np.ndarray:
         """Stack images into a numpy array, returns an array of shape ``(n_images, *dims)``.
@@ -622,13 +967,27 @@ class Study(UserDict[str, sitk.Image | Any]):
                 Specific order for the images in the stack. If specified, ignores ``scans`` and ``seg`` options.
                 If None, uses alphabetic sorting.
         """
-        items = self._get_sorted_items(scans=scans, seg=seg, order=order)
+        views = self._get_sorted_views(scans=scans, seg=seg, order=order)
+        # a study without selected images stacks into an empty float64 array of shape (0,)
+        if len(views) == 0: return np.empty(0, dtype=np.float64 if dtype is None else dtype)
+        if dtype is None: dtype = np.result_type(*views)
+
+        # each image is copied once, directly into the output array
+        stacked = np.empty((len(views), *views[0].shape), dtype=dtype)
+        for i, v in enumerate(views):
+            stacked[i] = v
 
-        stacked = np.array([sitk.GetArrayFromImage(v) for k, v in items])
-        if dtype is not None: stacked = stacked.astype(dtype, copy=False)
         return stacked
 
-    def stack_tensor(self, scans:bool = True, seg: bool = False, device=None, dtype=None, order: Sequence[str] | None = None) -> "torch.Tensor":
+    def stack_tensor(
+        self,
+        scans:bool = True,
+        seg: bool = False,
+        device=None,
+        dtype=None,
+        order: Sequence[str] | None = None,
+        pin_memory: bool = False,
+    ) -> "torch.Tensor":
         """Stack images into a torch tensor, returns an tensor of shape ``(n_images, *dims)``.
 
         Args:
@@ -639,24 +998,43 @@ class Study(UserDict[str, sitk.Image | Any]):
             order:
                 Specific order for the images in the stack. If specified, ignores ``scans`` and ``seg`` options.
                 If None, uses alphabetic sorting.
+            pin_memory: If True, images are stacked into pinned memory,
+                which makes copying to CUDA faster and asynchronous. Defaults to False.
         """
         import torch
-        items = self._get_sorted_items(scans=scans, seg=seg, order=order)
-        stacked = torch.stack([torch.from_numpy(sitk.GetArrayFromImage(v)) for _,v in items])
-        return stacked.to(device=device, dtype=dtype, memory_format=torch.contiguous_format)
+        views = self._get_sorted_views(scans=scans, seg=seg, order=order)
+        # same as ``stack_numpy``, a study without selected images stacks into an empty float64 tensor of shape (0,)
+        if len(views) == 0: return torch.empty(0, dtype=torch.float64 if dtype is None else dtype, device=device)
+        if dtype is None: dtype = torch.from_numpy(np.empty(0, dtype=np.result_type(*views))).dtype
+
+        # each image is copied once, directly into the output tensor
+        stacked = torch.empty((len(views), *views[0].shape), dtype=dtype, pin_memory=pin_memory)
+        with warnings.catch_warnings():
+            # views are read-only, but they are only read from
+            warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+            for i, v in enumerate(views):
+                stacked[i].copy_(torch.from_numpy(v))
+
+        if device is not None: stacked = stacked.to(device=device, non_blocking=pin_memory)
+        return stacked
+
+    def to_numpy_dict(self, view: bool = False) -> dict[str, np.ndarray | Any]:
+        """Returns a dictionary with all images converted to numpy arrays, info is included as is.
 
-    def to_numpy_dict(self) -> dict[str, np.ndarray | Any]:
-        """Returns a dictionary with all images converted to numpy arrays, info is included as is."""
-        return {k: (sitk.GetArrayFromImage(v) if isinstance(v, sitk.Image) else v) for k, v in self.items()}
+        Args:
+            view: if True, arrays are read-only views of the image voxels without copying them,
+                they are only valid while images in this study aren't modified. Defaults to False.
+        """
+        return {k: (v if k.startswith("info") else self.to_numpy(k, view=view)) for k, v in self.data.items()}
 
     def to_tensor_dict(self) -> "dict[str, torch.Tensor | Any]":
         """Returns a dictionary with all images converted to tensors, info is included as is."""
         import torch
-        return {k: (torch.from_numpy(v) if isinstance(v, np.ndarray) else v) for k,v in self.to_numpy_dict()}
+        return {k: (torch.from_numpy(v) if isinstance(v, np.ndarray) else v) for k,v in self.to_numpy_dict().items()}
 
     def plot(self):
         from .utils.plotting import plot_study
-        return plot_study(self.get_images().to_numpy_dict())
+        return plot_study(self.get_images().to_numpy_dict(view=True))
 
     def save(
         self,
@@ -667,8 +1045,14 @@ class Study(UserDict[str, sitk.Image | Any]):
         mkdir=True,
         use_compression=True,
         pickle_module = pickle,
+        format: Literal["sitk", "mmap"] = "sitk",
+        compression_level: int = -1,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
     ):
-        """Writes this study to a directory, with filenames being ``{path}/{prefix}{key}{suffix}.{ext}``
+        """Writes this study to a directory, with filenames being ``{path}/{prefix}{key}{suffix}.{ext}``.
+        Transforms stored by ``register_SE`` are written as elastix parameter files ``{prefix}{key}{suffix}.{i}.txt``,
+        other info is pickled to ``{prefix}{key}{suffix}.pkl``.
 
         Args:
             dir: Directory to save the study to.
@@ -678,7 +1062,18 @@ class Study(UserDict[str, sitk.Image | Any]):
             mkdir: Whether to create the directory if it doesn't exist. Default is True.
             use_compression: Whether to use compression for image files. Default is True.
             pickle_module: Module to use for pickling info objects. Default is pickle.
+            format: ``"sitk"`` to write images with SimpleITK, or ``"mmap"`` to write uncompressed ``.npy`` files
+                with ``.json`` sidecars with geometry and number of components, which are memory-mapped on load,
+                so that opening a study is instant and voxels are read from disk only when they are accessed.
+                ``ext`` and ``use_compression`` are ignored for ``"mmap"``. Default is ``"sitk"``.
+            compression_level: compression level hint passed to SimpleITK, only used by writers that support it,
+                such as ``mha`` and ``nrrd``, where lower values are faster to write and higher values produce
+                smaller files. It is ignored for ``nii.gz``. -1 uses the default level. Default is -1.
+            max_workers: if more than 1, images are written in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to write images in parallel. Defaults to None.
         """
+        if format not in ("sitk", "mmap"): raise ValueError(f"Unknown format {format!r}")
+        if format == "mmap": ext = "npy"
         if ext.startswith('.'): ext = ext[1:]
 
         # make directory
@@ -687,25 +1082,49 @@ class Study(UserDict[str, sitk.Image | Any]):
             else: raise FileNotFoundError(f"Directory {dir} doesn't exist and {mkdir = }")
 
         # save
-        for k,v in self.items():
+        tasks = {}
+        for k in self.data.keys():
+
+            # save transforms as elastix parameter files
+            if k.startswith('info_transform_') and _is_parameter_maps(self[k]):
+                for i, tmap in enumerate(self[k]):
+                    preprocessing.simple_elastix.write_parameter_file(tmap, os.path.join(dir, f"{prefix}{k}{suffix}.{i}.txt"))
 
             # save infos
-            if k.startswith('info'):
+            elif k.startswith('info'):
                 try:
                     with open(os.path.join(dir, f"{prefix}{k}{suffix}.pkl"), "wb") as file:
-                        pickle_module.dump(v, file)
+                        pickle_module.dump(self[k], file)
 
                 except Exception as e:
                     print(f"Couldn't save {k}:\n{e!r}")
 
             # save images
             else:
-                # this handles non ascii chars
-                with tempfile.TemporaryDirectory() as temp_path:
-                    sitk.WriteImage(v, os.path.join(temp_path, f"{prefix}{k}{suffix}.{ext}"), useCompression=use_compression)
-                    shutil.move(os.path.join(temp_path, f"{prefix}{k}{suffix}.{ext}"), dir)
+                path = os.path.join(os.fspath(dir), f"{prefix}{k}{suffix}.{ext}")
+                if format == "mmap": tasks[k] = partial(self._save_image_mmap, k, path)
+                else: tasks[k] = partial(self._save_image, k, path, ext, use_compression, compression_level)
+
+        thread_map(tasks, executor=executor, max_workers=max_workers)
+
+    def _save_image_mmap(self, key: str, path: str):
+        save_memmap_image(self[key], path)
+
+    def _save_image(self, key: str, path: str, ext: str, use_compression: bool, compression_level: int):
+        _write_image(self[key], path, ext, use_compression, compression_level)
 
-    def load(self, dir: str | os.PathLike, prefix: str = '', suffix: str = '', ext: str = 'nii.gz', pickle_module = pickle):
+    def load(
+        self,
+        dir: str | os.PathLike,
+        prefix: str = '',
+        suffix: str = '',
+        ext: str = 'nii.gz',
+        pickle_module = pickle,
+        format: Literal["sitk", "mmap"] = "sitk",
+        lazy: bool = False,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
+    ):
         """Returns a new study, updated by data loaded from ``dir``, which can be created by calling ``study.save(dir)``.
 
         Args:
@@ -714,11 +1133,26 @@ class Study(UserDict[str, sitk.Image | Any]):
             suffix: Expected suffix of filenames.
             ext: Expected file extension for image files. Default is 'nii.gz'.
             pickle_module: Module used for unpickling info objects. Default is pickle.
+            format: ``"sitk"`` to read images with SimpleITK, or ``"mmap"`` to memory-map images saved
+                with ``format="mmap"``, they are loaded into memory when they are first accessed via ``study[key]``,
+                and ``study.to_numpy(key, view=True)`` returns the memory-mapped array. ``ext`` is ignored
+                for ``"mmap"``. Default is ``"sitk"``.
+            lazy: if True, only headers of images are read, voxels are read when an image is first accessed
+                via ``study[key]``. Use ``study.get_header(key)`` to get size, spacing, origin and direction
+                without reading the voxels. Images with ``format="mmap"`` are always lazy. Default is False.
+            max_workers: if more than 1, images are read in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to read images in parallel. Defaults to None.
         """
+        if format not in ("sitk", "mmap"): raise ValueError(f"Unknown format {format!r}")
+        if format == "mmap": ext = "npy"
+        if ext.startswith('.'): ext = ext[1:]
+
         study = self.copy()
 
         files = os.listdir(dir)
 
+        tasks = {}
+        transform_files: dict[str, dict[int, str]] = {}
         for f in files:
             full = os.path.join(dir, f)
             name:str = f
@@ -730,7 +1164,13 @@ class Study(UserDict[str, sitk.Image | Any]):
                 # load images
                 if name.endswith(f'{suffix}.{ext}'):
                     name = name[:-len(f'{suffix}.{ext}')]
-                    study[name] = tositk(full)
+                    if format == "mmap": tasks[name] = partial(MemmapImage, full)
+                    elif lazy and os.path.isfile(full): tasks[name] = partial(FileImage, full)
+                    else: tasks[name] = partial(tositk, full)
+
+                # load transforms
+                elif (match := re.fullmatch(rf"(info_transform_.+){re.escape(suffix)}\.(\d+)\.txt", name)) is not None:
+                    transform_files.setdefault(match[1], {})[int(match[2])] = full
 
                 # load infos
                 elif name.endswith(f'{suffix}.pkl'):
@@ -742,10 +1182,25 @@ class Study(UserDict[str, sitk.Image | Any]):
                     except Exception as e:
                         print(f"Couldn't load {full}:\n{e!r}")
 
+        for name, paths in transform_files.items():
+            study[name] = [preprocessing.simple_elastix.read_parameter_file(paths[i]) for i in sorted(paths)]
+
+        study.data.update(thread_map(tasks, executor=executor, max_workers=max_workers))
         return study
 
     @classmethod
-    def from_dir(cls, dir: str | os.PathLike, prefix: str = '', suffix: str = '', ext: str = 'nii.gz', pickle_module = pickle):
+    def from_dir(
+        cls,
+        dir: str | os.PathLike,
+        prefix: str = '',
+        suffix: str = '',
+        ext: str = 'nii.gz',
+        pickle_module = pickle,
+        format: Literal["sitk", "mmap"] = "sitk",
+        lazy: bool = False,
+        max_workers: int | None = None,
+        executor: "Executor | None" = None,
+    ):
         """Load a study from a directory.
 
         Args:
@@ -754,5 +1209,14 @@ class Study(UserDict[str, sitk.Image | Any]):
             suffix: Expected suffix of filenames.
             ext: Expected file extension for image files. Default is 'nii.gz'.
             pickle_module: Module used for unpickling info objects. Default is pickle.
+            format: ``"sitk"`` to read images with SimpleITK, or ``"mmap"`` to memory-map images saved
+                with ``format="mmap"``. See ``Study.load``. Default is ``"sitk"``.
+            lazy: if True, only headers of images are read, voxels are read when an image is first accessed.
+                See ``Study.load``. Default is False.
+            max_workers: if more than 1, images are read in parallel by this many threads. Defaults to None.
+            executor: executor with ``max_workers`` workers to read images in parallel. Defaults to None.
         """
-        return cls().load(dir=dir, prefix=prefix, suffix=suffix, ext=ext, pickle_module=pickle_module)
\ No newline at end of file
+        return cls().load(
+            dir=dir, prefix=prefix, suffix=suffix, ext=ext, pickle_module=pickle_module,
+            format=format, lazy=lazy, max_workers=max_workers, executor=executor,
+        )
\ No newline at end of file
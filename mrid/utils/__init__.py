@@ -1,4 +1,5 @@
 from .stl_utils import stl2sitk
 from .dicom_uid_fixer import fix_dicom_uids
 from .dcm2niix import run_dcm2niix, dcm2sitk
-from .plotting import plot_study
\ No newline at end of file
+from .plotting import plot_study
+from .tempfiles import set_scratch_dir, get_scratch_dir
\ No newline at end of file
@@ -1,12 +1,14 @@
 import warnings
 import os
 import shutil
-import subprocess
-import tempfile
 
 import SimpleITK as sitk
 
+from .profiling import run_subprocess, traced
+from .tempfiles import temporary_directory
 
+
+@traced()
 def run_dcm2niix(
     inpath: str | os.PathLike,
     outfolder: str | os.PathLike,
@@ -14,8 +16,9 @@ def run_dcm2niix(
     mkdirs=True,
     save_BIDS=False,
     allow_stacking=True,
+    compress=True,
 ) -> str:
-    """Convert dicom folder to NIfTI format and return path to the output ``nii.gz`` file,
+    """Convert dicom folder to NIfTI format and return path to the output ``nii.gz`` file (``nii`` if ``compress`` is False),
     uses dcm2niix (https://github.com/rordenlab/dcm2niix) which needs to be installed.
 
     This is a simple wrapper around dcm2niix command line interface using subprocess, it also handles non-ascii paths.
@@ -29,7 +32,7 @@ def run_dcm2niix(
         outfolder (str): Path to the output folder (e.g. ``D:/MRI/patient001/0``).
 
         outname (str):
-            Output filename, excluding ``.nii.gz`` because it will be added by ``dcm2niix``.
+            Output filename, excluding ``.nii.gz`` or ``.nii`` because it will be added by ``dcm2niix``.
             Can use modifiers (e.g. `%d` will be replaced with series description string from DICOM metadata),
             as explained here https://www.nitrc.org/plugins/mwiki/index.php/dcm2nii:MainPage#General_Usage
 
@@ -41,9 +44,13 @@ def run_dcm2niix(
         allow_stacking (bool, optional):
             Whether to allow stacking different studies into a single file.
             Sometimes this may help with malformed DICOMs that are recognized as separate studies.
+
+        compress (bool, optional):
+            Whether to gzip the output file. Uncompressed output is faster to write and read,
+            which is useful when the file is read right away. Defaults to True.
     """
     # dicom2niix doesnt support non-ascii paths, so convert to temporary directory
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with temporary_directory() as tmpdir:
 
         # create temporary folders
         tmp_input_dir = os.path.join(tmpdir, "mrid_dcm2niix_input")
@@ -61,8 +68,8 @@ def run_dcm2niix(
                 else: raise NotADirectoryError(f"Output path {outfolder} doesn't exist")
 
         # run dcm2niix
-        subprocess.run(["dcm2niix",
-                        "-z", "y", # compression
+        run_subprocess(["dcm2niix",
+                        "-z", "y" if compress else "n", # compression
                         "-m", "y" if allow_stacking else 'n', # disable stacking images from different studies
                         "-b", 'y' if save_BIDS else 'n', # save additional JSON info that can't be saved into nifti (https://bids.neuroimaging.io/ BIDS sidecar format)
                         "-o", os.path.normpath(tmp_output_dir), # output folder
@@ -71,7 +78,7 @@ def run_dcm2niix(
                     check=True)
 
         # find what new nifti files were created
-        out_files = [i for i in os.listdir(tmp_output_dir) if i.lower().strip().endswith('.nii.gz')]
+        out_files = [i for i in os.listdir(tmp_output_dir) if i.lower().strip().endswith(('.nii.gz', '.nii'))]
 
         # move them to output folder
         shutil.copytree(tmp_output_dir, outfolder, dirs_exist_ok=True)
@@ -86,7 +93,9 @@ def run_dcm2niix(
         return os.path.join(outfolder, out_files[0])
 
 
+@traced()
 def dcm2sitk(inpath:str | os.PathLike) -> sitk.Image:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        nifti_path = run_dcm2niix(inpath=inpath, outfolder=tmpdir, outfname='temp', mkdirs=False, save_BIDS=False)
+    with temporary_directory() as tmpdir:
+        # the file is read right away, so it isn't compressed
+        nifti_path = run_dcm2niix(inpath=inpath, outfolder=tmpdir, outfname='temp', mkdirs=False, save_BIDS=False, compress=False)
         return sitk.ReadImage(nifti_path)
\ No newline at end of file
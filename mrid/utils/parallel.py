@@ -0,0 +1,105 @@
+import os
+import threading
+from collections.abc import Callable, Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TypeVar
+
+import SimpleITK as sitk
+
+K = TypeVar("K")
+R = TypeVar("R")
+
+def sitk_threads_per_worker(num_workers: int) -> int:
+    """Returns how many threads each of ``num_workers`` workers can give SimpleITK without oversubscribing the cores."""
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+_sitk_threads_lock = threading.Lock()
+_sitk_threads_requests: list[int] = []
+_sitk_threads_default: int | None = None
+
+def _set_sitk_threads():
+    # called with the lock held, while contexts are active the smallest requested number is used
+    if len(_sitk_threads_requests) > 0: num_threads = min(_sitk_threads_requests)
+    else: num_threads = _sitk_threads_default
+    assert num_threads is not None
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(num_threads)
+
+@contextmanager
+def sitk_num_threads(num_threads: int):
+    """Context manager which sets SimpleITK global default number of threads and restores it on exit.
+
+    This only affects filters created within the context. Contexts may overlap in different threads,
+    then the smallest number of threads among active contexts is used,
+    and the previous default is restored when the last of them exits."""
+    global _sitk_threads_default # pylint:disable=global-statement
+    num_threads = max(1, num_threads)
+    with _sitk_threads_lock:
+        if len(_sitk_threads_requests) == 0:
+            _sitk_threads_default = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+        _sitk_threads_requests.append(num_threads)
+        _set_sitk_threads()
+    try:
+        yield
+    finally:
+        with _sitk_threads_lock:
+            _sitk_threads_requests.remove(num_threads)
+            _set_sitk_threads()
+
+def thread_map(
+    tasks: Mapping[K, Callable[[], R]],
+    executor: Executor | None = None,
+    max_workers: int | None = None,
+) -> dict[K, R]:
+    """Runs all functions in ``tasks`` and returns a dictionary with their results.
+
+    If ``executor`` is specified, tasks are submitted to it, otherwise if ``max_workers`` is more than 1,
+    they run in a thread pool. SimpleITK and most numpy functions release the GIL so they run in parallel.
+    SimpleITK threads are divided between workers so that they don't oversubscribe the cores.
+
+    Args:
+        tasks: mapping of keys to functions without arguments.
+        executor: executor to submit tasks to, for example ``ThreadPoolExecutor``. Defaults to None.
+        max_workers: number of threads to run tasks in, or if ``executor`` is specified, number of its workers,
+            which defaults to the number of cores. Defaults to None.
+    """
+    if executor is None and (max_workers is None or max_workers <= 1 or len(tasks) <= 1):
+        return {k: fn() for k, fn in tasks.items()}
+
+    num_workers = max_workers
+    if num_workers is None: num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(tasks)))
+
+    with sitk_num_threads(sitk_threads_per_worker(num_workers)):
+        if executor is not None:
+            futures = {k: executor.submit(fn) for k, fn in tasks.items()}
+            return {k: f.result() for k, f in futures.items()}
+
+        with ThreadPoolExecutor(num_workers) as pool:
+            futures = {k: pool.submit(fn) for k, fn in tasks.items()}
+            return {k: f.result() for k, f in futures.items()}
+
+def _init_process_worker(num_threads: int):
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(num_threads)
+
+def process_map(tasks: Mapping[K, Callable[[], R]], max_workers: int | None = None) -> dict[K, R]:
+    """Runs all functions in ``tasks`` and returns a dictionary with their results.
+
+    If ``max_workers`` is more than 1, tasks run in a process pool, so functions and their results
+    must be picklable, e.g. ``functools.partial`` of a module-level function.
+    Each worker gets ``cpu_count // max_workers`` SimpleITK threads, which includes elastix.
+    Use this for functions that hold the GIL or are not thread safe, otherwise ``thread_map`` is cheaper.
+
+    Args:
+        tasks: mapping of keys to functions without arguments.
+        max_workers: number of processes to run tasks in. Defaults to None.
+    """
+    if max_workers is None or max_workers <= 1 or len(tasks) <= 1:
+        return {k: fn() for k, fn in tasks.items()}
+
+    num_workers = min(max_workers, len(tasks))
+    with ProcessPoolExecutor(
+        num_workers, initializer=_init_process_worker, initargs=(sitk_threads_per_worker(num_workers),)
+    ) as pool:
+        futures = {k: pool.submit(fn) for k, fn in tasks.items()}
+        return {k: f.result() for k, f in futures.items()}
@@ -0,0 +1,258 @@
+"""Tracing of ``Study`` methods and preprocessing functions.
+
+Functions decorated with ``traced`` are recorded by all active ``Profiler`` contexts.
+When no profiler is active, tracing only adds a check of a global list.
+
+Example:
+    ```python
+    from mrid.utils.profiling import Profiler
+
+    with Profiler() as profiler:
+        study = study.register_SE("t1", mrid.get_sri24("T1")).skullstrip_hd_bet("t1")
+
+    profiler.to_chrome_trace("trace.json") # open in chrome://tracing or https://ui.perfetto.dev
+    pd.DataFrame(profiler.summary())
+    ```
+"""
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable, Sequence
+from contextlib import contextmanager
+from typing import Any, NamedTuple, TypeVar
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+
+class TraceRecord(NamedTuple):
+    """Measurements of one call of a traced function."""
+    name: str
+    """name of the function, e.g. ``"Study.resize"`` or ``"hd_bet.run_hd_bet"``."""
+    category: str
+    """``"study"``, ``"preprocessing"``, ``"subprocess"`` or ``"io"``."""
+    start: float
+    """seconds since the profiler was entered."""
+    wall_time: float
+    """wall time in seconds."""
+    cpu_time: float
+    """CPU time of this process in seconds, includes all threads."""
+    peak_rss_delta: int
+    """increase of peak resident memory of this process in bytes, 0 if it didn't exceed the previous peak."""
+    temp_bytes: int
+    """bytes written to temporary directories created by ``mrid.utils.tempfiles.temporary_directory``."""
+    subprocess_time: float
+    """wall time in seconds spent waiting for subprocesses started with ``run_subprocess``."""
+    subprocess_cpu_time: float
+    """CPU time of finished subprocesses in seconds."""
+    thread_id: int
+    """identifier of the thread that made the call."""
+
+
+def _peak_rss() -> int:
+    if resource is None: return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def _children_cpu_time() -> float:
+    if resource is None: return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class _Span:
+    def __init__(self, name: str, category: str):
+        self.name = name
+        self.category = category
+        self.temp_bytes = 0
+        self.subprocess_time = 0.0
+
+        self.thread_id = threading.get_ident()
+        self.peak_rss = _peak_rss()
+        self.children_cpu_time = _children_cpu_time()
+        self.cpu_time = time.process_time()
+        self.start = time.perf_counter()
+
+    def record(self, profiler_start: float) -> TraceRecord:
+        end = time.perf_counter()
+        return TraceRecord(
+            name = self.name,
+            category = self.category,
+            start = self.start - profiler_start,
+            wall_time = end - self.start,
+            cpu_time = time.process_time() - self.cpu_time,
+            peak_rss_delta = _peak_rss() - self.peak_rss,
+            temp_bytes = self.temp_bytes,
+            subprocess_time = self.subprocess_time,
+            subprocess_cpu_time = _children_cpu_time() - self.children_cpu_time,
+            thread_id = self.thread_id,
+        )
+
+
+class Profiler:
+    """Context manager which records calls of traced ``Study`` methods and preprocessing functions.
+
+    Profilers can be nested, and calls from all threads are recorded.
+    Measurements of a call include all calls made inside of it.
+    """
+    def __init__(self):
+        self.records: list[TraceRecord] = []
+        self.start = time.perf_counter()
+        self._spans: list[_Span] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        with _LOCK: _PROFILERS.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with _LOCK: _PROFILERS.remove(self)
+
+    def _open(self, span: _Span):
+        with self._lock: self._spans.append(span)
+
+    def _close(self, span: _Span):
+        record = span.record(self.start)
+        with self._lock:
+            self._spans.remove(span)
+            self.records.append(record)
+
+    def _add(self, temp_bytes: int = 0, subprocess_time: float = 0.0):
+        with self._lock:
+            for span in self._spans:
+                span.temp_bytes += temp_bytes
+                span.subprocess_time += subprocess_time
+
+    def to_records(self) -> list[dict[str, Any]]:
+        """Returns a list of dictionaries with all records in order they finished,
+        which can be passed to ``pandas.DataFrame``."""
+        return [r._asdict() for r in self.records]
+
+    def summary(self) -> list[dict[str, Any]]:
+        """Returns a list of dictionaries with total measurements per function name,
+        sorted by total wall time, which can be passed to ``pandas.DataFrame``."""
+        totals: dict[str, dict[str, Any]] = {}
+        for r in self.records:
+            if r.name not in totals:
+                totals[r.name] = dict(name=r.name, category=r.category, calls=0, wall_time=0.0, cpu_time=0.0,
+                                      peak_rss_delta=0, temp_bytes=0, subprocess_time=0.0, subprocess_cpu_time=0.0)
+            total = totals[r.name]
+            total["calls"] += 1
+            for k in ("wall_time", "cpu_time", "temp_bytes", "subprocess_time", "subprocess_cpu_time"):
+                total[k] += getattr(r, k)
+            total["peak_rss_delta"] = max(total["peak_rss_delta"], r.peak_rss_delta)
+
+        return sorted(totals.values(), key = lambda x: x["wall_time"], reverse=True)
+
+    def to_chrome_trace(self, path: str | os.PathLike | None = None) -> dict[str, Any]:
+        """Returns records in Chrome trace event format, which can be opened in ``chrome://tracing``
+        or https://ui.perfetto.dev. If ``path`` is specified, it is also written to that file."""
+        pid = os.getpid()
+        events = []
+        for r in self.records:
+            args = {k: v for k, v in r._asdict().items() if k not in ("name", "category", "start", "wall_time", "thread_id")}
+            events.append(dict(
+                name=r.name, cat=r.category, ph="X", pid=pid, tid=r.thread_id,
+                ts=r.start * 1e6, dur=r.wall_time * 1e6, args=args,
+            ))
+
+        trace = {"traceEvents": events, "displayTimeUnit": "ms"}
+        if path is not None:
+            with open(path, "w", encoding="utf8") as f:
+                json.dump(trace, f)
+
+        return trace
+
+
+_PROFILERS: list[Profiler] = []
+_LOCK = threading.Lock()
+
+
+@contextmanager
+def trace(name: str, category: str = "user"):
+    """Context manager which records the code inside of it under ``name`` in all active profilers."""
+    profilers = _PROFILERS.copy()
+    if len(profilers) == 0:
+        yield
+        return
+
+    span = _Span(name, category)
+    for p in profilers: p._open(span)
+    try:
+        yield
+    finally:
+        for p in profilers: p._close(span)
+
+
+F = TypeVar("F", bound=Callable)
+
+def traced(name: str | None = None, category: str = "preprocessing") -> Callable[[F], F]:
+    """Decorator which records calls of a function in all active profilers.
+
+    Args:
+        name: name of the records, defaults to ``"{module}.{qualname}"`` of the function,
+            where module is the last part of the module name. Defaults to None.
+        category: category of the records. Defaults to "preprocessing".
+    """
+    def decorator(fn: F) -> F:
+        record_name = name if name is not None else f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if len(_PROFILERS) == 0: return fn(*args, **kwargs)
+            with trace(record_name, category):
+                return fn(*args, **kwargs)
+
+        return wrapper # type:ignore
+    return decorator
+
+
+C = TypeVar("C", bound=type)
+
+def traced_methods(category: str) -> Callable[[C], C]:
+    """Class decorator which applies ``traced`` to all public methods and classmethods defined in the class,
+    records are named ``"{class}.{method}"``."""
+    def decorator(cls: C) -> C:
+        for attr_name, attr in list(vars(cls).items()):
+            if attr_name.startswith("_"): continue
+            record_name = f"{cls.__name__}.{attr_name}"
+
+            if isinstance(attr, classmethod):
+                setattr(cls, attr_name, classmethod(traced(record_name, category)(attr.__func__)))
+            elif callable(attr) and not isinstance(attr, (staticmethod, type)):
+                setattr(cls, attr_name, traced(record_name, category)(attr))
+
+        return cls
+    return decorator
+
+
+def add_temp_bytes(n: int):
+    """Adds ``n`` bytes written to a temporary directory to all calls that are currently recorded."""
+    for p in _PROFILERS.copy(): p._add(temp_bytes=n)
+
+
+def run_subprocess(command: str | Sequence[str], name: str | None = None, **kwargs) -> subprocess.CompletedProcess:
+    """Runs ``subprocess.run(command, **kwargs)``. When profiling, the call is recorded
+    as ``"subprocess.{name}"``, where name defaults to the name of the executable,
+    and time spent waiting for it is added to all calls that are currently recorded."""
+    if len(_PROFILERS) == 0: return subprocess.run(command, **kwargs) # pylint:disable=subprocess-run-check
+
+    if name is None:
+        if isinstance(command, str): name = command.split(" ", 1)[0]
+        else: name = os.path.basename(str(command[0]))
+
+    with trace(f"subprocess.{name}", "subprocess"):
+        start = time.perf_counter()
+        try:
+            return subprocess.run(command, **kwargs) # pylint:disable=subprocess-run-check
+        finally:
+            elapsed = time.perf_counter() - start
+            for p in _PROFILERS.copy(): p._add(subprocess_time=elapsed)
@@ -0,0 +1,49 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from . import profiling
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try: size += os.path.getsize(os.path.join(root, f))
+            except OSError: pass
+    return size
+
+_SCRATCH_DIR: str | None = None
+
+def set_scratch_dir(dir: str | os.PathLike | None) -> None:
+    """Sets directory where temporary files are created, for example images passed to external tools
+    like HD-BET and SynthStrip. A directory in memory such as ``/dev/shm`` avoids writing them to disk.
+
+    Args:
+        dir: scratch directory, created if it doesn't exist. If None, the system temporary directory is used.
+    """
+    global _SCRATCH_DIR
+    if dir is not None:
+        dir = os.path.abspath(dir)
+        os.makedirs(dir, exist_ok=True)
+    _SCRATCH_DIR = dir
+
+def get_scratch_dir() -> str | None:
+    """Returns directory set by ``set_scratch_dir``, or None if the system temporary directory is used."""
+    return _SCRATCH_DIR
+
+@contextmanager
+def temporary_directory(dir: str | os.PathLike | None = None):
+    """Same as ``tempfile.TemporaryDirectory``, yields path to a temporary directory which is removed on exit.
+    When profiling, size of files in the directory on exit is recorded as temporary bytes.
+
+    Args:
+        dir: directory to create the temporary directory in,
+            if None, uses directory set by ``set_scratch_dir`` or the system default. Defaults to None.
+    """
+    if dir is None: dir = _SCRATCH_DIR
+    with tempfile.TemporaryDirectory(dir=dir) as tmpdir:
+        try:
+            yield tmpdir
+        finally:
+            if len(profiling._PROFILERS) > 0: profiling.add_temp_bytes(_dir_size(tmpdir))
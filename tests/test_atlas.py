@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from mrid.atlas import Atlas
+
+
+def make_atlas() -> Atlas:
+    image = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(np.random.rand(40, 44, 48).astype(np.float32)), 2.0)
+    image.SetSpacing((1.0, 1.0, 1.5))
+    image.SetOrigin((10, -20, 5))
+    brain = sitk.Image(image)
+    brain[:8] = 0
+    return Atlas(image, mask=brain)
+
+
+def test_atlas():
+    atlas = make_atlas()
+    assert atlas.image is atlas.image
+    assert atlas.mask is not None and atlas.mask.GetPixelID() == sitk.sitkUInt8
+    assert set(np.unique(sitk.GetArrayViewFromImage(atlas.mask)).tolist()) == {0, 1}
+
+    downsampled = atlas.at_spacing(2)
+    assert atlas.at_spacing(2.0) is downsampled
+    assert downsampled.image.GetSpacing() == (2.0, 2.0, 2.0)
+    assert downsampled.image.GetSize() == (24, 22, 30)
+    assert downsampled.image.GetOrigin() == atlas.image.GetOrigin()
+    assert downsampled.mask is not None and downsampled.mask.GetSize() == downsampled.image.GetSize()
+
+
+def test_register_to_atlas():
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import register, register_each
+
+    atlas = make_atlas()
+    moving = sitk.Resample(atlas.image, sitk.TranslationTransform(3, (1, -1, 0.5)))
+    registered = register(moving, atlas, pmap=sitk.GetDefaultParameterMap("translation"))
+    assert registered.GetSize() == atlas.image.GetSize()
+
+    registered = register_each({"t1": moving, "t2": moving}, "t1", to=atlas, pmap=sitk.GetDefaultParameterMap("translation"))
+    assert registered["t2"].GetSize() == atlas.image.GetSize()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+from operator import methodcaller
+
+import numpy as np
+import pytest
+
+from mrid import Study, StudyCollection
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_study_collection(max_workers):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirs = []
+        for i in range(3):
+            study = Study(t1=np.random.rand(10, 20, 30).astype(np.float32), info_id=i)
+            if i != 1: study = study.add("seg_brain", np.random.randint(0, 2, (10, 20, 30)).astype(np.uint8))
+            dirs.append(os.path.join(tmpdir, "raw", f"study{i}"))
+            os.makedirs(dirs[-1])
+            study.save(dirs[-1])
+
+        collection = StudyCollection.from_root(os.path.join(tmpdir, "raw"))
+        assert len(collection) == 3
+        assert collection[2]["info_id"] == 2
+
+        out = os.path.join(tmpdir, "processed")
+        pipeline = [methodcaller("resize", [5, 10, 15]), methodcaller("expand_binary_mask", "seg_brain", 1)]
+        results = collection.run(pipeline, out=out, max_workers=max_workers, verbose=False)
+
+        assert [r.index for r in results] == [0, 1, 2]
+        assert [r.ok for r in results] == [True, False, True] # study1 has no seg_brain
+        assert "KeyError" in results[1].error # type:ignore
+        assert sorted(os.listdir(out)) == ["study0", "study2"]
+
+        loaded = Study.from_dir(os.path.join(out, "study2"))
+        assert loaded.to_numpy("t1").shape == (5, 10, 15)
+        assert loaded["info_id"] == 2
+
+        # skip studies that were already processed
+        results = list(collection.map(pipeline, out=out, skip_existing=True))
+        assert [r.index for r in results] == [1]
+
+
+def _crash(study):
+    os._exit(1)
+
+
+def test_study_collection_errors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirs = []
+        for i in range(2):
+            dirs.append(os.path.join(tmpdir, "raw", f"study{i}"))
+            os.makedirs(dirs[-1])
+            Study(t1=np.random.rand(10, 20, 30).astype(np.float32)).save(dirs[-1])
+        collection = StudyCollection(dirs)
+
+        # errors of the process pool are stored in results instead of stopping the run
+        results = collection.run(lambda s: s, max_workers=2, verbose=False)
+        assert [r.index for r in results] == [0, 1]
+        assert not any(r.ok for r in results)
+
+        results = collection.run(_crash, max_workers=2, verbose=False)
+        assert [r.index for r in results] == [0, 1]
+        assert "BrokenProcessPool" in results[0].error # type:ignore
+
+        # a study that fails while saving doesn't leave its output directory
+        out = os.path.join(tmpdir, "processed")
+        results = collection.run(methodcaller("copy"), out=out, format="bad", verbose=False)
+        assert not any(r.ok for r in results)
+        assert os.listdir(out) == []
+
+        results = collection.run(methodcaller("copy"), out=out, verbose=False)
+        results = collection.run(methodcaller("resize", [5, 10, 15]), out=out, verbose=False)
+        assert all(r.ok for r in results)
+        assert sorted(os.listdir(out)) == ["study0", "study1"]
+        assert Study.from_dir(os.path.join(out, "study1")).to_numpy("t1").shape == (5, 10, 15)
+
+
+def test_save_atomic_restores_old_study(tmp_path, monkeypatch):
+    from mrid import batch
+
+    out_dir = str(tmp_path / "study")
+    Study(t1=np.zeros((4, 5, 6), dtype=np.float32)).save(out_dir)
+
+    replace = os.replace
+    def failing_replace(src, dst):
+        if os.path.basename(src).startswith(".study.") and ".old." not in src: raise OSError("can't move")
+        return replace(src, dst)
+    monkeypatch.setattr(batch.os, "replace", failing_replace)
+
+    with pytest.raises(OSError):
+        batch._save_atomic(Study(t1=np.ones((4, 5, 6), dtype=np.float32)), out_dir, {})
+
+    # old study is put back and temporary directories are removed
+    assert os.listdir(tmp_path) == ["study"]
+    assert Study.from_dir(out_dir).to_numpy("t1").max() == 0
@@ -1,5 +1,6 @@
 """sanity tests"""
 import numpy as np
+import pytest
 import SimpleITK as sitk
 
 from mrid.preprocessing import bias_field_correction
@@ -40,4 +41,458 @@ def test_crop_bg():
     assert 't1' in cropped
     assert 't2' in cropped
 
-    assert study.to_numpy("t1").shape == study.to_numpy("t2").shape
\ No newline at end of file
+    assert study.to_numpy("t1").shape == study.to_numpy("t2").shape
+
+def test_elastix_to_sitk_transforms():
+    from mrid.preprocessing.simple_elastix import elastix_grid, elastix_to_sitk_transforms
+
+    common = dict(Size=("4", "5", "6"), Spacing=("1", "2", "3"), Origin=("0", "0", "0"),
+                  Direction=("0", "1", "0", "-1", "0", "0", "0", "0", "1"), HowToCombineTransforms=("Compose",))
+    translation = dict(Transform=("TranslationTransform",), TransformParameters=("1", "2", "3"), **common)
+    affine = dict(Transform=("AffineTransform",), CenterOfRotationPoint=("0", "0", "0"),
+                  TransformParameters=("2", "0", "0", "0", "2", "0", "0", "0", "2", "0", "0", "0"), **common)
+
+    # translation is applied first, then affine
+    transform = elastix_to_sitk_transforms([translation, affine])
+    assert transform is not None
+    assert np.allclose(transform.TransformPoint((1, 1, 1)), (4, 6, 8))
+
+    # direction is stored column-major
+    assert elastix_grid(affine).direction == (0, -1, 0, 1, 0, 0, 0, 0, 1)
+
+    bspline = dict(Transform=("BSplineTransform",), TransformParameters=("0",), **common)
+    assert elastix_to_sitk_transforms([translation, bspline]) is None
+
+
+def test_invert_linear_transform():
+    from mrid.preprocessing.simple_elastix import invert_linear_transform
+
+    transform = sitk.CompositeTransform([
+        sitk.Euler3DTransform((1, 2, 3), 0.1, -0.2, 0.3, (4, 5, 6)),
+        sitk.Similarity3DTransform(1.2, (0, 0, 1), 0.4, (1, 0, 0), (2, 2, 2)),
+    ])
+    inverse = invert_linear_transform(transform, 3)
+    assert inverse is not None
+
+    for point in [(0, 0, 0), (10, -5, 3), (-1, 7, 20)]:
+        assert np.allclose(inverse.TransformPoint(transform.TransformPoint(point)), point)
+
+    singular = sitk.AffineTransform((1, 0, 0, 0, 1, 0, 0, 0, 0), (0, 0, 0))
+    assert invert_linear_transform(singular, 3) is None
+
+
+def test_simple_elastix_apply_transform():
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import SimpleElastix
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((30, 34, 32), dtype=np.float32)), 2.0)
+    fixed.SetSpacing((1.1, 0.9, 1.2))
+    fixed.SetDirection(sitk.Euler3DTransform((0, 0, 0), 0.2, 0.1, -0.3).GetMatrix())
+    center = fixed.TransformContinuousIndexToPhysicalPoint([(s - 1) / 2 for s in fixed.GetSize()])
+    moving = sitk.Resample(fixed, sitk.Euler3DTransform(center, 0.05, -0.04, 0.06, (1.5, -1, 0.5)))
+    seg = sitk.Cast(moving > 0.5, sitk.sitkUInt8)
+
+    reg = SimpleElastix()
+    registered = reg.find_transform(moving, fixed)
+    assert reg.get_sitk_transform() is not None
+
+    fast = reg.apply_transform(moving)
+    fast_seg = reg.apply_transform(seg, use_nearest_interpolation=True)
+
+    # same transform applied by transformix
+    transform = reg._transform
+    reg._transform = None
+    transformix = reg.apply_transform(moving)
+    transformix_seg = reg.apply_transform(seg, use_nearest_interpolation=True)
+
+    assert fast.GetPixelID() == transformix.GetPixelID() == sitk.sitkFloat32
+    assert np.allclose(sitk.GetArrayFromImage(fast), sitk.GetArrayFromImage(transformix), atol=1e-5)
+    assert np.allclose(sitk.GetArrayFromImage(fast), sitk.GetArrayFromImage(registered), atol=1e-5)
+    assert (sitk.GetArrayFromImage(fast_seg) != sitk.GetArrayFromImage(transformix_seg)).mean() < 1e-3
+    for a, b in ((fast.GetOrigin(), transformix.GetOrigin()), (fast.GetDirection(), transformix.GetDirection())):
+        assert np.allclose(a, b)
+
+    # analytical inverse moves segmentation back to the moving image
+    reg._transform = transform
+    inverted_seg = reg.apply_inverse_transform(fast_seg, use_nearest_interpolation=True)
+    assert reg.inverse is None
+    assert inverted_seg.GetSize() == seg.GetSize() and np.allclose(inverted_seg.GetOrigin(), seg.GetOrigin())
+    interior = (slice(5, -5),) * 3
+    assert (sitk.GetArrayFromImage(inverted_seg)[interior] != sitk.GetArrayFromImage(seg)[interior]).mean() < 0.02
+
+
+def test_register_each_parallel():
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import register_each
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((24, 26, 28), dtype=np.float32)), 2.0)
+    center = fixed.TransformContinuousIndexToPhysicalPoint([(s - 1) / 2 for s in fixed.GetSize()])
+    images = {
+        "t1": fixed,
+        "t2": sitk.Resample(fixed, sitk.Euler3DTransform(center, 0.05, 0, 0, (1, 0, 0))),
+        "flair": sitk.Resample(fixed, sitk.Euler3DTransform(center, 0, -0.05, 0, (0, -1, 0))),
+    }
+    pmap = sitk.GetDefaultParameterMap("rigid")
+
+    sequential = register_each(images, "t1", pmap=pmap)
+    parallel = register_each(images, "t1", pmap=pmap, max_workers=2)
+
+    assert list(parallel.keys()) == list(images.keys())
+    for k in images:
+        assert np.allclose(sitk.GetArrayFromImage(sequential[k]), sitk.GetArrayFromImage(parallel[k]), atol=1e-4)
+
+
+def test_moments_initial_transform():
+    from mrid.preprocessing.simple_elastix import moments_initial_transform
+
+    fixed = sitk.GetImageFromArray(np.zeros((40, 40, 40), dtype=np.float32))
+    fixed[10:20, 12:22, 14:24] = 1
+    moving = sitk.Image(fixed)
+    moving.SetOrigin((5, -3, 2))
+
+    # moving image shifted by origin has its center of mass shifted by the same offset
+    transform = moments_initial_transform(moving, fixed)
+    assert np.allclose(transform.GetOffset(), (5, -3, 2), atol=0.5)
+
+
+def test_simple_elastix_moments_initializer():
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import SimpleElastix
+
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(np.random.rand(30, 34, 32).astype(np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (3, -2, 1)))
+    seg = sitk.Cast(moving > 0.5, sitk.sitkUInt8)
+
+    reg = SimpleElastix(initializer="moments")
+    assert len(reg.pmap) == 2
+    registered = reg.find_transform(moving, fixed)
+
+    # transform includes the initial translation
+    assert np.allclose(reg.get_sitk_transform().TransformPoint((0, 0, 0)), (-3, 2, -1), atol=0.5)
+    assert np.allclose(sitk.GetArrayFromImage(reg.apply_transform(moving)), sitk.GetArrayFromImage(registered), atol=1e-5)
+
+    inverted_seg = reg.apply_inverse_transform(reg.apply_transform(seg, True), use_nearest_interpolation=True)
+    assert np.allclose(inverted_seg.GetOrigin(), seg.GetOrigin())
+    interior = (slice(5, -5),) * 3
+    assert (sitk.GetArrayFromImage(inverted_seg)[interior] != sitk.GetArrayFromImage(seg)[interior]).mean() < 0.02
+
+
+def test_transform_parameter_maps(tmp_path):
+    from mrid.preprocessing.simple_elastix import (
+        apply_transform_parameter_maps,
+        linear_transform_parameter_map,
+        read_parameter_file,
+        write_parameter_file,
+    )
+    from mrid.preprocessing.spatial import Grid
+
+    image = sitk.GetImageFromArray(np.random.default_rng(0).random((10, 12, 14), dtype=np.float32))
+    image.SetSpacing((1.1, 0.9, 1.2))
+    image.SetDirection(sitk.Euler3DTransform((0, 0, 0), 0.2, 0.1, -0.3).GetMatrix())
+    transform = sitk.Euler3DTransform((5, 5, 5), 0.05, -0.04, 0.06, (1.5, -1, 0.5))
+
+    tmap = linear_transform_parameter_map(transform, Grid.from_image(image))
+    write_parameter_file(tmap, tmp_path / "transform.txt")
+    assert read_parameter_file(tmp_path / "transform.txt") == tmap
+
+    transformed = apply_transform_parameter_maps(image, [tmap])
+    expected = sitk.Resample(image, image, transform, sitk.sitkBSpline3)
+    assert transformed.GetPixelID() == sitk.sitkFloat32
+    assert np.allclose(sitk.GetArrayFromImage(transformed), sitk.GetArrayFromImage(expected), atol=1e-5)
+
+
+def test_simple_elastix_transform_parameter_maps(tmp_path):
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import (
+        SimpleElastix,
+        apply_transform_parameter_maps,
+        read_parameter_file,
+        write_parameter_file,
+    )
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((30, 34, 32), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (3, -2, 1)))
+    seg = sitk.Cast(moving > 0.5, sitk.sitkUInt8)
+
+    reg = SimpleElastix(initializer="moments")
+    registered = reg.find_transform(moving, fixed)
+
+    # maps include the initial translation and survive writing to elastix parameter files
+    tmaps = reg.get_transform_parameter_maps()
+    for i, tmap in enumerate(tmaps): write_parameter_file(tmap, tmp_path / f"{i}.txt")
+    tmaps = [read_parameter_file(tmp_path / f"{i}.txt") for i in range(len(tmaps))]
+
+    transformed = apply_transform_parameter_maps(moving, tmaps)
+    assert np.allclose(sitk.GetArrayFromImage(transformed), sitk.GetArrayFromImage(registered), atol=1e-5)
+    transformed_seg = apply_transform_parameter_maps(seg, tmaps, use_nearest_interpolation=True)
+    assert np.array_equal(sitk.GetArrayFromImage(transformed_seg), sitk.GetArrayFromImage(reg.apply_transform(seg, True)))
+
+
+def test_sitk_registration():
+    from mrid.preprocessing.sitk_registration import SitkRegistration, register_each
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((40, 44, 48), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    seg = sitk.Cast(moving > 0.5, sitk.sitkUInt8)
+
+    reg = SitkRegistration(transform="rigid")
+    registered = reg.find_transform(moving, fixed)
+    assert registered.GetSize() == fixed.GetSize() and registered.GetPixelID() == sitk.sitkFloat32
+    assert np.allclose(reg.get_sitk_transform().TransformPoint((0, 0, 0)), (-2, 1, -1), atol=0.5)
+
+    registered_seg = reg.apply_transform(seg, use_nearest_interpolation=True)
+    assert registered_seg.GetPixelID() == sitk.sitkUInt8
+    inverted_seg = reg.apply_inverse_transform(registered_seg, use_nearest_interpolation=True)
+    interior = (slice(5, -5),) * 3
+    assert (sitk.GetArrayFromImage(inverted_seg)[interior] != sitk.GetArrayFromImage(seg)[interior]).mean() < 0.02
+
+    registered = register_each({"t1": fixed, "t2": moving}, "t1", transform="rigid")
+    assert list(registered.keys()) == ["t1", "t2"] and registered["t1"] is fixed
+
+
+def test_sitk_registration_presets_and_masks():
+    from mrid.preprocessing.sitk_registration import PRESETS, SitkRegistration
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((40, 44, 48), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    fixed_mask = sitk.GetImageFromArray(np.pad(np.ones((30, 34, 38), dtype=np.uint8), 5))
+
+    for preset in PRESETS:
+        reg = SitkRegistration(transform="rigid", preset=preset)
+        reg.find_transform(moving, fixed, fixed_mask=fixed_mask, moving_mask=moving > 0.5)
+        assert np.allclose(reg.get_sitk_transform().TransformPoint((0, 0, 0)), (-2, 1, -1), atol=0.5), preset
+
+    with pytest.raises(RuntimeError):
+        SitkRegistration(preset="slow")
+
+
+def test_simple_elastix_presets_and_masks():
+    if not hasattr(sitk, "ElastixImageFilter"): pytest.skip("SimpleElastix is not installed")
+    from mrid.preprocessing.simple_elastix import SimpleElastix
+
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((40, 44, 48), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    fixed_mask = sitk.GetImageFromArray(np.pad(np.ones((30, 34, 38), dtype=np.uint8), 5))
+
+    reg = SimpleElastix(preset="fast")
+    assert all(m["NumberOfResolutions"] == ("3",) for m in reg.pmap)
+    reg.find_transform(moving, fixed, fixed_mask=fixed_mask, moving_mask=moving > 0.5)
+    assert np.allclose(reg.get_sitk_transform().TransformPoint((0, 0, 0)), (-2, 1, -1), atol=0.5)
+
+    with pytest.raises(RuntimeError):
+        SimpleElastix(pmap=sitk.GetDefaultParameterMap("rigid"), preset="fast")
+
+
+def test_hd_bet_predictor():
+    from mrid import Study
+    from mrid.preprocessing.hd_bet import skullstrip_D
+
+    class FakePredictor:
+        """Stands in for ``HDBetPredictor``, which needs HD-BET and its weights."""
+        def __init__(self): self.calls = 0
+        def predict(self, input):
+            self.calls += 1
+            return sitk.Cast(input > 0.5, sitk.sitkUInt8)
+
+    rng = np.random.default_rng(0)
+    t1 = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((20, 22, 24), dtype=np.float32)), 2.0)
+    t2 = t1 * 2
+
+    predictor = FakePredictor()
+    skullstripped = skullstrip_D({"t1": t1, "t2": t2}, "t1", predictor=predictor, include_mask=True)
+    assert predictor.calls == 1
+    mask = sitk.GetArrayFromImage(t1) > 0.5
+    assert (sitk.GetArrayFromImage(skullstripped["seg_hd_bet"]) == mask).all()
+    t2_skullstripped = sitk.GetArrayFromImage(skullstripped["t2"])
+    assert (t2_skullstripped[~mask] == t2_skullstripped[mask].min()).all()
+
+    Study(t1=t1, t2=t2).skullstrip_hd_bet("t1", predictor=predictor)
+    assert predictor.calls == 2
+
+
+def test_hd_bet_folder_mode(tmp_path, monkeypatch):
+    import os
+    import sys
+    from mrid import Study
+    from mrid.preprocessing.hd_bet import predict_brain_masks
+    if sys.platform == "win32": pytest.skip("fake hd-bet command is a script with a shebang")
+
+    # fake hd-bet command that thresholds each input in the folder and logs its calls
+    log = tmp_path / "calls.txt"
+    script = tmp_path / "bin" / "hd-bet"
+    script.parent.mkdir()
+    script.write_text(f"""#!{sys.executable}
+import os, sys
+import SimpleITK as sitk
+args = sys.argv[1:]
+input_dir, output_dir = args[args.index("-i") + 1], args[args.index("-o") + 1]
+os.makedirs(output_dir, exist_ok=True)
+files = sorted(f for f in os.listdir(input_dir) if f.endswith(".nii.gz"))
+for f in files:
+    mask = sitk.Cast(sitk.ReadImage(os.path.join(input_dir, f)) > 0.5, sitk.sitkUInt8)
+    sitk.WriteImage(mask, os.path.join(output_dir, f[:-7] + "_bet.nii.gz"))
+with open({str(log)!r}, "a") as log:
+    log.write(str(len(files)) + "\\n")
+""")
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{script.parent}{os.pathsep}{os.environ['PATH']}")
+
+    rng = np.random.default_rng(0)
+    images = [sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((12, 14, 16), dtype=np.float32)), 2.0)
+              for _ in range(5)]
+
+    masks = predict_brain_masks(images, chunk_size=2)
+    assert log.read_text().split() == ["2", "2", "1"]
+    for image, mask in zip(images, masks):
+        assert (sitk.GetArrayFromImage(mask) == (sitk.GetArrayFromImage(image) > 0.5)).all()
+
+    studies = [Study(t1=image, info_id=i) for i, image in enumerate(images)]
+    skullstripped = Study.skullstrip_hd_bet_batch(studies, "t1", chunk_size=None, include_mask=True)
+    assert log.read_text().split() == ["2", "2", "1", "5"]
+    assert [s["info_id"] for s in skullstripped] == list(range(5))
+    assert all((sitk.GetArrayFromImage(s["seg_hd_bet"]) == sitk.GetArrayFromImage(m)).all()
+               for s, m in zip(skullstripped, masks))
+
+
+def _fake_mri_synthstrip(dir):
+    """Writes a script that stands in for mri_synthstrip, it logs pid of the process that runs it to ``pids.txt``."""
+    script = dir / "mri_synthstrip"
+    script.write_text("""
+import argparse, os, subprocess
+import SimpleITK as sitk
+parser = argparse.ArgumentParser()
+parser.add_argument("-i")
+parser.add_argument("-m")
+args = parser.parse_args()
+print("progress output goes to stderr")
+# wrapper scripts write to stdout from subprocesses, e.g. a container runtime
+subprocess.run(["echo", "subprocess output goes to stderr"], check=True)
+sitk.WriteImage(sitk.Cast(sitk.ReadImage(args.i) > 0.5, sitk.sitkUInt8), args.m)
+with open(os.path.join(os.path.dirname(__file__), "pids.txt"), "a") as f:
+    f.write(f"{os.getpid()}\\n")
+""")
+    return script
+
+
+def test_synthstrip_worker(tmp_path):
+    import os
+    import sys
+    from mrid import Study
+    from mrid.preprocessing.synthstrip import SynthStripWorker, predict_brain_mask
+
+    script = _fake_mri_synthstrip(tmp_path)
+
+    rng = np.random.default_rng(0)
+    images = [sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((12, 14, 16), dtype=np.float32)), 2.0)
+              for _ in range(3)]
+
+    with SynthStripWorker.from_script(script, python=sys.executable, shared_dir=tmp_path, verbose=False) as worker:
+        masks = [predict_brain_mask(worker, image) for image in images]
+        skullstripped = Study(t1=images[0]).skullstrip_synthstrip(worker, "t1", include_mask=True)
+
+        with pytest.raises(RuntimeError):
+            worker.run(["-i", str(tmp_path / "missing.nii.gz"), "-m", str(tmp_path / "mask.nii.gz")])
+        # failed image doesn't stop the worker
+        predict_brain_mask(worker, images[0])
+
+    for image, mask in zip(images, masks):
+        assert (sitk.GetArrayFromImage(mask) == (sitk.GetArrayFromImage(image) > 0.5)).all()
+    assert (sitk.GetArrayFromImage(skullstripped["seg_synthstrip"]) == sitk.GetArrayFromImage(masks[0])).all()
+
+    pids = (tmp_path / "pids.txt").read_text().split()
+    assert len(pids) == 5 and len(set(pids)) == 1 and int(pids[0]) != os.getpid()
+
+
+def test_synthstrip_batch(tmp_path, monkeypatch):
+    import os
+    import sys
+    from mrid import Study
+    from mrid.preprocessing.synthstrip import SynthStripWorker, predict_brain_masks
+    if sys.platform == "win32": pytest.skip("python is linked into a directory on PATH")
+
+    # scripts are run with "python"
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "python").symlink_to(sys.executable)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    script = _fake_mri_synthstrip(tmp_path)
+
+    rng = np.random.default_rng(0)
+    images = [sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((12, 14, 16), dtype=np.float32)), 2.0)
+              for _ in range(4)]
+
+    masks = predict_brain_masks(script, images, verbose=False)
+    for image, mask in zip(images, masks):
+        assert (sitk.GetArrayFromImage(mask) == (sitk.GetArrayFromImage(image) > 0.5)).all()
+
+    studies = [Study(t1=image, info_id=i) for i, image in enumerate(images)]
+    skullstripped = Study.skullstrip_synthstrip_batch(script, studies, "t1", include_mask=True, verbose=False)
+    assert [s["info_id"] for s in skullstripped] == list(range(4))
+    assert all((sitk.GetArrayFromImage(s["seg_synthstrip"]) == sitk.GetArrayFromImage(m)).all()
+               for s, m in zip(skullstripped, masks))
+
+    # one worker process per call
+    pids = (tmp_path / "pids.txt").read_text().split()
+    assert len(pids) == 8 and len(set(pids[:4])) == 1 and len(set(pids[4:])) == 1 and pids[0] != pids[4]
+
+    # passed worker processes all images
+    with SynthStripWorker.from_script(script, python=sys.executable, shared_dir=tmp_path, verbose=False) as worker:
+        worker_masks = predict_brain_masks(worker, images)
+        Study.skullstrip_synthstrip_batch(worker, studies, "t1", verbose=False)
+    assert all((sitk.GetArrayFromImage(a) == sitk.GetArrayFromImage(b)).all() for a, b in zip(masks, worker_masks))
+    pids = (tmp_path / "pids.txt").read_text().split()
+    assert len(pids) == 16 and len(set(pids[8:])) == 1
+
+    # wrapper scripts, like the ones that run SynthStrip in Docker, print to stdout from a subprocess
+    wrapper = tmp_path / "wrapper"
+    wrapper.write_text(f"""
+import subprocess, sys
+print("starting container")
+sys.exit(subprocess.run(["python", {str(script)!r}, *sys.argv[1:]]).returncode)
+""")
+    wrapper_masks = predict_brain_masks(wrapper, images[:2], verbose=False)
+    assert all((sitk.GetArrayFromImage(a) == sitk.GetArrayFromImage(b)).all() for a, b in zip(masks, wrapper_masks))
+
+
+def test_synthstrip_worker_loads_weights_once(tmp_path):
+    import sys
+    torch = pytest.importorskip("torch")
+    from mrid.preprocessing.synthstrip import SynthStripWorker, predict_brain_masks
+
+    torch.save({"threshold": torch.tensor(0.5)}, tmp_path / "weights.pt")
+    script = tmp_path / "mri_synthstrip"
+    script.write_text("""
+import argparse, os
+import SimpleITK as sitk
+import torch
+parser = argparse.ArgumentParser()
+parser.add_argument("-i")
+parser.add_argument("-m")
+args = parser.parse_args()
+dir = os.path.dirname(__file__)
+checkpoint = torch.load(os.path.join(dir, "weights.pt"))
+sitk.WriteImage(sitk.Cast(sitk.ReadImage(args.i) > float(checkpoint["threshold"]), sitk.sitkUInt8), args.m)
+with open(os.path.join(dir, "checkpoints.txt"), "a") as f:
+    f.write(f"{id(checkpoint)}\\n")
+""")
+
+    rng = np.random.default_rng(0)
+    images = [sitk.GetImageFromArray(rng.random((12, 14, 16), dtype=np.float32)) for _ in range(3)]
+    with SynthStripWorker.from_script(script, python=sys.executable, shared_dir=tmp_path, verbose=False) as worker:
+        masks = predict_brain_masks(worker, images)
+
+    for image, mask in zip(images, masks):
+        assert (sitk.GetArrayFromImage(mask) == (sitk.GetArrayFromImage(image) > 0.5)).all()
+    checkpoints = (tmp_path / "checkpoints.txt").read_text().split()
+    assert len(checkpoints) == 3 and len(set(checkpoints)) == 1
@@ -105,6 +105,46 @@ def test_stack_numpy():
     stacked = study.stack_numpy(scans=True, seg=False)
     assert stacked.shape == (2, 10, 20, 30)  # 2 images, each 10x20x30
 
+
+def test_stack_empty():
+    study = Study(info_id=1)
+    assert study.stack_numpy().shape == (0,)
+    assert study.stack_numpy(dtype=np.float32).dtype == np.float32
+
+    torch = pytest.importorskip("torch")
+    assert study.stack_tensor().shape == (0,)
+
+
+def test_zero_copy_export():
+    study = Study(
+        t1=np.random.rand(10, 20, 30).astype(np.float32),
+        t2=np.random.rand(10, 20, 30),
+        seg=np.random.randint(0, 4, (10, 20, 30)).astype(np.uint8),
+    )
+
+    view = study.to_numpy("t1", view=True)
+    assert not view.flags.writeable
+    assert np.array_equal(view, study.to_numpy("t1"))
+
+    # dtypes are promoted like in numpy
+    stacked = study.stack_numpy(seg=True)
+    assert stacked.dtype == np.float64
+    assert np.array_equal(stacked[2], study.to_numpy("seg"))
+    assert study.stack_numpy(order=["seg"]).dtype == np.uint8
+    assert study.stack_numpy(dtype=np.float32).dtype == np.float32
+
+    with pytest.raises(RuntimeError):
+        study.add("t3", np.zeros((5, 5, 5)), reference_key=None).stack_numpy()
+
+    torch = pytest.importorskip("torch")
+    tensor = study.stack_tensor(seg=True)
+    assert tensor.dtype == torch.float64
+    assert np.array_equal(tensor.numpy(), stacked)
+    assert study.stack_tensor(dtype=torch.float32).dtype == torch.float32
+
+    tensors = study.to_tensor_dict()
+    assert tensors["t1"].shape == (10, 20, 30)
+
 @pytest.mark.parametrize("prefix", ("", "prefix"))
 @pytest.mark.parametrize("suffix", ("", "suffix"))
 def test_serialization(prefix,suffix):
@@ -133,4 +173,337 @@ def test_serialization(prefix,suffix):
             assert sitk.GetArrayFromImage(v).dtype == sitk.GetArrayFromImage(loaded[k]).dtype
             assert np.all(sitk.GetArrayFromImage(v) == sitk.GetArrayFromImage(loaded[k]))
         else:
-            assert v == loaded[k]
\ No newline at end of file
+            assert v == loaded[k]
+
+@pytest.mark.parametrize("max_workers", [None, 4])
+def test_serialization_parallel(max_workers):
+    study = Study(
+        t1=np.random.rand(10, 20, 30).astype(np.float32),
+        t2=np.random.rand(10, 20, 30).astype(np.float32),
+        seg=np.random.randint(0, 4, (10, 20, 30)).astype(np.uint8),
+        info_id=10,
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # non ascii paths are written through a temporary directory
+        out_dir = os.path.join(tmpdir, "исследование")
+        study.save(out_dir, compression_level=1, max_workers=max_workers)
+        loaded = Study.from_dir(out_dir, max_workers=max_workers)
+
+    assert sorted(loaded.keys()) == sorted(study.keys())
+    assert np.array_equal(loaded.stack_numpy(seg=True), study.stack_numpy(seg=True))
+    assert loaded["info_id"] == 10
+
+def test_lazy_load():
+    from mrid.loading import FileImage
+
+    image = sitk.GetImageFromArray(np.random.rand(10, 20, 30).astype(np.float32))
+    image.SetSpacing((0.5, 1.0, 2.0))
+    study = Study(t1=image, seg=np.random.randint(0, 4, (10, 20, 30)).astype(np.uint8))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        study.save(tmpdir)
+        loaded = Study.from_dir(tmpdir, lazy=True)
+
+        assert isinstance(loaded.data["t1"], FileImage)
+        header = loaded.get_header("t1")
+        assert header == study.get_header("t1")
+        assert header.size == (30, 20, 10) and header.spacing == (0.5, 1.0, 2.0)
+        assert header.pixel_id == sitk.sitkFloat32
+        assert loaded.get_header("seg").pixel_id == sitk.sitkUInt8
+
+        # voxels are read on first access
+        assert np.array_equal(loaded.to_numpy("t1"), study.to_numpy("t1"))
+        assert loaded["t1"] is loaded["t1"]
+
+def test_memmap_vector_image(tmp_path):
+    from mrid.loading import ImageHeader, MemmapImage, save_memmap_image
+
+    for shape in ((5, 6, 7, 3), (6, 7, 2)):
+        image = sitk.GetImageFromArray(np.random.rand(*shape).astype(np.float32), isVector=True)
+        image.SetOrigin((1.0,) * image.GetDimension())
+        save_memmap_image(image, tmp_path / "image.npy")
+
+        memmap = MemmapImage(tmp_path / "image.npy")
+        loaded = memmap.load()
+        assert memmap.header() == ImageHeader.from_image(loaded) == ImageHeader.from_image(image)
+        assert loaded.GetNumberOfComponentsPerPixel() == shape[-1]
+        assert np.array_equal(sitk.GetArrayFromImage(loaded), sitk.GetArrayFromImage(image))
+
+
+def test_serialization_mmap():
+    from mrid.loading import MemmapImage
+
+    image = sitk.GetImageFromArray(np.random.rand(10, 20, 30).astype(np.float32))
+    image.SetSpacing((0.5, 1.0, 2.0))
+    image.SetOrigin((1.0, 2.0, 3.0))
+    study = Study(t1=image, seg=np.random.randint(0, 4, (10, 20, 30)).astype(np.uint8), info_id=10)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        study.save(tmpdir, format="mmap")
+        loaded = Study.from_dir(tmpdir, format="mmap")
+
+        # images are memory-mapped and not loaded until accessed
+        assert isinstance(loaded.data["t1"], MemmapImage)
+        assert loaded.get_header("seg") == study.get_header("seg")
+        view = loaded.to_numpy("t1", view=True)
+        assert isinstance(view, np.memmap) and not view.flags.writeable
+        assert np.array_equal(loaded.stack_numpy(seg=True), study.stack_numpy(seg=True))
+
+        # operations that don't change an image keep it memory-mapped
+        normalized = loaded.normalize()
+        assert normalized.data["seg"] is loaded.data["seg"]
+
+        assert loaded["info_id"] == 10
+        assert loaded["t1"].GetSpacing() == (0.5, 1.0, 2.0)
+        assert loaded["t1"].GetOrigin() == (1.0, 2.0, 3.0)
+        assert loaded["seg"].GetPixelID() == sitk.sitkUInt8
+        assert np.array_equal(loaded.to_numpy("t1"), study.to_numpy("t1"))
+        del view, loaded, normalized
+
+def test_lazy():
+    study = Study(
+        t1=np.random.rand(20, 30, 40).astype(np.float32),
+        seg_brain=np.random.randint(0, 3, (20, 30, 40)).astype(np.uint8),
+        info_id=10,
+    )
+
+    eager = study.center_crop_or_pad([30, 24, 16]).resize([8, 12, 15]).cast_float64()
+    lazy = study.lazy().center_crop_or_pad([30, 24, 16]).resize([8, 12, 15]).cast_float64()
+    assert len(lazy.plan) == 2 # one fused resampling and one intensity pass
+    assert lazy.get_grids()["t1"].size == (15, 12, 8)
+
+    computed = lazy.compute()
+    assert sorted(computed.keys()) == sorted(eager.keys())
+    assert computed["info_id"] == 10
+
+    # fused resampling only differs from eager near the borders
+    for k in ("t1", "seg_brain"):
+        assert computed.to_numpy(k).shape == eager.to_numpy(k).shape == (8, 12, 15)
+        assert computed[k].GetOrigin() == eager[k].GetOrigin()
+        assert computed[k].GetSpacing() == eager[k].GetSpacing()
+        assert np.allclose(computed.to_numpy(k)[1:-1, 1:-1, 1:-1], eager.to_numpy(k)[1:-1, 1:-1, 1:-1], atol=1e-5)
+
+    assert set(np.unique(computed.to_numpy("seg_brain"))).issubset({0, 1, 2})
+
+
+def test_lazy_numpy_and_barrier():
+    study = Study(t1=np.random.rand(10, 20, 30).astype(np.float32))
+
+    lazy = study.lazy().apply_numpy(lambda x: x * 2, None).apply_numpy(lambda x: x + 1, None)
+    assert np.allclose(lazy.compute().to_numpy("t1"), study.to_numpy("t1") * 2 + 1)
+
+    # methods that can't be recorded compute the plan
+    cropped = lazy.crop_bg("t1")
+    assert cropped.plan == []
+    assert lazy.stack_numpy().shape[0] == 1
+
+
+def test_lazy_memoized_and_mapping():
+    study = Study(t1=np.random.rand(10, 20, 30).astype(np.float32), info_id=1)
+
+    calls = []
+    def fn(x):
+        calls.append(1)
+        return x * 2
+
+    lazy = study.lazy().apply_numpy(fn, None)
+    assert np.allclose(sitk.GetArrayFromImage(lazy["t1"]), study.to_numpy("t1") * 2)
+    assert "t1" in lazy and "seg" not in lazy
+    assert list(lazy) == list(lazy.keys()) == ["t1", "info_id"]
+    assert lazy.to_numpy("t1").shape == (10, 20, 30)
+    assert len(calls) == 1
+
+    # adding steps creates a new plan which is computed again
+    lazy.normalize()["t1"]
+    assert len(calls) == 2
+
+
+def test_shared_images():
+    study = Study(
+        t1=np.random.rand(10, 20, 30).astype(np.float32),
+        seg_brain=np.random.randint(0, 2, (10, 20, 30)),
+        info_id=10,
+    )
+    study["t1"].SetOrigin((1, 2, 3))
+
+    # filtered studies share images
+    assert study.get_scans()["t1"] is study["t1"]
+    assert study.apply(None, None)["seg_brain"] is study["seg_brain"]
+    assert study.remove("seg_brain")["t1"] is study["t1"]
+
+    # adding with a reference key doesn't modify the added image
+    image = sitk.GetImageFromArray(np.random.rand(10, 20, 30).astype(np.float32))
+    added = study.add("t2", image, reference_key="t1")
+    assert added["t2"].GetOrigin() == (1, 2, 3)
+    assert image.GetOrigin() == (0, 0, 0)
+    assert "t2" not in study
+
+    with pytest.raises(KeyError):
+        study.remove("t2")
+
+
+@pytest.mark.parametrize("max_workers", [None, 1, 4])
+def test_apply_parallel(max_workers):
+    from concurrent.futures import ThreadPoolExecutor
+    study = Study(
+        t1=np.random.rand(10, 20, 30).astype(np.float32),
+        t2=np.random.rand(10, 20, 30).astype(np.float32),
+        seg_brain=np.random.randint(0, 2, (10, 20, 30)),
+    )
+    num_threads = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+
+    resized = study.resize([5, 10, 15], max_workers=max_workers)
+    assert list(resized.keys()) == ["t1", "t2", "seg_brain"]
+    for k in resized:
+        assert resized.to_numpy(k).shape == (5, 10, 15)
+        assert np.array_equal(resized.to_numpy(k), study.resize([5, 10, 15]).to_numpy(k))
+
+    with ThreadPoolExecutor(2) as executor:
+        doubled = study.apply_numpy(lambda x: x * 2, None, executor=executor)
+    assert np.allclose(doubled.to_numpy("t2"), study.to_numpy("t2") * 2)
+    assert doubled["seg_brain"] is study["seg_brain"]
+
+    assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == num_threads
+
+
+def test_cache(monkeypatch):
+    from mrid import cache, preprocessing
+
+    calls = []
+    n4 = preprocessing.bias_field_correction.n4_bias_field_correction
+    def counted_n4(*args, **kwargs):
+        calls.append(1)
+        return n4(*args, **kwargs)
+    monkeypatch.setattr(preprocessing.bias_field_correction, "n4_bias_field_correction", counted_n4)
+
+    study = Study(t1=np.random.rand(10, 20, 30).astype(np.float32), t2=np.random.rand(10, 20, 30), info_id=1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache.set_cache(tmpdir)
+        try:
+            corrected = study.n4_bias_field_correction("t1", postfix="_n4")
+            cached = study.n4_bias_field_correction("t1", postfix="_n4")
+            assert len(calls) == 1
+
+            assert list(cached.keys()) == list(corrected.keys()) == ["t1", "t2", "info_id", "t1_n4"]
+            assert cached["t2"] is study["t2"]
+            assert np.array_equal(cached.to_numpy("t1_n4"), corrected.to_numpy("t1_n4"))
+
+            # different arguments or inputs are computed again
+            study.n4_bias_field_correction("t1", postfix="_n4", shrink=2)
+            study.add("info_id", 2).n4_bias_field_correction("t1", postfix="_n4")
+            assert len(calls) == 3
+
+            # least recently used entries are removed
+            cache.set_cache(tmpdir, max_size=0)
+            study.n4_bias_field_correction("t2")
+            assert len(os.listdir(tmpdir)) == 0
+
+        finally:
+            cache.set_cache(None)
+
+
+def test_cache_keys(tmp_path, monkeypatch):
+    from pathlib import Path
+    from mrid import cache, preprocessing
+
+    # strings are not files, so keys don't depend on the current directory
+    (tmp_path / "t1").write_text("x")
+    key = cache.hash_values("t1")
+    monkeypatch.chdir(tmp_path)
+    assert cache.hash_values("t1") == key
+    key = cache.hash_values(Path("t1"))
+    (tmp_path / "t1").write_text("changed")
+    assert cache.hash_values(Path("t1")) != key
+
+    # "auto" backend is resolved before hashing
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((32, 32, 32), dtype=np.float32)), 2.0)
+    study = Study(t1=sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1))))
+    backend = "elastix" if preprocessing.sitk_registration.get_backend("auto") is preprocessing.simple_elastix else "sitk"
+    cache.set_cache(tmp_path / "cache")
+    try:
+        study.register_SE("t1", fixed)
+        study.register_SE("t1", fixed, backend=backend)
+        assert len(os.listdir(tmp_path / "cache")) == 1
+
+        # path to the target is hashed as a file, so it is registered again when the file changes
+        sitk.WriteImage(fixed, tmp_path / "fixed.nii")
+        study.register_SE("t1", str(tmp_path / "fixed.nii"), backend="sitk")
+        study.register_SE("t1", str(tmp_path / "fixed.nii"), backend="sitk")
+        assert len(os.listdir(tmp_path / "cache")) == 2
+        sitk.WriteImage(sitk.Resample(fixed, sitk.TranslationTransform(3, (0, 1, 0))), tmp_path / "fixed.nii")
+        stat = os.stat(tmp_path / "fixed.nii")
+        os.utime(tmp_path / "fixed.nii", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        study.register_SE("t1", str(tmp_path / "fixed.nii"), backend="sitk")
+        assert len(os.listdir(tmp_path / "cache")) == 3
+    finally:
+        cache.set_cache(None)
+
+
+def test_register_sitk_backend():
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((32, 32, 32), dtype=np.float32)), 2.0)
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    study = Study(t1=moving, seg=sitk.Cast(moving > 0.5, sitk.sitkUInt8))
+
+    registered = study.register_SE("t1", fixed, backend="sitk")
+    assert registered["t1"].GetSize() == fixed.GetSize()
+    assert registered["seg"].GetPixelID() == sitk.sitkUInt8
+
+    # moving mask can be a key of the study
+    masked = study.register_SE("t1", fixed, moving_mask="seg", preset="fast", backend="sitk")
+    assert list(masked.keys()) == list(registered.keys())
+
+    with pytest.raises(RuntimeError):
+        study.register_SE("t1", fixed, pmap={"Transform": ["EulerTransform"]}, backend="sitk")
+
+
+def test_stored_transform():
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((32, 32, 32), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    seg = sitk.Cast(moving > 0.5, sitk.sitkUInt8)
+
+    registered = Study(t1=moving, seg=seg, info_id=1).register_SE("t1", fixed, backend="sitk")
+    assert list(registered.keys()) == ["t1", "seg", "info_id", "info_transform_t1"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        registered.save(tmpdir)
+        assert "info_transform_t1.0.txt" in os.listdir(tmpdir)
+        loaded = Study.from_dir(tmpdir)
+    assert loaded["info_transform_t1"] == registered["info_transform_t1"]
+
+    # segmentation added after registration is transformed without registering again
+    transformed = loaded.add("seg_new", seg).apply_stored_transform("seg_new")
+    assert transformed["seg_new"].GetSize() == fixed.GetSize()
+    assert np.array_equal(transformed.to_numpy("seg_new"), registered.to_numpy("seg"))
+
+
+def test_lazy_register_sitk_backend():
+    rng = np.random.default_rng(0)
+    fixed = sitk.SmoothingRecursiveGaussian(sitk.GetImageFromArray(rng.random((32, 32, 32), dtype=np.float32)), 2.0)
+    fixed = sitk.Mask(fixed, sitk.Cast(fixed > 0.5, sitk.sitkUInt8))
+    moving = sitk.Resample(fixed, sitk.TranslationTransform(3, (2, -1, 1)))
+    study = Study(t1=moving, seg=sitk.Cast(moving > 0.5, sitk.sitkUInt8))
+
+    lazy = study.lazy().register_SE("t1", fixed, backend="sitk").resize([16, 16, 16])
+    assert len(lazy.plan) == 1 # registration and resize are one resampling
+    assert lazy.get_grids()["t1"].size == (16, 16, 16)
+
+    computed = lazy.compute()
+    eager = study.register_SE("t1", fixed, backend="sitk").resize([16, 16, 16])
+    assert computed["seg"].GetPixelID() == sitk.sitkUInt8
+    for k in ("t1", "seg"):
+        assert computed[k].GetSize() == eager[k].GetSize()
+        assert np.allclose(computed[k].GetOrigin(), eager[k].GetOrigin())
+
+    inner = (slice(2, -2), ) * 3
+    assert np.abs(computed.to_numpy("t1")[inner] - eager.to_numpy("t1")[inner]).mean() < 0.02
+
+    # transform is stored like in eager registration
+    assert list(computed.keys()) == list(eager.keys()) == ["t1", "seg", "info_transform_t1"]
+    transformed = computed.add("seg_new", study["seg"]).apply_stored_transform("seg_new")
+    assert transformed["seg_new"].GetSize() == fixed.GetSize()
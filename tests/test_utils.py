@@ -13,4 +13,91 @@ def test_lazy_loader_nonexistent_module():
     loader = LazyLoader("this_module_does_not_exist_12345")
 
     with pytest.raises(ImportError):
-        _ = loader.some_attribute
\ No newline at end of file
+        _ = loader.some_attribute
+
+def test_profiler():
+    import os
+    import sys
+
+    import numpy as np
+
+    from mrid import Study
+    from mrid.utils.profiling import Profiler, run_subprocess, trace
+    from mrid.utils.tempfiles import temporary_directory
+
+    study = Study(t1=np.random.rand(10, 20, 30).astype(np.float32))
+
+    with Profiler() as profiler:
+        study = study.normalize().resize([16, 16, 16])
+
+        with trace("block"), temporary_directory() as tmpdir:
+            with open(os.path.join(tmpdir, "file.bin"), "wb") as f: f.write(b"0" * 1000)
+            run_subprocess([sys.executable, "-c", "pass"], check=True)
+
+    # not recorded outside of the profiler
+    study.normalize()
+
+    names = [r.name for r in profiler.records]
+    assert names.count("Study.normalize") == 1
+    assert "Study.apply" in names and "Study.resize" in names and "spatial.resize" in names
+
+    subprocess_record = [r for r in profiler.records if r.category == "subprocess"][0]
+    assert subprocess_record.subprocess_time > 0
+
+    summary = {s["name"]: s for s in profiler.summary()}
+    assert summary["Study.normalize"]["calls"] == 1
+    assert summary["Study.apply"]["calls"] == 2
+    assert summary["block"]["temp_bytes"] == 1000
+    assert 0 < summary["block"]["subprocess_time"] <= summary["block"]["wall_time"]
+
+    trace = profiler.to_chrome_trace()
+    assert len(trace["traceEvents"]) == len(profiler.records)
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in trace["traceEvents"])
+    assert len(profiler.to_records()) == len(profiler.records)
+
+
+def test_scratch_dir(tmp_path):
+    import os
+    from mrid.utils import get_scratch_dir, set_scratch_dir
+    from mrid.utils.tempfiles import temporary_directory
+
+    scratch = tmp_path / "scratch"
+    set_scratch_dir(scratch)
+    try:
+        assert get_scratch_dir() == str(scratch) and scratch.is_dir()
+        with temporary_directory() as tmpdir:
+            assert os.path.dirname(tmpdir) == str(scratch)
+        # explicit directory takes precedence
+        with temporary_directory(dir=tmp_path) as tmpdir:
+            assert os.path.dirname(tmpdir) == str(tmp_path)
+    finally:
+        set_scratch_dir(None)
+
+    assert get_scratch_dir() is None and len(os.listdir(scratch)) == 0
+
+
+def test_sitk_num_threads():
+    import threading
+    import SimpleITK as sitk
+    from mrid.utils.parallel import sitk_num_threads
+
+    default = sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+    entered, release = threading.Event(), threading.Event()
+
+    def worker():
+        with sitk_num_threads(3):
+            entered.set()
+            release.wait()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait()
+
+    # contexts that exit out of order restore the default only when the last one exits
+    with sitk_num_threads(2):
+        assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == 2
+        release.set()
+        thread.join()
+        assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == 2
+
+    assert sitk.ProcessObject.GetGlobalDefaultNumberOfThreads() == default